@@ -0,0 +1,35 @@
+"""add scheduler indexes
+
+Revision ID: 1f3c6e6f4d4b
+Revises: 6b2f0c8e4a91
+Create Date: 2016-01-27 16:05:44.102364
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1f3c6e6f4d4b'
+down_revision = '6b2f0c8e4a91'
+
+from alembic import op
+
+
+indexes = [
+    ('ix_task_run_project_id_user_id_task_id', 'task_run',
+     ['project_id', 'user_id', 'task_id']),
+    ('ix_task_run_project_id_user_ip', 'task_run', ['project_id', 'user_ip']),
+    ('ix_task_run_task_id', 'task_run', ['task_id']),
+    ('ix_task_run_user_id', 'task_run', ['user_id']),
+    ('ix_task_project_id_state_priority_0', 'task',
+     ['project_id', 'state', 'priority_0']),
+    ('ix_result_project_id_task_id', 'result', ['project_id', 'task_id']),
+]
+
+
+def upgrade():
+    for name, table, columns in indexes:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in indexes:
+        op.drop_index(name, table_name=table)
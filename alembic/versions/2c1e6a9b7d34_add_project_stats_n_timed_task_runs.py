@@ -0,0 +1,34 @@
+"""add project stats n_timed_task_runs
+
+Revision ID: 2c1e6a9b7d34
+Revises: 57d5e7c0a3f1
+Create Date: 2016-02-08 10:04:52.193847
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2c1e6a9b7d34'
+down_revision = '57d5e7c0a3f1'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('project_stats',
+                  sa.Column('n_timed_task_runs', sa.Integer, nullable=False,
+                            server_default='0'))
+    op.execute('''
+               UPDATE project_stats
+               SET n_timed_task_runs=task_runs.n_timed_task_runs
+               FROM (SELECT project_id, COUNT(
+                     to_timestamp(finish_time, 'YYYY-MM-DD-THH24-MI-SS.US') -
+                     to_timestamp(created, 'YYYY-MM-DD-THH24-MI-SS.US'))
+                     AS n_timed_task_runs
+                     FROM task_run GROUP BY project_id) AS task_runs
+               WHERE task_runs.project_id=project_stats.project_id
+               ''')
+
+
+def downgrade():
+    op.drop_column('project_stats', 'n_timed_task_runs')
@@ -0,0 +1,22 @@
+"""add task_run task_id finish_time index
+
+Revision ID: 4d7a9e2f5b10
+Revises: 2c1e6a9b7d34
+Create Date: 2016-02-09 16:27:11.402518
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4d7a9e2f5b10'
+down_revision = '2c1e6a9b7d34'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_task_run_task_id_finish_time', 'task_run',
+                    ['task_id', 'finish_time', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_task_run_task_id_finish_time', table_name='task_run')
@@ -0,0 +1,50 @@
+"""add contribution rollup table
+
+Revision ID: 57d5e7c0a3f1
+Revises: 1f3c6e6f4d4b
+Create Date: 2016-02-01 12:21:37.640173
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '57d5e7c0a3f1'
+down_revision = '1f3c6e6f4d4b'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'contribution_rollup',
+        sa.Column('project_id', sa.Integer,
+                  sa.ForeignKey('project.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('day', sa.Text, primary_key=True),
+        sa.Column('hour', sa.Integer, primary_key=True),
+        sa.Column('anonymous', sa.Boolean, primary_key=True),
+        sa.Column('n_task_runs', sa.Integer, nullable=False, default=0),
+        sa.Column('n_answered_tasks', sa.Integer, nullable=False, default=0)
+    )
+    op.execute('''
+               INSERT INTO contribution_rollup (project_id, day, hour,
+               anonymous, n_task_runs, n_answered_tasks)
+               SELECT project_id, day, hour, anonymous, COUNT(*),
+               SUM(CASE WHEN last = 1 THEN 1 ELSE 0 END)
+               FROM (SELECT project_id, LEFT(finish_time, 10) AS day,
+                     CAST(COALESCE(NULLIF(SUBSTRING(finish_time FROM 12 FOR 2),
+                                          ''), '0') AS INTEGER) AS hour,
+                     user_id IS NULL AS anonymous,
+                     ROW_NUMBER() OVER (PARTITION BY task_id
+                                        ORDER BY finish_time DESC, id DESC)
+                     AS last
+                     FROM task_run) AS task_runs
+               GROUP BY project_id, day, hour, anonymous
+               ''')
+    # Created again from the rollup by the dashboard job
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS dashboard_week_new_task_run')
+
+
+def downgrade():
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS dashboard_week_new_task_run')
+    op.drop_table('contribution_rollup')
@@ -0,0 +1,46 @@
+"""add timestamp indexes
+
+Revision ID: 6b2f0c8e4a91
+Revises: 88b4fb73f329
+Create Date: 2016-01-25 11:40:02.816250
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6b2f0c8e4a91'
+down_revision = '88b4fb73f329'
+
+from alembic import op
+
+
+indexes = [
+    ('ix_task_run_project_id_finish_time', 'task_run',
+     ['project_id', 'finish_time']),
+    ('ix_task_run_finish_time', 'task_run', ['finish_time']),
+    ('ix_task_created', 'task', ['created']),
+    ('ix_project_created', 'project', ['created']),
+    ('ix_user_created', 'user', ['created']),
+    ('ix_auditlog_created', 'auditlog', ['created']),
+]
+
+# The dashboard views filter by the timestamps, and are created again (with
+# queries using the indexes) by the dashboard jobs
+dashboard_views = [
+    'dashboard_week_users', 'dashboard_week_anon',
+    'dashboard_week_project_draft', 'dashboard_week_project_published',
+    'dashboard_week_project_update', 'dashboard_week_new_task',
+    'dashboard_week_new_task_run', 'dashboard_week_new_users',
+    'dashboard_week_returning_users',
+]
+
+
+def upgrade():
+    for name, table, columns in indexes:
+        op.create_index(name, table, columns)
+    for view in dashboard_views:
+        op.execute('DROP MATERIALIZED VIEW IF EXISTS %s' % view)
+
+
+def downgrade():
+    for name, table, columns in indexes:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,69 @@
+"""add project stats table
+
+Revision ID: 88b4fb73f329
+Revises: 4f12d8650050
+Create Date: 2016-01-18 10:12:31.508214
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '88b4fb73f329'
+down_revision = '4f12d8650050'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'project_stats',
+        sa.Column('project_id', sa.Integer,
+                  sa.ForeignKey('project.id', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('n_tasks', sa.Integer, nullable=False, default=0),
+        sa.Column('n_completed_tasks', sa.Integer, nullable=False, default=0),
+        sa.Column('n_answers', sa.Integer, nullable=False, default=0),
+        sa.Column('n_task_runs', sa.Integer, nullable=False, default=0),
+        sa.Column('n_results', sa.Integer, nullable=False, default=0),
+        sa.Column('last_activity', sa.Text),
+        sa.Column('contribution_time', sa.Float, nullable=False, default=0)
+    )
+    op.execute('''
+               INSERT INTO project_stats (project_id, n_tasks,
+               n_completed_tasks, n_answers, n_task_runs, n_results,
+               last_activity, contribution_time)
+               SELECT project.id, COALESCE(tasks.n_tasks, 0),
+               COALESCE(tasks.n_completed_tasks, 0),
+               COALESCE(tasks.n_answers, 0),
+               COALESCE(task_runs.n_task_runs, 0),
+               COALESCE(results.n_results, 0),
+               task_runs.last_activity,
+               COALESCE(task_runs.contribution_time, 0)
+               FROM project
+               LEFT OUTER JOIN
+               (SELECT project_id, COUNT(id) AS n_tasks,
+                SUM(CASE WHEN state='completed' THEN 1 ELSE 0 END)
+                AS n_completed_tasks,
+                SUM(n_answers) AS n_answers
+                FROM task GROUP BY project_id) AS tasks
+               ON tasks.project_id=project.id
+               LEFT OUTER JOIN
+               (SELECT project_id, COUNT(id) AS n_task_runs,
+                MAX(finish_time) AS last_activity,
+                EXTRACT(EPOCH FROM SUM(
+                to_timestamp(finish_time, 'YYYY-MM-DD-THH24-MI-SS.US') -
+                to_timestamp(created, 'YYYY-MM-DD-THH24-MI-SS.US')))
+                AS contribution_time
+                FROM task_run GROUP BY project_id) AS task_runs
+               ON task_runs.project_id=project.id
+               LEFT OUTER JOIN
+               (SELECT project_id, COUNT(id) AS n_results FROM result
+                WHERE info IS NOT NULL AND cast(info AS TEXT) != 'null'
+                AND cast(info AS TEXT) != ''
+                GROUP BY project_id) AS results
+               ON results.project_id=project.id
+               ''')
+
+
+def downgrade():
+    op.drop_table('project_stats')
@@ -375,7 +375,9 @@ def resize_project_avatars():
         import time
         import pybossa.cache.projects as cached_apps
         # Disable cache to update the data in it :-)
-        os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '1'
+        from pybossa import cache
+        from pybossa.cache.backends import WriteOnlyBackend
+        cache.backend = WriteOnlyBackend(cache.backend)
         pyrax.set_setting("identity_type", "rackspace")
         pyrax.set_credentials(username=app.config['RACKSPACE_USERNAME'],
                               api_key=app.config['RACKSPACE_API_KEY'],
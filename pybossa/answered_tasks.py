@@ -0,0 +1,162 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Per project and user bitmaps of the tasks a user has already answered.
+
+Every bit of a bitmap stands for a task of the project, at the offset
+task.id - base, where base is the lowest task id of the project when the
+bitmaps were created (task ids only grow, so every task of the project fits).
+Bumping the generation of a project makes all its bitmaps stale at once.
+
+Reading and setting bits are Lua scripts, so the base, the generation and
+the bitmap are read in a single round trip, bit by bit (a bitmap can be
+large, as task ids are global).
+"""
+
+
+class AnsweredTasks(object):
+
+    KEY_PREFIX = 'pybossa:answered_tasks:project:%s:%s:user:%s'
+    LOADED_KEY_PREFIX = 'pybossa:answered_tasks:project:%s:%s:user:%s:loaded'
+    BASE_KEY_PREFIX = 'pybossa:answered_tasks:project:%s:base'
+    GENERATION_KEY_PREFIX = 'pybossa:answered_tasks:project:%s:generation'
+    BITMAP_TTL = 60 * 60
+    # KEYS: base and generation keys. ARGV: the bitmap key before and after
+    # the generation, and the task ids. Return the answered task ids, or
+    # nil if the bitmap of the user is not loaded.
+    ANSWERED_SCRIPT = """
+        local base = redis.call('GET', KEYS[1])
+        local generation = redis.call('GET', KEYS[2]) or '0'
+        local key = ARGV[1] .. generation .. ARGV[2]
+        if not base or redis.call('EXISTS', key .. ':loaded') == 0 then
+            return false
+        end
+        local answered = {}
+        for i = 3, #ARGV do
+            local offset = tonumber(ARGV[i]) - tonumber(base)
+            if offset >= 0 and redis.call('GETBIT', key, offset) == 1 then
+                answered[#answered + 1] = ARGV[i]
+            end
+        end
+        return answered
+        """
+    # KEYS: base and generation keys. ARGV: the bitmap key before and after
+    # the generation, the task id, the bit value and the bitmap TTL.
+    SET_SCRIPT = """
+        local base = redis.call('GET', KEYS[1])
+        if not base then
+            return 0
+        end
+        local generation = redis.call('GET', KEYS[2]) or '0'
+        local key = ARGV[1] .. generation .. ARGV[2]
+        local offset = tonumber(ARGV[3]) - tonumber(base)
+        if offset < 0 then
+            return 0
+        end
+        redis.call('SETBIT', key, offset, ARGV[4])
+        redis.call('EXPIRE', key, ARGV[5])
+        return 1
+        """
+
+    def __init__(self, redis_conn):
+        self.conn = redis_conn
+        self._answered = self.conn.register_script(self.ANSWERED_SCRIPT)
+        self._set_bit = self.conn.register_script(self.SET_SCRIPT)
+
+    def base(self, project_id):
+        base = self.conn.get(self.BASE_KEY_PREFIX % project_id)
+        if base is not None:
+            return int(base)
+        return None
+
+    def set_base(self, project_id, task_id):
+        """Set the base of the bitmaps of a project unless it is already set,
+        and return the base in use."""
+        self.conn.setnx(self.BASE_KEY_PREFIX % project_id, task_id)
+        return self.base(project_id)
+
+    def is_loaded(self, project_id, user):
+        return self.conn.exists(self._loaded_key(project_id, user))
+
+    def load(self, project_id, user, task_ids):
+        """Replace the bitmap of a user with the given answered task ids."""
+        base = self.base(project_id)
+        key = self._key(project_id, user)
+        pipeline = self.conn.pipeline()
+        pipeline.delete(key)
+        for task_id in task_ids:
+            pipeline.setbit(key, task_id - base, 1)
+        pipeline.expire(key, self.BITMAP_TTL)
+        pipeline.setex('%s:loaded' % key, self.BITMAP_TTL, 1)
+        pipeline.execute()
+
+    def add(self, project_id, user, task_id):
+        """Mark a task as answered by the user."""
+        self._set(project_id, user, task_id, 1)
+
+    def remove(self, project_id, user, task_id):
+        """Mark a task as not answered by the user."""
+        self._set(project_id, user, task_id, 0)
+
+    def reset(self, project_id):
+        """Drop the bitmaps of every user of a project."""
+        pipeline = self.conn.pipeline()
+        pipeline.incr(self.GENERATION_KEY_PREFIX % project_id)
+        pipeline.delete(self.BASE_KEY_PREFIX % project_id)
+        pipeline.execute()
+
+    def exclude(self, project_id, user, task_ids):
+        """Return the given task ids without the ones answered by the user,
+        or None if the bitmap of the user is not loaded."""
+        answered = self._answered(keys=self._project_keys(project_id),
+                                  args=self._key_parts(project_id, user) +
+                                  list(task_ids))
+        if answered is None:
+            return None
+        answered = set(int(task_id) for task_id in answered)
+        return [task_id for task_id in task_ids if task_id not in answered]
+
+    def _set(self, project_id, user, task_id, value):
+        self._set_bit(keys=self._project_keys(project_id),
+                      args=self._key_parts(project_id, user) +
+                      [task_id, value, self.BITMAP_TTL])
+
+    def _project_keys(self, project_id):
+        return [self.BASE_KEY_PREFIX % project_id,
+                self.GENERATION_KEY_PREFIX % project_id]
+
+    def _key_parts(self, project_id, user):
+        """Return the bitmap key of the user before and after the
+        generation."""
+        key = self.KEY_PREFIX % (project_id, '', self._member(user))
+        prefix, _, suffix = key.partition('::')
+        return [prefix + ':', ':' + suffix]
+
+    def _generation(self, project_id):
+        return int(self.conn.get(self.GENERATION_KEY_PREFIX % project_id) or 0)
+
+    def _key(self, project_id, user):
+        return self.KEY_PREFIX % (project_id, self._generation(project_id),
+                                  self._member(user))
+
+    def _loaded_key(self, project_id, user):
+        return self.LOADED_KEY_PREFIX % (project_id,
+                                         self._generation(project_id),
+                                         self._member(user))
+
+    def _member(self, user):
+        return str(user['user_id'] or user['user_ip'])
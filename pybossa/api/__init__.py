@@ -31,8 +31,9 @@ This package adds GET, POST, PUT and DELETE methods for:
 
 import json
 from flask import Blueprint, request, abort, Response, make_response
+from flask import current_app
 from flask.ext.login import current_user
-from werkzeug.exceptions import NotFound
+from werkzeug.exceptions import NotFound, ServiceUnavailable, BadRequest
 from pybossa.util import jsonpify, crossdomain, get_user_id_or_ip
 import pybossa.model as model
 from pybossa.core import csrf, ratelimits, sentinel
@@ -51,10 +52,19 @@ from user import UserAPI
 from token import TokenAPI
 from result import ResultAPI
 from pybossa.core import project_repo, task_repo
-from pybossa.contributions_guard import ContributionsGuard
+from pybossa.contributions_guard import ContributionsGuard, TaskLeases
 
 blueprint = Blueprint('api', __name__)
 
+# Times the scheduler is asked again when another volunteer took the last
+# lease of the chosen task in the meantime
+LEASE_RETRIES = 3
+LEASES_TAKEN = ('The tasks available to you are being answered by other '
+                'volunteers, please try again')
+
+# Max number of tasks a client can prefetch with a single newtasks request
+MAX_NEW_TASKS = 20
+
 cors_headers = ['Content-Type', 'Authorization']
 
 error = ErrorStatus()
@@ -112,17 +122,81 @@ def new_task(project_id):
         task = _retrieve_new_task(project_id)
         # If there is a task for the user, return it
         if task is not None:
-            guard = ContributionsGuard(sentinel.master)
-            guard.stamp(task, get_user_id_or_ip())
             response = make_response(json.dumps(task.dictize()))
             response.mimetype = "application/json"
+            # The error placeholder task does not belong to any project
+            if task.project_id is not None:
+                guard = ContributionsGuard(sentinel.master)
+                guard.stamp(task, get_user_id_or_ip())
+                _add_cursor_header(response, task)
             return response
         return Response(json.dumps({}), mimetype="application/json")
     except Exception as e:
         return error.format_exception(e, target='project', action='GET')
 
 
+@jsonpify
+@blueprint.route('/app/<project_id>/newtasks')
+@blueprint.route('/project/<project_id>/newtasks')
+@crossdomain(origin='*', headers=cors_headers)
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def new_tasks(project_id):
+    """Return a list of up to limit new tasks for a project."""
+    try:
+        tasks = _retrieve_new_tasks(project_id)
+        if tasks and tasks[0].project_id is not None:
+            guard = ContributionsGuard(sentinel.master)
+            guard.stamp_many(tasks, get_user_id_or_ip())
+        data = [task.dictize() for task in tasks]
+        response = Response(json.dumps(data), mimetype="application/json")
+        if tasks and tasks[0].project_id is not None:
+            _add_cursor_header(response, tasks[-1])
+        return response
+    except Exception as e:
+        return error.format_exception(e, target='project', action='GET')
+
+
 def _retrieve_new_task(project_id):
+    project = _get_contributable_project(project_id)
+    if isinstance(project, model.task.Task):
+        return project
+    offset = _get_offset()
+    user_id = None if current_user.is_anonymous() else current_user.id
+    user_ip = request.remote_addr if current_user.is_anonymous() else None
+    # The scheduler skips the tasks fully leased to others, so every attempt
+    # gets a task other than the ones whose last lease was just taken
+    for attempt in range(LEASE_RETRIES):
+        task = sched.new_task(project_id, project.info.get('sched'),
+                              user_id,
+                              user_ip,
+                              offset,
+                              request.args.get('cursor'))
+        if task is None or _lease_task(task):
+            return task
+    # There are tasks left, so do not answer that the project is finished
+    raise ServiceUnavailable(LEASES_TAKEN)
+
+
+def _retrieve_new_tasks(project_id):
+    project = _get_contributable_project(project_id)
+    if isinstance(project, model.task.Task):
+        return [project]
+    offset = _get_offset()
+    limit = max(1, min(_get_int_arg('limit', 1), MAX_NEW_TASKS))
+    user_id = None if current_user.is_anonymous() else current_user.id
+    user_ip = request.remote_addr if current_user.is_anonymous() else None
+    tasks = sched.new_tasks(project_id, project.info.get('sched'),
+                            user_id, user_ip, offset, limit,
+                            request.args.get('cursor'))
+    leased_tasks = _lease_tasks(tasks)
+    if tasks and not leased_tasks:
+        raise ServiceUnavailable(LEASES_TAKEN)
+    return leased_tasks
+
+
+def _get_contributable_project(project_id):
+    """Return the project, or a task with an error message if the current
+    user cannot contribute to it."""
     project = project_repo.get(project_id)
     if project is None:
         raise NotFound
@@ -131,17 +205,59 @@ def _retrieve_new_task(project_id):
             error="This project does not allow anonymous contributors")
         error = model.task.Task(info=info)
         return error
-    if request.args.get('offset'):
-        offset = int(request.args.get('offset'))
-    else:
-        offset = 0
-    user_id = None if current_user.is_anonymous() else current_user.id
-    user_ip = request.remote_addr if current_user.is_anonymous() else None
-    task = sched.new_task(project_id, project.info.get('sched'),
-                          user_id,
-                          user_ip,
-                          offset)
-    return task
+    return project
+
+
+def _add_cursor_header(response, task):
+    """Let the client resume the scheduler after the task with ?cursor="""
+    project = project_repo.get(task.project_id)
+    cursor = sched.task_cursor(project.info.get('sched'), task)
+    if cursor is not None:
+        response.headers['X-Cursor'] = cursor
+
+
+def _get_offset():
+    return _get_int_arg('offset', 0)
+
+
+def _get_int_arg(name, default):
+    """Return a non negative integer query argument, raising BadRequest if
+    it is not one."""
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest('%s must be an integer' % name)
+    if value < 0:
+        raise BadRequest('%s must not be negative' % name)
+    return value
+
+
+def _lease_task(task):
+    """Reserve for the current user one of the answers the task needs."""
+    if not current_app.config.get('SCHED_TASK_LEASES'):
+        return True
+    n_answers_left = (task.n_answers -
+                      task_repo.count_task_runs_with(task_id=task.id))
+    leases = TaskLeases(sentinel.master,
+                        current_app.config.get('TASK_LEASE_TIMEOUT'))
+    return leases.acquire(task.id, get_user_id_or_ip(), n_answers_left)
+
+
+def _lease_tasks(tasks):
+    """Reserve for the current user an answer of every task, dropping the
+    tasks that other volunteers leased in the meantime."""
+    if not current_app.config.get('SCHED_TASK_LEASES') or not tasks:
+        return tasks
+    task_ids = [task.id for task in tasks]
+    n_answers_left = sched.n_answers_left(task_ids)
+    leases = TaskLeases(sentinel.master,
+                        current_app.config.get('TASK_LEASE_TIMEOUT'))
+    leased = set(leases.acquire_many(task_ids, get_user_id_or_ip(),
+                                     n_answers_left))
+    return [task for task in tasks if task.id in leased]
 
 
 @jsonpify
@@ -24,28 +24,105 @@ It exports:
     * memoize: for caching functions using its arguments as part of the key
     * delete_cached: to remove a cached value
     * delete_memoized: to remove a cached value from the memoize decorator
+    * delete_namespace: to remove the memoized values of a namespace
+    * memoize_many: to get the memoized values of many calls at once
+    * counter: for caching counters that are updated in place
+    * counter_many: to get the cached counters of many calls at once
+    * incr_counter, set_counter and delete_counter: to update a cached
+      counter
+
+With a soft_timeout, values are recomputed after soft_timeout seconds by
+one caller only (the one taking a short lock), while the others keep getting
+the stale value until timeout.
+
+The keys of memoized values include the generation of the function (and of
+its namespace, if any). Deleting all the values of a function or namespace
+just increments its generation, and the old values expire on their own.
+
+Counters (e.g. the number of tasks of a project) are stored as plain
+strings, without generations, so incr_counter and set_counter can update
+them in place while they are cached. Missing counters are computed again.
+
+Values are serialized with the CACHE_CODEC codec (see
+pybossa.cache.serializers), whose name is part of the keys.
+
+If CACHE_METRICS is set, the hits, misses, recompute time and size of every
+function (or key_prefix) are counted (see pybossa.cache.metrics).
+
+Values are stored in the CACHE_BACKEND backend, chosen by init_app (see
+pybossa.cache.backends). With the redis backend, if LOCAL_CACHE_SIZE is set,
+every process keeps that many cached values in memory for LOCAL_CACHE_TIMEOUT
+seconds (see pybossa.cache.local).
 
 """
-import os
+import time
 import hashlib
 from functools import wraps
+from redis import StrictRedis
 from pybossa.core import sentinel
-
-try:
-    import cPickle as pickle
-except ImportError:  # pragma: no cover
-    import pickle
+from pybossa.cache.backends import RedisBackend, MemoryBackend, NullBackend
+from pybossa.cache.local import LocalCache, Invalidator, TwoTierBackend
+from pybossa.cache.serializers import get_codecs
+from pybossa.cache.metrics import CacheMetrics
 
 try:
     import settings_local as settings
 except ImportError:  # pragma: no cover
     import pybossa.default_settings as settings
-    os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '1'
 
 ONE_DAY = 24 * 60 * 60
 ONE_HOUR = 60 * 60
 HALF_HOUR = 30 * 60
 FIVE_MINUTES = 5 * 60
+LOCK_TIMEOUT = 60
+
+# The codec is chosen by init_app
+codecs = get_codecs()
+codec = codecs['pickle']
+
+# Set by init_app if CACHE_METRICS is enabled
+metrics = None
+
+# Nothing is cached until init_app is called
+backend = NullBackend()
+
+
+def init_app(app):
+    """Set the cache backend of the app: CACHE_BACKEND is redis, memory or
+    null (nothing is cached). Values are serialized with CACHE_CODEC, and
+    counted if CACHE_METRICS is set."""
+    global backend, codecs, codec, metrics
+    codecs = get_codecs(app.config.get('CACHE_COMPRESS_THRESHOLD', 1024))
+    codec_name = app.config.get('CACHE_CODEC', 'pickle')
+    if codec_name not in codecs:
+        raise ValueError('Unknown CACHE_CODEC: %s' % codec_name)
+    codec = codecs[codec_name]
+    metrics = None
+    if app.config.get('CACHE_METRICS'):
+        metrics = CacheMetrics(app.config.get('CACHE_METRICS_FLUSH_INTERVAL',
+                                              60))
+    backend_name = app.config.get('CACHE_BACKEND', 'redis')
+    if backend_name == 'redis':
+        backend = RedisBackend(sentinel)
+        if app.config.get('LOCAL_CACHE_SIZE'):
+            local_cache = LocalCache(app.config['LOCAL_CACHE_SIZE'],
+                                     app.config.get('LOCAL_CACHE_TIMEOUT', 30))
+            invalidator = Invalidator(local_cache, '%s:invalidate' %
+                                      settings.REDIS_KEYPREFIX)
+            backend = TwoTierBackend(backend, local_cache, invalidator,
+                                     sentinel, _pubsub_connection)
+    elif backend_name == 'memory':
+        backend = MemoryBackend(app.config.get('CACHE_MEMORY_SIZE', 10000))
+    elif backend_name == 'null':
+        backend = NullBackend()
+    else:
+        raise ValueError('Unknown CACHE_BACKEND: %s' % backend_name)
+
+
+def _pubsub_connection():
+    """Return a connection to the Redis master that can block listening."""
+    host, port = sentinel.connection.discover_master(settings.REDIS_MASTER)
+    return StrictRedis(host=host, port=port)
 
 
 def get_key_to_hash(*args, **kwargs):
@@ -67,10 +144,148 @@ def get_hash_key(prefix, key_to_hash):
     return key
 
 
-def cache(key_prefix, timeout=300):
+def get_generations(keys):
+    """Return a dict with the current generation of the given generation
+    keys, read at once."""
+    generations = dict((key, '0') for key in keys)
+    for key, generation in zip(keys, backend.get_counters(keys)):
+        if generation:
+            generations[key] = generation
+    return generations
+
+
+def incr_generation(key):
+    """Increment a generation key, so the keys of the previous generation
+    are not used anymore."""
+    backend.incr(key)
+
+
+def function_generation_key(function):
+    return "%s:%s_generation" % (settings.REDIS_KEYPREFIX, function.__name__)
+
+
+def namespace_generation_key(namespace):
+    return "%s:namespace:%s_generation" % (settings.REDIS_KEYPREFIX, namespace)
+
+
+def generation_keys(function, namespace, *args, **kwargs):
+    """Return the generation keys of a call to a memoized function."""
+    keys = [function_generation_key(function)]
+    if namespace is not None:
+        keys.append(namespace_generation_key(namespace(*args, **kwargs)))
+    return keys
+
+
+def cache_key(key_prefix, codec_name=None):
+    """Return the key of a function cached with the cache decorator."""
+    return "%s::%s:%s" % (settings.REDIS_KEYPREFIX, key_prefix,
+                          codec_name or codec.name)
+
+
+def get_memoized(function, namespace, *args, **kwargs):
+    """Return the key of a call to a memoized function and its cached
+    value, read together with the generations of the key."""
+    keys = generation_keys(function, namespace, *args, **kwargs)
+    prefix, suffix = _memoize_key_parts(function, codec.name, *args, **kwargs)
+    generations, output = backend.get_generational(keys, prefix, suffix)
+    return prefix + '.'.join(generations) + suffix, output
+
+
+def _memoize_key(function, generations, codec_name, *args, **kwargs):
+    prefix, suffix = _memoize_key_parts(function, codec_name, *args, **kwargs)
+    return prefix + '.'.join(generations) + suffix
+
+
+def _memoize_key_parts(function, codec_name, *args, **kwargs):
+    """Return the key of a call to a memoized function before and after
+    its generations."""
+    prefix = "%s:%s_args:%s:" % (settings.REDIS_KEYPREFIX, function.__name__,
+                                 codec_name)
+    key_to_hash = get_key_to_hash(*args, **kwargs)
+    return prefix, get_hash_key('', key_to_hash)
+
+
+def counter_key(function, *args):
+    """Return the key of a call to a counter function."""
+    return "%s:%s_counter:%s" % (settings.REDIS_KEYPREFIX, function.__name__,
+                                 ':'.join(str(arg) for arg in args))
+
+
+def dumps(output, soft_timeout=None):
+    """Serialize a value to cache, with the time it has to be recomputed
+    if there is a soft_timeout."""
+    if soft_timeout is None:
+        return codec.dumps(output)
+    return codec.dumps((output, time.time() + soft_timeout))
+
+
+def record_hits(name, n=1):
+    """Count cache hits of a function (if metrics are enabled)."""
+    if metrics is not None:
+        metrics.hit(name, n)
+        if metrics.should_flush():
+            metrics.flush(sentinel.master)
+
+
+def record_misses(name, compute_time, size, n=1):
+    """Count cache misses of a function (if metrics are enabled)."""
+    if metrics is not None:
+        metrics.miss(name, compute_time, size, n)
+        if metrics.should_flush():
+            metrics.flush(sentinel.master)
+
+
+def get_or_compute(name, key, timeout, soft_timeout, f, *args, **kwargs):
+    """Return the cached value of a key, or call f and cache its value."""
+    return _get_or_compute(name, key, backend.get(key), timeout, soft_timeout,
+                           f, *args, **kwargs)
+
+
+def _get_or_compute(name, key, output, timeout, soft_timeout, f, *args,
+                    **kwargs):
+    """Return the cached output of a key, or call f and cache its value."""
+    if output:
+        if soft_timeout is None:
+            record_hits(name)
+            return codec.loads(output)
+        output, refresh_at = codec.loads(output)
+        if refresh_at > time.time() or not acquire_lock(key):
+            record_hits(name)
+            return output
+        try:
+            return compute(name, key, timeout, soft_timeout, f,
+                           *args, **kwargs)
+        finally:
+            release_lock(key)
+    return compute(name, key, timeout, soft_timeout, f, *args, **kwargs)
+
+
+def compute(name, key, timeout, soft_timeout, f, *args, **kwargs):
+    start = time.time()
+    output = f(*args, **kwargs)
+    data = dumps(output, soft_timeout)
+    backend.set(key, data, timeout)
+    record_misses(name, time.time() - start, len(data))
+    return output
+
+
+def acquire_lock(key):
+    """Take the lock to recompute the value of a key, returning False if
+    another caller holds it."""
+    return backend.add('%s:lock' % key, 1, LOCK_TIMEOUT)
+
+
+def release_lock(key):
+    backend.delete(['%s:lock' % key])
+
+
+def cache(key_prefix, timeout=300, soft_timeout=None):
     """
     Decorator for caching functions.
 
+    After soft_timeout seconds (if given) the value is recomputed by a single
+    caller, while the rest get the stale value.
+
     Returns the function value from cache, or the function if cache disabled
 
     """
@@ -79,25 +294,24 @@ def cache(key_prefix, timeout=300):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            key = "%s::%s" % (settings.REDIS_KEYPREFIX, key_prefix)
-            if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
-                output = sentinel.slave.get(key)
-                if output:
-                    return pickle.loads(output)
-                output = f(*args, **kwargs)
-                sentinel.master.setex(key, timeout, pickle.dumps(output))
-                return output
-            output = f(*args, **kwargs)
-            sentinel.master.setex(key, timeout, pickle.dumps(output))
-            return output
+            key = cache_key(key_prefix)
+            return get_or_compute(key_prefix, key, timeout, soft_timeout, f,
+                                  *args, **kwargs)
         return wrapper
     return decorator
 
 
-def memoize(timeout=300):
+def memoize(timeout=300, namespace=None, soft_timeout=None, batch=None):
     """
     Decorator for caching functions using its arguments as part of the key.
 
+    namespace is an optional function that, called with the same arguments,
+    returns the namespace of the call, so all the values of a namespace
+    (e.g. of a project) can be deleted with delete_namespace.
+    soft_timeout works as in the cache decorator.
+    batch is an optional function used by memoize_many, that gets a list of
+    argument tuples and returns the values of the calls in the same order.
+
     Returns the cached value, or the function if the cache is disabled
 
     """
@@ -106,23 +320,152 @@ def memoize(timeout=300):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            key = "%s:%s_args:" % (settings.REDIS_KEYPREFIX, f.__name__)
-            key_to_hash = get_key_to_hash(*args, **kwargs)
-            key = get_hash_key(key, key_to_hash)
-            if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
-                output = sentinel.slave.get(key)
-                if output:
-                    return pickle.loads(output)
-                output = f(*args, **kwargs)
-                sentinel.master.setex(key, timeout, pickle.dumps(output))
-                return output
-            output = f(*args, **kwargs)
-            sentinel.master.setex(key, timeout, pickle.dumps(output))
-            return output
+            key, output = get_memoized(f, namespace, *args, **kwargs)
+            return _get_or_compute(f.__name__, key, output, timeout,
+                                   soft_timeout, f, *args, **kwargs)
+        wrapper.namespace = namespace
+        wrapper.timeout = timeout
+        wrapper.soft_timeout = soft_timeout
+        wrapper.batch = batch
+        wrapper.uncached = f
+        return wrapper
+    return decorator
+
+
+def counter(timeout=300, batch=None, type=int):
+    """
+    Decorator for caching counters using the arguments as part of the key.
+
+    The function has to return a value of type (or None), which is stored as
+    a string. batch works as in the memoize decorator.
+
+    Returns the cached value, or the function if the cache is disabled
+
+    """
+    if timeout is None:
+        timeout = 300
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args):
+            return counter_many(wrapper, [args])[0]
+        wrapper.timeout = timeout
+        wrapper.batch = batch
+        wrapper.type = type
+        wrapper.uncached = f
         return wrapper
     return decorator
 
 
+def counter_many(function, args_list):
+    """Return the values of a counter function for a list of argument tuples,
+    reading the cached ones at once (see memoize_many)."""
+    args_list = [tuple(args) for args in args_list]
+    if not args_list:
+        return []
+    keys = [counter_key(function, *args) for args in args_list]
+    outputs = backend.get_many(keys)
+    values = [None] * len(args_list)
+    misses = []
+    for i, output in enumerate(outputs):
+        if output is not None:
+            values[i] = function.type(output) if output != '' else None
+        else:
+            misses.append(i)
+    name = function.uncached.__name__
+    if len(misses) < len(args_list):
+        record_hits(name, len(args_list) - len(misses))
+    if misses:
+        start = time.time()
+        computed = _compute_many(function, [args_list[i] for i in misses])
+        items = []
+        for i, value in zip(misses, computed):
+            values[i] = value
+            items.append((keys[i], _dump_counter(value)))
+        backend.set_many(items, function.timeout)
+        record_misses(name, time.time() - start,
+                      sum(len(data) for key, data in items), len(misses))
+    return values
+
+
+def _dump_counter(value):
+    if value is None:
+        return ''
+    return str(value)
+
+
+def incr_counter(function, amount, *args):
+    """Add amount to a counter, if it is cached."""
+    backend.incr_existing(counter_key(function, *args), amount)
+
+
+def set_counter(function, value, *args):
+    """Set the value of a counter, if it is cached."""
+    backend.set_existing(counter_key(function, *args), _dump_counter(value),
+                         function.timeout)
+
+
+def delete_counter(function, *args):
+    """
+    Delete a cached counter.
+
+    Returns True if success or no cache is enabled
+
+    """
+    return backend.delete([counter_key(function, *args)])
+
+
+def memoize_many(function, args_list):
+    """
+    Return the values of a memoized function for a list of argument tuples.
+
+    The cached values are read at once, and the missing ones are computed
+    with the batch function of the memoized function (or calling it for
+    each of them if it has none) and stored with a single pipeline. Values
+    past their soft timeout are returned as they are.
+
+    """
+    args_list = [tuple(args) for args in args_list]
+    if not args_list:
+        return []
+    f = function.uncached
+    keys_list = [generation_keys(f, function.namespace, *args)
+                 for args in args_list]
+    generations = get_generations(sorted(set(key for keys in keys_list
+                                              for key in keys)))
+    keys = [_memoize_key(f, [generations[key] for key in call_keys],
+                         codec.name, *args)
+            for call_keys, args in zip(keys_list, args_list)]
+    outputs = backend.get_many(keys)
+    values = [None] * len(args_list)
+    misses = []
+    for i, output in enumerate(outputs):
+        if output:
+            values[i] = codec.loads(output)
+            if function.soft_timeout is not None:
+                values[i] = values[i][0]
+        else:
+            misses.append(i)
+    if len(misses) < len(args_list):
+        record_hits(f.__name__, len(args_list) - len(misses))
+    if misses:
+        start = time.time()
+        computed = _compute_many(function, [args_list[i] for i in misses])
+        items = []
+        for i, value in zip(misses, computed):
+            values[i] = value
+            items.append((keys[i], dumps(value, function.soft_timeout)))
+        backend.set_many(items, function.timeout)
+        record_misses(f.__name__, time.time() - start,
+                      sum(len(data) for key, data in items), len(misses))
+    return values
+
+
+def _compute_many(function, args_list):
+    if function.batch is not None:
+        return function.batch(args_list)
+    return [function.uncached(*args) for args in args_list]
+
+
 def delete_cached(key):
     """
     Delete a cached value from the cache.
@@ -130,10 +473,8 @@ def delete_cached(key):
     Returns True if success or no cache is enabled
 
     """
-    if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
-        key = "%s::%s" % (settings.REDIS_KEYPREFIX, key)
-        return bool(sentinel.master.delete(key))
-    return True
+    return backend.delete([cache_key(key, codec_name)
+                           for codec_name in codecs])
 
 
 def delete_memoized(function, *args, **kwargs):
@@ -143,14 +484,24 @@ def delete_memoized(function, *args, **kwargs):
     Returns True if success or no cache is enabled
 
     """
-    if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
-        key = "%s:%s_args:" % (settings.REDIS_KEYPREFIX, function.__name__)
-        if args or kwargs:
-            key_to_hash = get_key_to_hash(*args, **kwargs)
-            key = get_hash_key(key, key_to_hash)
-            return bool(sentinel.master.delete(key))
-        keys_to_delete = sentinel.slave.keys(pattern=key + '*')
-        if not keys_to_delete:
-            return False
-        return bool(sentinel.master.delete(*keys_to_delete))
+    if args or kwargs:
+        namespace = getattr(function, 'namespace', None)
+        keys = generation_keys(function, namespace, *args, **kwargs)
+        generations = get_generations(keys)
+        generations = [generations[key] for key in keys]
+        return backend.delete([_memoize_key(function, generations, codec_name,
+                                            *args, **kwargs)
+                               for codec_name in codecs])
+    incr_generation(function_generation_key(function))
+    return True
+
+
+def delete_namespace(namespace):
+    """
+    Delete the memoized values of every function in a namespace.
+
+    Returns True
+
+    """
+    incr_generation(namespace_generation_key(namespace))
     return True
@@ -0,0 +1,255 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Storage backends of the cache.
+
+    * RedisBackend: the Redis master (writes) and slaves (reads)
+    * MemoryBackend: a dict in the memory of the process, for single node
+      installs and tests
+    * NullBackend: nothing is stored, every value is computed
+    * WriteOnlyBackend: values are always computed and written to another
+      backend, to refresh it
+
+The backend is chosen once, by pybossa.cache.init_app.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class RedisBackend(object):
+
+    INCR_EXISTING_SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 1 then
+            return redis.call('INCRBY', KEYS[1], ARGV[1])
+        end
+        """
+    # KEYS: generation keys. ARGV: the key of the value before and after
+    # its generations. Return the generations followed by the value.
+    GET_GENERATIONAL_SCRIPT = """
+        local generations = {}
+        for i, key in ipairs(KEYS) do
+            generations[i] = redis.call('GET', key) or '0'
+        end
+        local key = ARGV[1] .. table.concat(generations, '.') .. ARGV[2]
+        generations[#generations + 1] = redis.call('GET', key)
+        return generations
+        """
+
+    def __init__(self, sentinel):
+        self.sentinel = sentinel
+
+    def get(self, key):
+        return self.sentinel.slave.get(key)
+
+    def get_many(self, keys):
+        return self.sentinel.slave.mget(keys)
+
+    def set(self, key, value, timeout):
+        self.sentinel.master.setex(key, timeout, value)
+
+    def set_many(self, items, timeout):
+        pipeline = self.sentinel.master.pipeline()
+        for key, value in items:
+            pipeline.setex(key, timeout, value)
+        pipeline.execute()
+
+    def add(self, key, value, timeout):
+        """Set a key only if it does not exist, returning True if set."""
+        return bool(self.sentinel.master.set(key, value, nx=True,
+                                             ex=timeout))
+
+    def incr(self, key):
+        self.sentinel.master.incr(key)
+
+    def incr_existing(self, key, amount=1):
+        """Increment a key by amount, only if it exists (keeping its TTL)."""
+        self.sentinel.master.eval(self.INCR_EXISTING_SCRIPT, 1, key, amount)
+
+    def set_existing(self, key, value, timeout):
+        """Set a key only if it exists."""
+        self.sentinel.master.set(key, value, xx=True, ex=timeout)
+
+    def get_counters(self, keys):
+        """Return the values of keys incremented with incr."""
+        return self.sentinel.slave.mget(keys)
+
+    def get_generational(self, generation_keys, prefix, suffix):
+        """Return the current generations of generation_keys and the value
+        of the key made of prefix, the generations joined by dots and
+        suffix, read in a single round trip."""
+        args = list(generation_keys) + [prefix, suffix]
+        result = self.sentinel.slave.eval(self.GET_GENERATIONAL_SCRIPT,
+                                          len(generation_keys), *args)
+        return result[:-1], result[-1]
+
+    def delete(self, keys):
+        """Delete a list of keys, returning True if any of them existed."""
+        return bool(self.sentinel.master.delete(*keys))
+
+
+class MemoryBackend(object):
+
+    """Keep up to max_size values in a dict, dropping the least recently
+    used ones first."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                return None
+            self._entries[key] = entry
+            return value
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, timeout):
+        self._set(key, value, time.time() + timeout)
+
+    def set_many(self, items, timeout):
+        for key, value in items:
+            self.set(key, value, timeout)
+
+    def add(self, key, value, timeout):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or
+                                      entry[1] >= time.time()):
+                return False
+        self.set(key, value, timeout)
+        return True
+
+    def incr(self, key):
+        with self._lock:
+            value, expires = self._entries.pop(key, ('0', None))
+            self._entries[key] = (str(int(value) + 1), expires)
+
+    def incr_existing(self, key, amount=1):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (str(int(entry[0]) + amount), entry[1])
+
+    def set_existing(self, key, value, timeout):
+        if self.get(key) is not None:
+            self.set(key, value, timeout)
+
+    def get_counters(self, keys):
+        return self.get_many(keys)
+
+    def get_generational(self, generation_keys, prefix, suffix):
+        return get_generational(self, generation_keys, prefix, suffix)
+
+    def delete(self, keys):
+        with self._lock:
+            deleted = [self._entries.pop(key, None) for key in keys]
+        return any(entry is not None for entry in deleted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _set(self, key, value, expires):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class NullBackend(object):
+
+    def get(self, key):
+        return None
+
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def set(self, key, value, timeout):
+        pass
+
+    def set_many(self, items, timeout):
+        pass
+
+    def add(self, key, value, timeout):
+        return True
+
+    def incr(self, key):
+        pass
+
+    def incr_existing(self, key, amount=1):
+        pass
+
+    def set_existing(self, key, value, timeout):
+        pass
+
+    def get_counters(self, keys):
+        return [None] * len(keys)
+
+    def get_generational(self, generation_keys, prefix, suffix):
+        return get_generational(self, generation_keys, prefix, suffix)
+
+    def delete(self, keys):
+        # Nothing is cached, so nothing is left to delete
+        return True
+
+
+class WriteOnlyBackend(NullBackend):
+
+    """Do not read the cached values, but write them to backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def set(self, key, value, timeout):
+        self.backend.set(key, value, timeout)
+
+    def set_many(self, items, timeout):
+        self.backend.set_many(items, timeout)
+
+    def incr(self, key):
+        self.backend.incr(key)
+
+    def incr_existing(self, key, amount=1):
+        self.backend.incr_existing(key, amount)
+
+    def set_existing(self, key, value, timeout):
+        self.backend.set_existing(key, value, timeout)
+
+    def get_counters(self, keys):
+        # The values are written to the current generation of the backend
+        return self.backend.get_counters(keys)
+
+    def delete(self, keys):
+        return self.backend.delete(keys)
+
+
+def get_generational(backend, generation_keys, prefix, suffix):
+    """Read the generations and then the value, as
+    RedisBackend.get_generational does in a single round trip."""
+    generations = [generation or '0'
+                   for generation in backend.get_counters(generation_keys)]
+    return generations, backend.get(prefix + '.'.join(generations) + suffix)
@@ -17,19 +17,33 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy.sql import text
+from sqlalchemy.orm import make_transient_to_detached
 from pybossa.cache import cache, delete_cached
 from pybossa.core import db, timeouts
-import pybossa.model as model
+from pybossa.model.category import Category
 
 
 session = db.slave_session
 
-@cache(key_prefix="categories_all",
+@cache(key_prefix="categories_all_columns",
        timeout=timeouts.get('CATEGORY_TIMEOUT'))
+def _get_all_columns():
+    """Return the column values of all categories"""
+    return [category.dictize() for category in session.query(Category).all()]
+
+
 def get_all():
-    """Return all categories"""
-    data = session.query(model.category.Category).all()
-    return data
+    """Return all categories.
+
+    Only the column values of the categories are cached, and the returned
+    categories are detached from the session, as if they had been unpickled.
+    """
+    categories = []
+    for columns in _get_all_columns():
+        category = Category(**columns)
+        make_transient_to_detached(category)
+        categories.append(category)
+    return categories
 
 
 @cache(key_prefix="categories_used",
@@ -51,5 +65,5 @@ def get_used():
 
 def reset():
     """Clean the cache"""
-    delete_cached('categories_all')
+    delete_cached('categories_all_columns')
     delete_cached('categories_used')
@@ -0,0 +1,195 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""In process LRU cache kept in front of the Redis cache.
+
+Every process keeps the most recently used cached values (as stored in
+Redis) for a few seconds. Deleting a cached value publishes the key on a
+Redis channel, and every process subscribed to it drops its local copy.
+TwoTierBackend puts the local cache in front of another cache backend.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache(object):
+
+    """LRU cache with a max number of entries that expire after ttl
+    seconds."""
+
+    def __init__(self, max_size=1000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value of a key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                return None
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, timeout=None):
+        ttl = min(self.ttl, timeout or self.ttl)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + ttl)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Invalidator(object):
+
+    """Publish deleted cache keys and drop them from the local cache of
+    every process."""
+
+    def __init__(self, local_cache, channel):
+        self.local_cache = local_cache
+        self.channel = channel
+        self._thread = None
+
+    def publish(self, redis_conn, key):
+        self.local_cache.delete(key)
+        redis_conn.publish(self.channel, key)
+
+    def listen(self, connect):
+        """Start (once per process) a thread applying the invalidations.
+
+        connect has to return a Redis connection without socket timeout, as
+        the thread blocks waiting for messages.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._listen, args=(connect,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _listen(self, connect):
+        while True:
+            try:
+                pubsub = connect().pubsub()
+                pubsub.subscribe(self.channel)
+                # Values cached before subscribing could be stale
+                self.local_cache.clear()
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.local_cache.delete(message['data'])
+            except Exception:  # pragma: no cover
+                time.sleep(1)
+
+
+class TwoTierBackend(object):
+
+    """Cache backend reading first from a LocalCache, and then from backend.
+
+    Deleted keys and incremented counters are published with the
+    invalidator, on the master of sentinel. connect returns the connection
+    the invalidator listens on.
+    """
+
+    def __init__(self, backend, local_cache, invalidator, sentinel, connect):
+        self.backend = backend
+        self.local_cache = local_cache
+        self.invalidator = invalidator
+        self.sentinel = sentinel
+        self.connect = connect
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        return self._get_many(keys, self.backend.get_many)
+
+    def set(self, key, value, timeout):
+        self.backend.set(key, value, timeout)
+        self.local_cache.set(key, value, timeout)
+
+    def set_many(self, items, timeout):
+        self.backend.set_many(items, timeout)
+        for key, value in items:
+            self.local_cache.set(key, value, timeout)
+
+    def add(self, key, value, timeout):
+        return self.backend.add(key, value, timeout)
+
+    def incr(self, key):
+        self.backend.incr(key)
+        self.invalidator.publish(self.sentinel.master, key)
+
+    def incr_existing(self, key, amount=1):
+        self.backend.incr_existing(key, amount)
+        self.invalidator.publish(self.sentinel.master, key)
+
+    def set_existing(self, key, value, timeout):
+        self.backend.set_existing(key, value, timeout)
+        self.invalidator.publish(self.sentinel.master, key)
+
+    def get_counters(self, keys):
+        return self._get_many(keys, self.backend.get_counters)
+
+    def get_generational(self, generation_keys, prefix, suffix):
+        """Read the generations and the value from the local cache, or else
+        with a single call to backend."""
+        self.invalidator.listen(self.connect)
+        generations = [self.local_cache.get(key) for key in generation_keys]
+        if None not in generations:
+            return generations, self.get(prefix + '.'.join(generations) +
+                                         suffix)
+        generations, value = self.backend.get_generational(generation_keys,
+                                                           prefix, suffix)
+        # Generation '0' is cached too: incr publishes the key when it changes
+        for key, generation in zip(generation_keys, generations):
+            self.local_cache.set(key, generation)
+        if value is not None:
+            self.local_cache.set(prefix + '.'.join(generations) + suffix,
+                                 value)
+        return generations, value
+
+    def delete(self, keys):
+        deleted = self.backend.delete(keys)
+        for key in keys:
+            self.invalidator.publish(self.sentinel.master, key)
+        return deleted
+
+    def _get_many(self, keys, get_many):
+        self.invalidator.listen(self.connect)
+        values = dict((key, self.local_cache.get(key)) for key in keys)
+        missing = [key for key in set(keys) if values[key] is None]
+        if missing:
+            for key, value in zip(missing, get_many(missing)):
+                values[key] = value
+                if value is not None:
+                    self.local_cache.set(key, value)
+        return [values[key] for key in keys]
@@ -0,0 +1,102 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Hit, miss, recompute time and size counters of the cached functions.
+
+Every process counts in memory, and adds its counters to a Redis hash per
+function (or key_prefix) every flush_interval seconds.
+"""
+import threading
+import time
+
+
+class CacheMetrics(object):
+
+    KEY_PREFIX = 'pybossa:cache_metrics:%s'
+    NAMES_KEY = 'pybossa:cache_metrics'
+
+    def __init__(self, flush_interval=60):
+        self.flush_interval = flush_interval
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.time()
+
+    def hit(self, name, n=1):
+        with self._lock:
+            self._counter(name)['hits'] += n
+
+    def miss(self, name, compute_time, size, n=1):
+        """Count n misses of a function, that took compute_time seconds to
+        compute values of size bytes in total."""
+        with self._lock:
+            counter = self._counter(name)
+            counter['misses'] += n
+            counter['time'] += compute_time
+            counter['size'] += size
+
+    def should_flush(self):
+        return time.time() - self._flushed_at >= self.flush_interval
+
+    def flush(self, redis_conn):
+        """Add the counters of this process to Redis and reset them."""
+        with self._lock:
+            counters = self._counters
+            self._counters = {}
+            self._flushed_at = time.time()
+        if not counters:
+            return
+        pipeline = redis_conn.pipeline()
+        for name, counter in counters.iteritems():
+            key = self.KEY_PREFIX % name
+            pipeline.sadd(self.NAMES_KEY, name)
+            pipeline.hincrby(key, 'hits', counter['hits'])
+            pipeline.hincrby(key, 'misses', counter['misses'])
+            pipeline.hincrbyfloat(key, 'time', counter['time'])
+            pipeline.hincrby(key, 'size', counter['size'])
+        pipeline.execute()
+
+    def get_all(self, redis_conn):
+        """Return the counters stored in Redis, with the hit ratio and the
+        average recompute time and size of every function."""
+        names = sorted(redis_conn.smembers(self.NAMES_KEY))
+        pipeline = redis_conn.pipeline()
+        for name in names:
+            pipeline.hgetall(self.KEY_PREFIX % name)
+        entries = []
+        for name, counter in zip(names, pipeline.execute()):
+            hits = int(counter.get('hits', 0))
+            misses = int(counter.get('misses', 0))
+            compute_time = float(counter.get('time', 0))
+            size = int(counter.get('size', 0))
+            calls = hits + misses
+            entries.append(dict(
+                name=name, hits=hits, misses=misses, time=compute_time,
+                size=size,
+                hit_ratio=float(hits) / calls if calls else 0.0,
+                avg_time=compute_time / misses if misses else 0.0,
+                avg_size=size / misses if misses else 0))
+        return entries
+
+    def reset(self, redis_conn):
+        names = redis_conn.smembers(self.NAMES_KEY)
+        keys = [self.KEY_PREFIX % name for name in names]
+        redis_conn.delete(self.NAMES_KEY, *keys)
+
+    def _counter(self, name):
+        if name not in self._counters:
+            self._counters[name] = dict(hits=0, misses=0, time=0.0, size=0)
+        return self._counters[name]
@@ -16,17 +16,14 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 """Cache module for project stats."""
-from flask import current_app
 from sqlalchemy.sql import text
-from pybossa.core import db
+from pybossa.core import db, geolocator
 from pybossa.cache import memoize, ONE_DAY
 from flask.ext.babel import gettext
 
-import pygeoip
 import operator
 import time
 import datetime
-import os
 
 
 session = db.slave_session
@@ -45,99 +42,44 @@ def n_tasks(project_id):
 @memoize(timeout=ONE_DAY)
 def stats_users(project_id, period=None):
     """Return users's stats for a given project_id."""
-    users = {}
+    users = dict(n_auth=0, n_anon=0)
     auth_users = []
     anon_users = []
 
-    # Get Authenticated Users
+    # Get the task runs of every volunteer (authenticated volunteers have
+    # no IP, anonymous ones no user_id) with one query
     params = dict(project_id=project_id)
-    sql = text('''SELECT task_run.user_id AS user_id,
-               COUNT(task_run.id) as n_tasks FROM task_run
-               WHERE task_run.user_id IS NOT NULL AND
-               task_run.user_ip IS NULL AND
-               task_run.project_id=:project_id
-               GROUP BY task_run.user_id ORDER BY n_tasks DESC
-               LIMIT 5;''')\
-        .execution_options(stream=True)
+    where = ''
     if period:
-        sql = text('''SELECT task_run.user_id AS user_id,
-                   COUNT(task_run.id) as n_tasks FROM task_run
-                   WHERE task_run.user_id IS NOT NULL AND
-                   task_run.user_ip IS NULL AND
-                   task_run.project_id=:project_id AND
-                   TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                   >= NOW() - :period ::INTERVAL
-                   GROUP BY task_run.user_id ORDER BY n_tasks DESC
-                   LIMIT 5;''')\
-            .execution_options(stream=True)
+        # finish_time is an ISO 8601 string, so comparing it with the first
+        # day of the period selects the same task runs as
+        # TO_DATE(finish_time) >= NOW() - period, and can use an index
+        where = '''AND task_run.finish_time >= to_char(
+                   NOW() - :period::INTERVAL + '1 day'::INTERVAL,
+                   'YYYY-MM-DD')'''
         params['period'] = period
-
-    results = session.execute(sql, params)
-
-    for row in results:
-        auth_users.append([row.user_id, row.n_tasks])
-
-    sql = text('''SELECT count(distinct(task_run.user_id)) AS user_id
-               FROM task_run WHERE task_run.user_id IS NOT NULL AND
-               task_run.user_ip IS NULL AND
-               task_run.project_id=:project_id;''')
-    if period:
-        sql = text('''SELECT count(distinct(task_run.user_id)) AS user_id
-                   FROM task_run WHERE task_run.user_id IS NOT NULL AND
-                   task_run.user_ip IS NULL AND
-                   task_run.project_id=:project_id AND
-                   TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                   >= NOW() - :period ::INTERVAL
-                   ;''')
-
-    results = session.execute(sql, params)
-    for row in results:
-        users['n_auth'] = row[0]
-
-    # Get all Anonymous Users
-    sql = text('''SELECT task_run.user_ip AS user_ip,
-               COUNT(task_run.id) as n_tasks FROM task_run
-               WHERE task_run.user_ip IS NOT NULL AND
-               task_run.user_id IS NULL AND
-               task_run.project_id=:project_id
-               GROUP BY task_run.user_ip ORDER BY n_tasks DESC;''')\
+    sql = text('''SELECT task_run.user_id AS user_id,
+               task_run.user_ip AS user_ip, COUNT(task_run.id) AS n_tasks
+               FROM task_run
+               WHERE (task_run.user_id IS NULL) <> (task_run.user_ip IS NULL)
+               AND task_run.project_id=:project_id %s
+               GROUP BY task_run.user_id, task_run.user_ip
+               ORDER BY n_tasks DESC;''' % where)\
         .execution_options(stream=True)
 
-    if period:
-        sql = text('''SELECT task_run.user_ip AS user_ip,
-                   COUNT(task_run.id) as n_tasks FROM task_run
-                   WHERE task_run.user_ip IS NOT NULL AND
-                   task_run.user_id IS NULL AND
-                   task_run.project_id=:project_id AND
-                   TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                   >= NOW() - :period ::INTERVAL
-                   GROUP BY task_run.user_ip ORDER BY n_tasks DESC;''')\
-            .execution_options(stream=True)
-
     results = session.execute(sql, params)
 
     for row in results:
-        anon_users.append([row.user_ip, row.n_tasks])
-
-    sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip)) AS user_ip
-               FROM task_run WHERE task_run.user_ip IS NOT NULL AND
-               task_run.user_id IS NULL AND
-               task_run.project_id=:project_id;''')
-    if period:
-        sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip)) AS user_ip
-                   FROM task_run WHERE task_run.user_ip IS NOT NULL AND
-                   task_run.user_id IS NULL AND
-                   task_run.project_id=:project_id AND
-                   TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                   >= NOW() - :period ::INTERVAL
-                   ;''')
-
-    results = session.execute(sql, params)
+        if row.user_id is not None:
+            auth_users.append([row.user_id, row.n_tasks])
+        else:
+            anon_users.append([row.user_ip, row.n_tasks])
 
-    for row in results:
-        users['n_anon'] = row[0]
+    users['n_auth'] = len(auth_users)
+    users['n_anon'] = len(anon_users)
 
-    return users, anon_users, auth_users
+    # Only the top 5 authenticated users are shown
+    return users, anon_users, auth_users[:5]
 
 
 def convert_period_to_days(period):
@@ -169,33 +111,26 @@ def stats_dates(project_id, period='15 day'):
 
     params = dict(project_id=project_id, period=period)
 
-    # Get all completed tasks
+    # Get the completed tasks (by the date of their last answer) and the
+    # answers of anon and auth users per date from the hourly rollup
     sql = text('''
-               WITH myquery AS (
-               SELECT task.id, coalesce(ct, 0) as n_task_runs, task.n_answers
-               FROM task LEFT OUTER JOIN
-               (SELECT task_id, COUNT(id) AS ct FROM task_run
-               WHERE project_id=:project_id AND
-               TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-               >= NOW() - :period :: INTERVAL
-               GROUP BY task_id) AS log_counts
-               ON task.id=log_counts.task_id
-               WHERE task.project_id=:project_id ORDER BY id ASC)
-               select myquery.id, max(task_run.finish_time) as day
-               from task_run, myquery where task_run.task_id=myquery.id
-               and
-               TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-               >= NOW() - :period :: INTERVAL
-               group by myquery.id order by day;
-               ''').execution_options(stream=True)
+               SELECT day AS d, SUM(n_answered_tasks) AS n_tasks,
+               SUM(CASE WHEN anonymous THEN n_task_runs ELSE 0 END) AS n_anon,
+               SUM(CASE WHEN anonymous THEN 0 ELSE n_task_runs END) AS n_auth
+               FROM contribution_rollup WHERE project_id=:project_id
+               AND day >= to_char(
+                   NOW() - :period::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
+               GROUP BY day;
+               ''')
 
     results = session.execute(sql, params)
     for row in results:
-        day = row.day[:10]
-        if day in dates.keys():
-            dates[day] += 1
-        else:
-            dates[day] = 1
+        if row.n_tasks:
+            dates[row.d] = row.n_tasks
+        if row.n_anon:
+            dates_anon[row.d] = row.n_anon
+        if row.n_auth:
+            dates_auth[row.d] = row.n_auth
 
     # No completed tasks in the last period
     def _fill_empty_days(days, obj):
@@ -208,57 +143,26 @@ def stats_dates(project_id, period='15 day'):
         return obj
 
     dates = _fill_empty_days(dates.keys(), dates)
-
-    # Get all answers per date for auth
-    sql = text('''
-                WITH myquery AS (
-                    SELECT TO_DATE(finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    as d, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_ip IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY d)
-                SELECT to_char(d, 'YYYY-MM-DD') as d, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        dates_auth[row.d] = row.count
-
     dates_auth = _fill_empty_days(dates_auth.keys(), dates_auth)
-
-    # Get all answers per date for anon
-    sql = text('''
-                WITH myquery AS (
-                    SELECT TO_DATE(finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    as d, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_id IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY d)
-               SELECT to_char(d, 'YYYY-MM-DD') as d, count  from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        dates_anon[row.d] = row.count
-
     dates_anon = _fill_empty_days(dates_anon.keys(), dates_anon)
 
     return dates, dates_anon, dates_auth
 
 
+def _max_count(counts):
+    """Return the highest of the (non zero) counts, or None."""
+    counts = [count for count in counts if count]
+    if counts:
+        return max(counts)
+    return None
+
+
 @memoize(timeout=ONE_DAY)
 def stats_hours(project_id, period='2 week'):
     """Return statistics of a project per hours."""
     hours = {}
     hours_anon = {}
     hours_auth = {}
-    max_hours = 0
-    max_hours_anon = 0
-    max_hours_auth = 0
 
     # initialize hours keys
     for i in range(0, 24):
@@ -267,126 +171,28 @@ def stats_hours(project_id, period='2 week'):
         hours_auth[str(i).zfill(2)] = 0
 
     params = dict(project_id=project_id, period=period)
-    # Get hour stats for all users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT h, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-
-    for row in results:
-        hours[row.h] = row.count
-
-    # Get maximum stats for all users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id  AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT max(count) from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        max_hours = row.max
-
-    # Get hour stats for Anonymous users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_id IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT h, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-
-    for row in results:
-        hours_anon[row.h] = row.count
-
-    # Get maximum stats for Anonymous users
+    # Get hour stats for all, anon and auth users from the hourly rollup
     sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_id IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT max(count) from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        max_hours_anon = row.max
-
-    # Get hour stats for Auth users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_ip IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT h, count from myquery;
-               ''').execution_options(stream=True)
+               SELECT hour, SUM(n_task_runs) AS n_all,
+               SUM(CASE WHEN anonymous THEN n_task_runs ELSE 0 END) AS n_anon,
+               SUM(CASE WHEN anonymous THEN 0 ELSE n_task_runs END) AS n_auth
+               FROM contribution_rollup WHERE project_id=:project_id
+               AND day >= to_char(
+                   NOW() - :period::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
+               GROUP BY hour;
+               ''')
 
     results = session.execute(sql, params)
 
     for row in results:
-        hours_auth[row.h] = row.count
+        h = str(row.hour).zfill(2)
+        hours[h] = row.n_all
+        hours_anon[h] = row.n_anon
+        hours_auth[h] = row.n_auth
 
-    # Get hour stats for Anon users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE project_id=:project_id
-                    AND user_ip IS NULL AND
-                    TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-                    >= NOW() - :period :: INTERVAL
-                    GROUP BY h)
-               SELECT max(count) from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, params)
-    for row in results:
-        max_hours_auth = row.max
+    max_hours = _max_count(hours.values())
+    max_hours_anon = _max_count(hours_anon.values())
+    max_hours_auth = _max_count(hours_auth.values())
 
     return hours, hours_anon, hours_auth, max_hours, max_hours_anon, \
         max_hours_auth
@@ -489,49 +295,28 @@ def stats_format_users(project_id, users, anon_users, auth_users, geo=False):
         userAuthStats['values'].append(dict(label=u[0], value=[u[1]]))
 
     # Get location for Anonymous users
-    top5_anon = []
-    top5_auth = []
     loc_anon = []
-    # Check if the GeoLiteCity.dat exists
-    geolite = current_app.root_path + '/../dat/GeoLiteCity.dat'
-    if geo:
-        if os.path.isfile(geolite) is False:
-            geo = False
-    if geo:  # pragma: no cover
-        gic = pygeoip.GeoIP(geolite)
-    for u in anon_users:
-        if geo:  # pragma: no cover
-            loc = gic.record_by_addr(u[0])
-        else:
-            loc = {}
-        if loc is None:  # pragma: no cover
-            loc = {}
-        if (len(loc.keys()) == 0):
-            loc['latitude'] = 0
-            loc['longitude'] = 0
-        top5_anon.append(dict(ip=u[0], loc=loc, tasks=u[1]))
-
+    top5_auth = []
     for u in anon_users:
-        if geo:  # pragma: no cover
-            loc = gic.record_by_addr(u[0])
+        if geo:
+            loc = geolocator.location(u[0])
         else:
-            loc = {}
-        if loc is None:  # pragma: no cover
-            loc = {}
-        if (len(loc.keys()) == 0):
-            loc['latitude'] = 0
-            loc['longitude'] = 0
+            loc = dict(latitude=0, longitude=0)
         loc_anon.append(dict(ip=u[0], loc=loc, tasks=u[1]))
 
+    users_by_id = {}
+    if auth_users:
+        sql = text('''SELECT id, name, fullname FROM "user"
+                   WHERE id = ANY(:ids);''')
+        results = session.execute(sql, dict(ids=[u[0] for u in auth_users]))
+        users_by_id = dict((row.id, row) for row in results)
     for u in auth_users:
-        sql = text('''SELECT name, fullname from "user" where id=:id;''')
-        results = session.execute(sql, dict(id=u[0]))
-        for row in results:
-            fullname = row.fullname
-            name = row.name
-        top5_auth.append(dict(name=name, fullname=fullname, tasks=u[1]))
-
-    userAnonStats['top5'] = top5_anon[0:5]
+        user = users_by_id.get(u[0])
+        if user is not None:
+            top5_auth.append(dict(name=user.name, fullname=user.fullname,
+                                  tasks=u[1]))
+
+    userAnonStats['top5'] = loc_anon[0:5]
     userAnonStats['locs'] = loc_anon
     userAuthStats['top5'] = top5_auth
 
@@ -539,7 +324,7 @@ def stats_format_users(project_id, users, anon_users, auth_users, geo=False):
                 n_anon=users['n_anon'], n_auth=users['n_auth'])
 
 
-@memoize(timeout=ONE_DAY)
+@memoize(timeout=2 * ONE_DAY, soft_timeout=ONE_DAY)
 def get_stats(project_id, geo=False, period='2 week'):
     """Return the stats of a given project."""
     hours, hours_anon, hours_auth, max_hours, \
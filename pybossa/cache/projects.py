@@ -16,20 +16,97 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 """Cache module for projects."""
+from datetime import timedelta
 from sqlalchemy.sql import text
-from pybossa.core import db, timeouts
+from sqlalchemy.orm import make_transient_to_detached
+from flask import current_app
+from pybossa.core import db, timeouts, sentinel
 from pybossa.model.project import Project
 from pybossa.util import pretty_date
-from pybossa.cache import memoize, cache, delete_memoized, delete_cached
+from pybossa.volunteer_counter import (VolunteerCounter, REGISTERED,
+                                       ANONYMOUS, project_scope)
+from pybossa.cache import (memoize, cache, delete_memoized, delete_cached,
+                           delete_namespace, memoize_many, counter,
+                           counter_many, incr_counter, set_counter,
+                           delete_counter)
 
 
 session = db.slave_session
 
 
+def project_namespace(project_id):
+    """Return the cache namespace of the values of a project."""
+    return 'project:%s' % project_id
+
+
+def _values_by_project(sql, args_list, default=0):
+    """Return the values of a query grouped by project_id for the projects
+    in a list of argument tuples (used by memoize_many)."""
+    project_ids = [args[0] for args in args_list]
+    results = session.execute(sql, dict(project_ids=project_ids))
+    values = dict((row.project_id, row.value) for row in results)
+    return [values.get(project_id, default) for project_id in project_ids]
+
+
+def _project_stat(project_id, column, default=0):
+    """Return a column of the project_stats row of a project."""
+    sql = text('''SELECT %s AS value FROM project_stats
+               WHERE project_id=:project_id;''' % column)
+    value = session.execute(sql, dict(project_id=project_id)).scalar()
+    return value if value is not None else default
+
+
+def _project_stats_batch(column, default=0):
+    """Return a batch function (for memoize_many and counter_many) reading
+    a column of project_stats."""
+    sql = text('''SELECT project_id, %s AS value FROM project_stats
+               WHERE project_id = ANY(:project_ids);''' % column)
+    def batch(args_list):
+        return _values_by_project(sql, args_list, default)
+    return batch
+
+
+_n_tasks_batch = _project_stats_batch('n_tasks')
+_n_completed_tasks_batch = _project_stats_batch('n_completed_tasks')
+
+
+def _n_registered_volunteers_batch(args_list):
+    sql = text('''SELECT project_id, COUNT(DISTINCT(user_id)) AS value
+               FROM task_run WHERE user_id IS NOT NULL AND user_ip IS NULL
+               AND project_id = ANY(:project_ids) GROUP BY project_id;''')
+    return _values_by_project(sql, args_list)
+
+
+def _n_anonymous_volunteers_batch(args_list):
+    sql = text('''SELECT project_id, COUNT(DISTINCT(user_ip)) AS value
+               FROM task_run WHERE user_ip IS NOT NULL AND user_id IS NULL
+               AND project_id = ANY(:project_ids) GROUP BY project_id;''')
+    return _values_by_project(sql, args_list)
+
+
+_last_activity_batch = _project_stats_batch('last_activity', default=None)
+
+
 @memoize(timeout=timeouts.get('APP_TIMEOUT'))
-def get_project(short_name):
-    """Get project by short_name."""
+def _get_project_columns(short_name):
+    """Return the column values of a project by short_name."""
     project = session.query(Project).filter_by(short_name=short_name).first()
+    if project is None:
+        return None
+    return project.dictize()
+
+
+def get_project(short_name):
+    """Get project by short_name.
+
+    Only the column values of the project are cached, and the returned
+    project is detached from the session, as if it had been unpickled.
+    """
+    columns = _get_project_columns(short_name)
+    if columns is None:
+        return None
+    project = Project(**columns)
+    make_transient_to_detached(project)
     return project
 
 
@@ -38,13 +115,12 @@ def get_project(short_name):
 def get_top(n=4):
     """Return top n=4 projects."""
     sql = text('''SELECT project.id, project.name, project.short_name, project.description,
-               project.info,
-               COUNT(project_id) AS total
-               FROM task_run, project
-               WHERE project_id IS NOT NULL
-               AND project.id=project_id
+               project.info
+               FROM project_stats, project
+               WHERE project.id=project_stats.project_id
+               AND project_stats.n_task_runs > 0
                AND (project.info->>'passwd_hash') IS NULL
-               GROUP BY project.id ORDER BY total DESC LIMIT :limit;''')
+               ORDER BY project_stats.n_task_runs DESC LIMIT :limit;''')
     results = session.execute(sql, dict(limit=n))
     top_projects = []
     for row in results:
@@ -57,7 +133,8 @@ def get_top(n=4):
     return top_projects
 
 
-@memoize(timeout=timeouts.get('BROWSE_TASKS_TIMEOUT'))
+@memoize(timeout=timeouts.get('BROWSE_TASKS_TIMEOUT'),
+         namespace=project_namespace)
 def browse_tasks(project_id):
     """Cache browse tasks view for a project."""
     sql = text('''
@@ -88,52 +165,32 @@ def _pct_status(n_task_runs, n_answers):
     return float(0)
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+@counter(timeout=timeouts.get('PROJECT_COUNTERS_TIMEOUT'),
+         batch=_n_tasks_batch)
 def n_tasks(project_id):
     """Return number of tasks of a project."""
-    sql = text('''SELECT COUNT(task.id) AS n_tasks FROM task
-                  WHERE task.project_id=:project_id;''')
-    results = session.execute(sql, dict(project_id=project_id))
-    n_tasks = 0
-    for row in results:
-        n_tasks = row.n_tasks
-    return n_tasks
+    return _project_stat(project_id, 'n_tasks')
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+@counter(timeout=timeouts.get('PROJECT_COUNTERS_TIMEOUT'),
+         batch=_n_completed_tasks_batch)
 def n_completed_tasks(project_id):
     """Return number of completed tasks of a project."""
-    sql = text('''SELECT COUNT(task.id) AS n_completed_tasks FROM task
-                WHERE task.project_id=:project_id AND task.state=\'completed\';
-                ''')
-
-    results = session.execute(sql, dict(project_id=project_id))
-    n_completed_tasks = 0
-    for row in results:
-        n_completed_tasks = row.n_completed_tasks
-    return n_completed_tasks
+    return _project_stat(project_id, 'n_completed_tasks')
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+@counter(timeout=timeouts.get('PROJECT_COUNTERS_TIMEOUT'))
 def n_results(project_id):
     """Return number of results of a project."""
-    query = text('''
-                 SELECT COUNT(id) AS ct FROM result
-                 WHERE project_id=:project_id
-                 AND info IS NOT NULL
-                 AND cast(info AS TEXT) != 'null'
-                 AND cast(info AS TEXT) != '';
-                 ''')
-    results = session.execute(query, dict(project_id=project_id))
-    n_results = 0
-    for row in results:
-        n_results = row.ct
-    return n_results
+    return _project_stat(project_id, 'n_results')
 
 
-@memoize(timeout=timeouts.get('REGISTERED_USERS_TIMEOUT'))
-def n_registered_volunteers(project_id):
-    """Return number of registered users that have participated in a project."""
+@memoize(timeout=timeouts.get('REGISTERED_USERS_TIMEOUT'),
+         namespace=project_namespace,
+         batch=_n_registered_volunteers_batch)
+def _n_registered_volunteers(project_id):
+    """Return the exact number of registered users that have participated
+    in a project."""
     sql = text('''SELECT COUNT(DISTINCT(task_run.user_id))
                AS n_registered_volunteers FROM task_run
                WHERE task_run.user_id IS NOT NULL AND
@@ -147,9 +204,12 @@ def n_registered_volunteers(project_id):
     return n_registered_volunteers
 
 
-@memoize(timeout=timeouts.get('ANON_USERS_TIMEOUT'))
-def n_anonymous_volunteers(project_id):
-    """Return number of anonymous users that have participated in a project."""
+@memoize(timeout=timeouts.get('ANON_USERS_TIMEOUT'),
+         namespace=project_namespace,
+         batch=_n_anonymous_volunteers_batch)
+def _n_anonymous_volunteers(project_id):
+    """Return the exact number of anonymous users that have participated in
+    a project."""
     sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip))
                AS n_anonymous_volunteers FROM task_run
                WHERE task_run.user_ip IS NOT NULL AND
@@ -163,6 +223,39 @@ def n_anonymous_volunteers(project_id):
     return n_anonymous_volunteers
 
 
+def approximate_volunteers(scopes, kind):
+    """Return the HyperLogLog counts of a kind of volunteers of the given
+    scopes (see pybossa.volunteer_counter), with None for the ones not
+    loaded, or only Nones if VOLUNTEERS_HLL is not enabled."""
+    if not current_app.config.get('VOLUNTEERS_HLL'):
+        return [None] * len(scopes)
+    return VolunteerCounter(sentinel.master).count_many(scopes, kind)
+
+
+def _volunteers_many(function, kind, project_ids):
+    """Return the approximate number of volunteers of a kind of every
+    project, or the memoized exact function if there is no approximation."""
+    counts = approximate_volunteers([project_scope(project_id)
+                                     for project_id in project_ids], kind)
+    missing = [i for i, count in enumerate(counts) if count is None]
+    exact = memoize_many(function, [(project_ids[i],) for i in missing])
+    for i, count in zip(missing, exact):
+        counts[i] = count
+    return counts
+
+
+def n_registered_volunteers(project_id):
+    """Return number of registered users that have participated in a project."""
+    return _volunteers_many(_n_registered_volunteers, REGISTERED,
+                            [project_id])[0]
+
+
+def n_anonymous_volunteers(project_id):
+    """Return number of anonymous users that have participated in a project."""
+    return _volunteers_many(_n_anonymous_volunteers, ANONYMOUS,
+                            [project_id])[0]
+
+
 def n_volunteers(project_id):
     """Return total number of volunteers of a project."""
     total = (n_anonymous_volunteers(project_id) +
@@ -170,54 +263,60 @@ def n_volunteers(project_id):
     return total
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+def get_counters(project_ids):
+    """Return a dict with the last_activity, overall_progress, n_tasks and
+    n_volunteers of every project, reading the cached values at once."""
+    args_list = [(project_id,) for project_id in project_ids]
+    n_anonymous = _volunteers_many(_n_anonymous_volunteers, ANONYMOUS,
+                                   project_ids)
+    n_registered = _volunteers_many(_n_registered_volunteers, REGISTERED,
+                                    project_ids)
+    rows = zip(project_ids, counter_many(last_activity, args_list),
+               counter_many(n_tasks, args_list),
+               counter_many(n_completed_tasks, args_list),
+               n_anonymous, n_registered)
+    counters = dict()
+    for row in rows:
+        counters[row[0]] = dict(last_activity=row[1],
+                                overall_progress=_progress(row[2], row[3]),
+                                n_tasks=row[2],
+                                n_volunteers=row[4] + row[5])
+    return counters
+
+
+@counter(timeout=timeouts.get('PROJECT_COUNTERS_TIMEOUT'))
 def n_task_runs(project_id):
     """Return number of task_runs of a project."""
-    sql = text('''SELECT COUNT(task_run.id) AS n_task_runs FROM task_run
-                  WHERE task_run.project_id=:project_id''')
-
-    results = session.execute(sql, dict(project_id=project_id))
-    n_task_runs = 0
-    for row in results:
-        n_task_runs = row.n_task_runs
-    return n_task_runs
+    return _project_stat(project_id, 'n_task_runs')
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
 def overall_progress(project_id):
     """Return the percentage of completed tasks for a project."""
-    if n_tasks(project_id) != 0:
-        return ((n_completed_tasks(project_id) * 100) / n_tasks(project_id))
+    return _progress(n_tasks(project_id), n_completed_tasks(project_id))
+
+
+def _progress(n_tasks, n_completed_tasks):
+    if n_tasks != 0:
+        return (n_completed_tasks * 100) / n_tasks
     else:
         return 0
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+@counter(timeout=timeouts.get('PROJECT_COUNTERS_TIMEOUT'),
+         batch=_last_activity_batch, type=str)
 def last_activity(project_id):
     """Return last activity, date, from a project."""
-    sql = text('''SELECT finish_time FROM task_run WHERE project_id=:project_id
-               ORDER BY finish_time DESC LIMIT 1''')
-
-    results = session.execute(sql, dict(project_id=project_id))
-    for row in results:
-        if row is not None:
-            return row[0]
-        else:  # pragma: no cover
-            return None
+    return _project_stat(project_id, 'last_activity', default=None)
 
 
 @memoize(timeout=timeouts.get('APP_TIMEOUT'))
 def average_contribution_time(project_id):
-    sql = text('''SELECT
-        AVG(to_timestamp(finish_time, 'YYYY-MM-DD-THH24-MI-SS.US') -
-            to_timestamp(created, 'YYYY-MM-DD-THH24-MI-SS.US')) AS average_time
-        FROM task_run
-        WHERE project_id=:project_id;''')
-
-    results = session.execute(sql, dict(project_id=project_id)).fetchall()
-    for row in results:
-        average_time = row.average_time
-    return average_time or 0
+    sql = text('''SELECT contribution_time, n_timed_task_runs
+               FROM project_stats WHERE project_id=:project_id;''')
+    row = session.execute(sql, dict(project_id=project_id)).first()
+    if row is None or not row.n_timed_task_runs:
+        return 0
+    return timedelta(seconds=row.contribution_time / row.n_timed_task_runs)
 
 
 # This function does not change too much, so cache it for a longer time
@@ -246,18 +345,20 @@ def get_all_featured(category=None):
            AND "user".id=project.owner_id
            GROUP BY project.id, "user".id;''')
 
-    results = session.execute(sql)
+    results = session.execute(sql).fetchall()
+    counters = get_counters([row.id for row in results])
     projects = []
     for row in results:
         project = dict(id=row.id, name=row.name, short_name=row.short_name,
                        created=row.created, description=row.description,
                        updated=row.updated,
-                       last_activity=pretty_date(last_activity(row.id)),
-                       last_activity_raw=last_activity(row.id),
+                       last_activity=pretty_date(
+                           counters[row.id]['last_activity']),
+                       last_activity_raw=counters[row.id]['last_activity'],
                        owner=row.owner,
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
+                       overall_progress=counters[row.id]['overall_progress'],
+                       n_tasks=counters[row.id]['n_tasks'],
+                       n_volunteers=counters[row.id]['n_volunteers'],
                        info=row.info)
         projects.append(project)
     return projects
@@ -305,7 +406,8 @@ def get_all_draft(category=None):
            WHERE project.owner_id="user".id
            AND project.published=false;''')
 
-    results = session.execute(sql)
+    results = session.execute(sql).fetchall()
+    counters = get_counters([row.id for row in results])
     projects = []
     for row in results:
         project = dict(id=row.id, name=row.name, short_name=row.short_name,
@@ -313,11 +415,12 @@ def get_all_draft(category=None):
                        updated=row.updated,
                        description=row.description,
                        owner=row.owner,
-                       last_activity=pretty_date(last_activity(row.id)),
-                       last_activity_raw=last_activity(row.id),
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
+                       last_activity=pretty_date(
+                           counters[row.id]['last_activity']),
+                       last_activity_raw=counters[row.id]['last_activity'],
+                       overall_progress=counters[row.id]['overall_progress'],
+                       n_tasks=counters[row.id]['n_tasks'],
+                       n_volunteers=counters[row.id]['n_volunteers'],
                        info=row.info)
         projects.append(project)
     return projects
@@ -372,7 +475,8 @@ def get_all(category):
            AND (project.info->>'passwd_hash') IS NULL
            GROUP BY project.id, "user".id ORDER BY project.name;''')
 
-    results = session.execute(sql, dict(category=category))
+    results = session.execute(sql, dict(category=category)).fetchall()
+    counters = get_counters([row.id for row in results])
     projects = []
     for row in results:
         project = dict(id=row.id,
@@ -382,11 +486,12 @@ def get_all(category):
                        description=row.description,
                        owner=row.owner,
                        featured=row.featured,
-                       last_activity=pretty_date(last_activity(row.id)),
-                       last_activity_raw=last_activity(row.id),
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
+                       last_activity=pretty_date(
+                           counters[row.id]['last_activity']),
+                       last_activity_raw=counters[row.id]['last_activity'],
+                       overall_progress=counters[row.id]['overall_progress'],
+                       n_tasks=counters[row.id]['n_tasks'],
+                       n_volunteers=counters[row.id]['n_volunteers'],
                        info=row.info)
         projects.append(project)
     return projects
@@ -428,7 +533,7 @@ def reset():
 
 def delete_project(short_name):
     """Reset project values in cache"""
-    delete_memoized(get_project, short_name)
+    delete_memoized(_get_project_columns, short_name)
 
 
 def delete_browse_tasks(project_id):
@@ -438,47 +543,43 @@ def delete_browse_tasks(project_id):
 
 def delete_n_tasks(project_id):
     """Reset n_tasks value in cache"""
-    delete_memoized(n_tasks, project_id)
+    delete_counter(n_tasks, project_id)
 
 
 def delete_n_results(project_id):
     """Reset n_results value in cache"""
-    delete_memoized(n_results, project_id)
+    delete_counter(n_results, project_id)
 
 
 def delete_n_completed_tasks(project_id):
     """Reset n_completed_tasks value in cache"""
-    delete_memoized(n_completed_tasks, project_id)
+    delete_counter(n_completed_tasks, project_id)
 
 
 def delete_n_task_runs(project_id):
     """Reset n_tasks value in cache"""
-    delete_memoized(n_task_runs, project_id)
+    delete_counter(n_task_runs, project_id)
 
 
 def delete_overall_progress(project_id):
     """Reset overall_progress value in cache"""
-    delete_memoized(overall_progress, project_id)
+    delete_n_tasks(project_id)
+    delete_n_completed_tasks(project_id)
 
 
 def delete_last_activity(project_id):
     """Reset last_activity value in cache"""
-    delete_memoized(last_activity, project_id)
+    delete_counter(last_activity, project_id)
 
 
 def delete_n_registered_volunteers(project_id):
     """Reset n_registered_volunteers value in cache"""
-    delete_memoized(n_registered_volunteers, project_id)
+    delete_memoized(_n_registered_volunteers, project_id)
 
 
 def delete_n_anonymous_volunteers(project_id):
     """Reset n_anonymous_volunteers value in cache"""
-    delete_memoized(n_anonymous_volunteers, project_id)
-
-
-def delete_n_volunteers(project_id):
-    """Reset n_volunteers value in cache"""
-    delete_memoized(n_volunteers, project_id)
+    delete_memoized(_n_anonymous_volunteers, project_id)
 
 
 def clean(project_id):
@@ -489,13 +590,32 @@ def clean(project_id):
 
 def clean_project(project_id):
     """Clean cache for a specific project"""
-    delete_browse_tasks(project_id)
+    delete_namespace(project_namespace(project_id))
     delete_n_tasks(project_id)
     delete_n_completed_tasks(project_id)
+    delete_n_task_runs(project_id)
     delete_n_results(project_id)
-    delete_n_registered_volunteers(project_id)
-    delete_n_anonymous_volunteers(project_id)
-    delete_n_volunteers(project_id)
     delete_last_activity(project_id)
-    delete_n_task_runs(project_id)
-    delete_overall_progress(project_id)
+
+
+def add_task(project_id, completed=False):
+    """Count a new task in the cached counters of its project."""
+    incr_counter(n_tasks, 1, project_id)
+    if completed:
+        complete_task(project_id)
+
+
+def complete_task(project_id):
+    """Count a task that has just been completed."""
+    incr_counter(n_completed_tasks, 1, project_id)
+
+
+def add_task_run(project_id, finish_time):
+    """Count a new task run in the cached counters of its project."""
+    incr_counter(n_task_runs, 1, project_id)
+    set_counter(last_activity, finish_time, project_id)
+
+
+def add_results(project_id, amount):
+    """Add amount to the cached number of results of a project."""
+    incr_counter(n_results, amount, project_id)
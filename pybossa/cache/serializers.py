@@ -0,0 +1,70 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Codecs to serialize the cached values.
+
+The name of the codec is part of the cache keys, so processes using
+different codecs (e.g. during a rollout) do not read each other's values.
+"""
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+
+class PickleCodec(object):
+
+    """Plain (protocol 0) pickles."""
+
+    name = 'pickle'
+
+    def dumps(self, value):
+        return pickle.dumps(value)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class CompressedPickleCodec(object):
+
+    """Binary pickles, compressed with zlib when they are longer than
+    threshold bytes. The first byte of the data tells if it is compressed."""
+
+    name = 'zpickle'
+
+    def __init__(self, threshold=1024, level=6):
+        self.threshold = threshold
+        self.level = level
+
+    def dumps(self, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.threshold:
+            return 'z' + zlib.compress(data, self.level)
+        return 'p' + data
+
+    def loads(self, data):
+        if data[0] == 'z':
+            return pickle.loads(zlib.decompress(data[1:]))
+        return pickle.loads(data[1:])
+
+
+def get_codecs(threshold=1024):
+    """Return a dict with the available codecs by name."""
+    codecs = [PickleCodec(), CompressedPickleCodec(threshold)]
+    return dict((codec.name, codec) for codec in codecs)
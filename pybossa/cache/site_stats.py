@@ -16,12 +16,13 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 """Cache module for site statistics."""
-import pygeoip
 from sqlalchemy.sql import text
 from flask import current_app
 
-from pybossa.core import db
+from pybossa.core import db, geolocator
 from pybossa.cache import cache, ONE_DAY
+from pybossa.cache.projects import approximate_volunteers
+from pybossa.volunteer_counter import ANONYMOUS, SITE
 
 session = db.slave_session
 
@@ -36,9 +37,17 @@ def n_auth_users():
     return n_auth or 0
 
 
-@cache(timeout=ONE_DAY, key_prefix="site_n_anon_users")
 def n_anon_users():
     """Return number of anonymous users."""
+    count = approximate_volunteers([SITE], ANONYMOUS)[0]
+    if count is not None:
+        return count
+    return _n_anon_users()
+
+
+@cache(timeout=ONE_DAY, key_prefix="site_n_anon_users")
+def _n_anon_users():
+    """Return the exact number of anonymous users."""
     sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip))
                AS n_anon FROM task_run;''')
 
@@ -51,7 +60,7 @@ def n_anon_users():
 @cache(timeout=ONE_DAY, key_prefix="site_n_tasks")
 def n_tasks_site():
     """Return number of tasks in the server."""
-    sql = text('''SELECT COUNT(task.id) AS n_tasks FROM task''')
+    sql = text('''SELECT SUM(n_tasks) AS n_tasks FROM project_stats''')
     results = session.execute(sql)
     for row in results:
         n_tasks = row.n_tasks
@@ -61,7 +70,7 @@ def n_tasks_site():
 @cache(timeout=ONE_DAY, key_prefix="site_n_total_tasks")
 def n_total_tasks_site():
     """Return number of total tasks based on redundancy."""
-    sql = text('''SELECT SUM(n_answers) AS n_tasks FROM task''')
+    sql = text('''SELECT SUM(n_answers) AS n_tasks FROM project_stats''')
     results = session.execute(sql)
     for row in results:
         total = row.n_tasks
@@ -71,7 +80,8 @@ def n_total_tasks_site():
 @cache(timeout=ONE_DAY, key_prefix="site_n_task_runs")
 def n_task_runs_site():
     """Return number of task runs in the server."""
-    sql = text('''SELECT COUNT(task_run.id) AS n_task_runs FROM task_run''')
+    sql = text('''SELECT SUM(n_task_runs) AS n_task_runs
+               FROM project_stats''')
     results = session.execute(sql)
     for row in results:
         n_task_runs = row.n_task_runs
@@ -81,12 +91,7 @@ def n_task_runs_site():
 @cache(timeout=ONE_DAY, key_prefix="site_n_results")
 def n_results_site():
     """Return number of results in the server."""
-    sql = text('''
-               SELECT COUNT(id) AS n_results FROM result
-               WHERE info IS NOT NULL
-               AND cast(info AS TEXT) != 'null'
-               AND cast(info AS TEXT) != '';
-               ''')
+    sql = text('''SELECT SUM(n_results) AS n_results FROM project_stats''')
     results = session.execute(sql)
     for row in results:
         n_results = row.n_results
@@ -96,12 +101,15 @@ def n_results_site():
 @cache(timeout=ONE_DAY, key_prefix="site_top5_apps_24_hours")
 def get_top5_projects_24_hours():
     """Return the top 5 projects more active in the last 24 hours."""
-    # Top 5 Most active projects in last 24 hours
+    # Top 5 Most active projects in last 24 hours. finish_time is an ISO 8601
+    # string, so it is compared with the dates (as DATE(finish_time) was)
+    # without parsing it, and the finish_time index can be used
     sql = text('''SELECT project.id, project.name, project.short_name, project.info,
                COUNT(task_run.project_id) AS n_answers FROM project, task_run
                WHERE project.id=task_run.project_id
-               AND DATE(task_run.finish_time) > NOW() - INTERVAL '24 hour'
-               AND DATE(task_run.finish_time) <= NOW()
+               AND task_run.finish_time >= to_char(NOW(), 'YYYY-MM-DD')
+               AND task_run.finish_time
+                   < to_char(NOW() + INTERVAL '1 day', 'YYYY-MM-DD')
                GROUP BY project.id
                ORDER BY n_answers DESC LIMIT 5;''')
 
@@ -121,8 +129,9 @@ def get_top5_users_24_hours():
     sql = text('''SELECT "user".id, "user".fullname, "user".name,
                COUNT(task_run.project_id) AS n_answers FROM "user", task_run
                WHERE "user".id=task_run.user_id
-               AND DATE(task_run.finish_time) > NOW() - INTERVAL '24 hour'
-               AND DATE(task_run.finish_time) <= NOW()
+               AND task_run.finish_time >= to_char(NOW(), 'YYYY-MM-DD')
+               AND task_run.finish_time
+                   < to_char(NOW() + INTERVAL '1 day', 'YYYY-MM-DD')
                GROUP BY "user".id
                ORDER BY n_answers DESC LIMIT 5;''')
 
@@ -145,15 +154,6 @@ def get_locs():
         sql = '''SELECT DISTINCT(user_ip) FROM task_run
                  WHERE user_ip IS NOT NULL;'''
         results = session.execute(sql)
-
-        geolite = current_app.root_path + '/../dat/GeoLiteCity.dat'
-        gic = pygeoip.GeoIP(geolite)
-        for row in results:
-            loc = gic.record_by_addr(row.user_ip)
-            if loc is None:
-                loc = {}
-            if (len(loc.keys()) == 0):
-                loc['latitude'] = 0
-                loc['longitude'] = 0
-            locs.append(dict(loc=loc))
+        locs = [dict(loc=geolocator.location(row.user_ip))
+                for row in results]
     return locs
@@ -16,21 +16,56 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 """Cache module for users."""
+from flask import current_app
 from sqlalchemy.sql import text
-from pybossa.core import db, timeouts
+from pybossa.core import db, timeouts, sentinel
 from pybossa.cache import cache, memoize, delete_memoized
 from pybossa.util import pretty_date
 from pybossa.model.user import User
 from pybossa.model.task_run import TaskRun
-from pybossa.cache.projects import overall_progress, n_tasks, n_volunteers
+from pybossa.cache.projects import get_counters, approximate_volunteers
+from pybossa.volunteer_counter import REGISTERED, SITE
+from pybossa.leaderboard import Leaderboard
 
 
 session = db.slave_session
 
 
-@memoize(timeout=timeouts.get('USER_TIMEOUT'))
+@memoize(timeout=timeouts.get('USER_TOP_TIMEOUT'),
+         soft_timeout=timeouts.get('USER_TIMEOUT'))
 def get_leaderboard(n, user_id=None):
     """Return the top n users with their rank."""
+    leaderboard = redis_leaderboard()
+    top = leaderboard.top(n) if leaderboard else None
+    if top is None:
+        return _get_leaderboard(n, user_id)
+    user_ids = [row[0] for row in top]
+    rank_score = None
+    if user_id is not None and user_id not in user_ids:
+        rank_score = leaderboard.rank_and_score(user_id)
+        user_ids.append(user_id)
+    sql = text('''SELECT id, name, fullname, email_addr, info, created
+               FROM "user" WHERE id = ANY(:ids);''')
+    users = dict((row.id, row) for row in
+                 session.execute(sql, dict(ids=user_ids)))
+    if rank_score is not None:
+        # Users without task runs are shown with no rank
+        top.append((user_id, rank_score['rank'] or -1,
+                    rank_score['score'] or -1))
+    top_users = []
+    for _id, rank, score in top:
+        row = users.get(_id)
+        if row is not None:
+            top_users.append(dict(rank=rank, id=row.id, name=row.name,
+                                  fullname=row.fullname,
+                                  email_addr=row.email_addr, info=row.info,
+                                  created=row.created, score=score))
+    return top_users
+
+
+def _get_leaderboard(n, user_id=None):
+    """Return the top n users with their rank, ranking every user from the
+    task_run table."""
     sql = text('''
                WITH global_rank AS (
                     WITH scores AS (
@@ -143,6 +178,10 @@ def get_user_summary(name):
 @memoize(timeout=timeouts.get('USER_TIMEOUT'))
 def rank_and_score(user_id):
     """Return rank and score for a user."""
+    leaderboard = redis_leaderboard()
+    rank_score = leaderboard.rank_and_score(user_id) if leaderboard else None
+    if rank_score is not None:
+        return rank_score
     # See: https://gist.github.com/tokumine/1583695
     sql = text('''
                WITH global_rank AS (
@@ -161,6 +200,14 @@ def rank_and_score(user_id):
     return rank_and_score
 
 
+def redis_leaderboard():
+    """Return the Redis leaderboard (see pybossa.leaderboard) if
+    LEADERBOARD_SORTED_SET is enabled."""
+    if current_app.config.get('LEADERBOARD_SORTED_SET'):
+        return Leaderboard(sentinel.master)
+    return None
+
+
 def projects_contributed(user_id):
     """Return projects that user_id has contributed to."""
     sql = text('''
@@ -171,15 +218,16 @@ def projects_contributed(user_id):
                project.description, project.info FROM project, projects_contributed
                WHERE project.id=projects_contributed.project_id ORDER BY project.name DESC;
                ''')
-    results = session.execute(sql, dict(user_id=user_id))
+    results = session.execute(sql, dict(user_id=user_id)).fetchall()
+    counters = get_counters([row.id for row in results])
     projects_contributed = []
     for row in results:
         project = dict(id=row.id, name=row.name, short_name=row.short_name,
                        owner_id=row.owner_id,
                        description=row.description,
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
+                       overall_progress=counters[row.id]['overall_progress'],
+                       n_tasks=counters[row.id]['n_tasks'],
+                       n_volunteers=counters[row.id]['n_volunteers'],
                        info=row.info)
         projects_contributed.append(project)
     return projects_contributed
@@ -202,14 +250,15 @@ def published_projects(user_id):
                AND project.owner_id=:user_id;
                ''')
     projects_published = []
-    results = session.execute(sql, dict(user_id=user_id))
+    results = session.execute(sql, dict(user_id=user_id)).fetchall()
+    counters = get_counters([row.id for row in results])
     for row in results:
         project = dict(id=row.id, name=row.name, short_name=row.short_name,
                        owner_id=row.owner_id,
                        description=row.description,
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
+                       overall_progress=counters[row.id]['overall_progress'],
+                       n_tasks=counters[row.id]['n_tasks'],
+                       n_volunteers=counters[row.id]['n_volunteers'],
                        info=row.info)
         projects_published.append(project)
     return projects_published
@@ -232,14 +281,15 @@ def draft_projects(user_id):
                AND project.published=false;
                ''')
     projects_draft = []
-    results = session.execute(sql, dict(user_id=user_id))
+    results = session.execute(sql, dict(user_id=user_id)).fetchall()
+    counters = get_counters([row.id for row in results])
     for row in results:
         project = dict(id=row.id, name=row.name, short_name=row.short_name,
                        owner_id=row.owner_id,
                        description=row.description,
-                       overall_progress=overall_progress(row.id),
-                       n_tasks=n_tasks(row.id),
-                       n_volunteers=n_volunteers(row.id),
+                       overall_progress=counters[row.id]['overall_progress'],
+                       n_tasks=counters[row.id]['n_tasks'],
+                       n_volunteers=counters[row.id]['n_volunteers'],
                        info=row.info)
         projects_draft.append(project)
     return projects_draft
@@ -259,10 +309,18 @@ def get_total_users():
     return count
 
 
-@cache(timeout=timeouts.get('USER_TOTAL_TIMEOUT'),
-         key_prefix="site_total_active_users")
 def get_total_active_users():
     """Return total number of users who have submitted atleast one task run"""
+    count = approximate_volunteers([SITE], REGISTERED)[0]
+    if count is not None:
+        return count
+    return _get_total_active_users()
+
+
+@cache(timeout=timeouts.get('USER_TOTAL_TIMEOUT'),
+         key_prefix="site_total_active_users")
+def _get_total_active_users():
+    """Return the exact number of users who have submitted a task run"""
     count = session.query(TaskRun.user_id)\
                    .filter(TaskRun.user_id.isnot(None))\
                    .distinct().count()
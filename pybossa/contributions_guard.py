@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
+from time import time
 from pybossa.model import make_timestamp
 
 
@@ -31,6 +32,15 @@ class ContributionsGuard(object):
         key = self._create_key(task, user)
         self.conn.setex(key, self.STAMP_TTL, make_timestamp())
 
+    def stamp_many(self, tasks, user):
+        """Stamp several tasks for the user in a single round trip."""
+        timestamp = make_timestamp()
+        pipeline = self.conn.pipeline(transaction=False)
+        for task in tasks:
+            pipeline.setex(self._create_key(task, user), self.STAMP_TTL,
+                           timestamp)
+        pipeline.execute()
+
     def check_task_stamped(self, task, user):
         key = self._create_key(task, user)
         task_requested = self.conn.get(key) is not None
@@ -43,3 +53,84 @@ class ContributionsGuard(object):
     def _create_key(self, task, user):
         user_id = user['user_id'] or user['user_ip']
         return self.KEY_PREFIX % (user_id, task.id)
+
+
+class TaskLeases(object):
+
+    """Short lived reservations of the answers a task still needs.
+
+    Every user that requests a task takes a lease on it, and a task can only
+    be leased as many times as answers it is missing. Leases expire after
+    LEASE_TTL seconds (the volunteer left), which frees the slot again.
+    """
+
+    KEY_PREFIX = 'pybossa:task_leases:task:%s'
+    LEASE_TTL = 10 * 60
+    ACQUIRE_SCRIPT = """
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+        if redis.call('ZSCORE', KEYS[1], ARGV[3]) or
+           redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+            redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+            redis.call('EXPIRE', KEYS[1], ARGV[5])
+            return 1
+        end
+        return 0
+        """
+
+    def __init__(self, redis_conn, lease_ttl=None):
+        self.conn = redis_conn
+        self.lease_ttl = lease_ttl or self.LEASE_TTL
+        self._acquire = self.conn.register_script(self.ACQUIRE_SCRIPT)
+
+    def acquire(self, task_id, user, n_available):
+        """Lease the task for the user if any of the n_available answer
+        slots is free (or the user already holds one)."""
+        now = time()
+        args = [now, now + self.lease_ttl, self._member(user), n_available,
+                self.lease_ttl]
+        return self._acquire(keys=[self.KEY_PREFIX % task_id], args=args) == 1
+
+    def acquire_many(self, task_ids, user, n_available):
+        """Lease several tasks for the user in a single round trip.
+
+        n_available maps every task id to the number of answers it needs.
+        Return the ids of the tasks that were leased.
+        """
+        now = time()
+        member = self._member(user)
+        pipeline = self.conn.pipeline(transaction=False)
+        for task_id in task_ids:
+            args = [now, now + self.lease_ttl, member, n_available[task_id],
+                    self.lease_ttl]
+            self._acquire(keys=[self.KEY_PREFIX % task_id], args=args,
+                          client=pipeline)
+        results = pipeline.execute()
+        return [task_id for task_id, leased in zip(task_ids, results)
+                if leased == 1]
+
+    def release(self, task_id, user):
+        self.conn.zrem(self.KEY_PREFIX % task_id, self._member(user))
+
+    def available(self, task_ids, user, n_available):
+        """Return the task ids that can still be leased by the user.
+
+        n_available maps every task id to the number of answers it needs.
+        """
+        now = time()
+        member = self._member(user)
+        pipeline = self.conn.pipeline(transaction=False)
+        for task_id in task_ids:
+            key = self.KEY_PREFIX % task_id
+            pipeline.zremrangebyscore(key, '-inf', now)
+            pipeline.zcard(key)
+            pipeline.zscore(key, member)
+        results = pipeline.execute()
+        available = []
+        for i, task_id in enumerate(task_ids):
+            n_leases, own_lease = results[3 * i + 1], results[3 * i + 2]
+            if own_lease is not None or n_leases < n_available[task_id]:
+                available.append(task_id)
+        return available
+
+    def _member(self, user):
+        return str(user['user_id'] or user['user_ip'])
@@ -52,6 +52,7 @@ def create_app(run_as_server=True):
     setup_exporter(app)
     mail.init_app(app)
     sentinel.init_app(app)
+    setup_cache(app)
     signer.init_app(app)
     if app.config.get('SENTRY_DSN'):  # pragma: no cover
         Sentry(app)
@@ -164,6 +165,12 @@ def setup_db(app):
             return response_or_exc
 
 
+def setup_cache(app):
+    """Setup the backend of the cache."""
+    from pybossa import cache
+    cache.init_app(app)
+
+
 def setup_repositories():
     """Setup repositories."""
     from pybossa.repositories import UserRepository
@@ -410,8 +417,8 @@ def setup_youtube_importer(app):
 def setup_geocoding(app):
     """Setup geocoding."""
     # Check if app stats page can generate the map
-    geolite = app.root_path + '/../dat/GeoLiteCity.dat'
-    if not os.path.exists(geolite):  # pragma: no cover
+    geolocator.init_app(app)
+    if not geolocator.enabled:  # pragma: no cover
         app.config['GEO'] = False
         print("GeoLiteCity.dat file not found")
         print("Project page stats web map disabled")
@@ -576,6 +583,8 @@ def setup_cache_timeouts(app):
     # Apps
     timeouts['AVATAR_TIMEOUT'] = app.config['AVATAR_TIMEOUT']
     timeouts['APP_TIMEOUT'] = app.config['APP_TIMEOUT']
+    timeouts['PROJECT_COUNTERS_TIMEOUT'] = \
+        app.config['PROJECT_COUNTERS_TIMEOUT']
     timeouts['REGISTERED_USERS_TIMEOUT'] = \
         app.config['REGISTERED_USERS_TIMEOUT']
     timeouts['ANON_USERS_TIMEOUT'] = app.config['ANON_USERS_TIMEOUT']
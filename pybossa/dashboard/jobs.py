@@ -47,9 +47,8 @@ def active_users_week():
                                         'YYYY-MM-DD\THH24:MI:SS.US') AS day,
                                 user_id, COUNT(task_run.user_id) AS day_crafters
                         FROM task_run
-                        WHERE to_date(task_run.finish_time,
-                                      'YYYY-MM-DD\THH24:MI:SS.US')
-                            >= NOW() - ('1 week'):: INTERVAL
+                        WHERE task_run.finish_time >= to_char(
+                            NOW() - ('1 week')::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                         GROUP BY day, task_run.user_id)
                    SELECT day, COUNT(crafters_per_day.user_id) AS n_users
                    FROM crafters_per_day GROUP BY day ORDER BY day;''')
@@ -69,9 +68,8 @@ def active_anon_week():
                                         'YYYY-MM-DD\THH24:MI:SS.US') AS day,
                                 user_ip, COUNT(task_run.user_ip) AS day_crafters
                         FROM task_run
-                        WHERE to_date(task_run.finish_time,
-                                      'YYYY-MM-DD\THH24:MI:SS.US')
-                            >= NOW() - ('1 week'):: INTERVAL
+                        WHERE task_run.finish_time >= to_char(
+                            NOW() - ('1 week')::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                         GROUP BY day, task_run.user_ip)
                    SELECT day, COUNT(crafters_per_day.user_ip) AS n_users
                    FROM crafters_per_day GROUP BY day ORDER BY day;''')
@@ -90,9 +88,8 @@ def draft_projects_week():
                    project.id, short_name, project.name,
                    owner_id, "user".name AS u_name, "user".email_addr
                    FROM project, "user"
-                   WHERE TO_DATE(project.created,
-                                'YYYY-MM-DD\THH24:MI:SS.US') >= now() -
-                                ('1 week')::INTERVAL
+                   WHERE project.created >= to_char(
+                       NOW() - ('1 week')::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                    AND "user".id = project.owner_id
                    AND project.published = false
                    GROUP BY project.id, "user".name, "user".email_addr;''')
@@ -111,9 +108,8 @@ def published_projects_week():
                    project.id, project.short_name, project.name,
                    owner_id, "user".name AS u_name, "user".email_addr
                    FROM auditlog, project, "user"
-                   WHERE TO_DATE(auditlog.created,
-                                'YYYY-MM-DD\THH24:MI:SS.US') >= now() -
-                                ('1 week')::INTERVAL
+                   WHERE auditlog.created >= to_char(
+                       NOW() - ('1 week')::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                    AND "user".id = project.owner_id
                    AND project.owner_id = auditlog.user_id
                    AND auditlog.project_id = project.id
@@ -134,9 +130,8 @@ def update_projects_week():
                    project.id, short_name, project.name,
                    owner_id, "user".name AS u_name, "user".email_addr
                    FROM project, "user"
-                   WHERE TO_DATE(project.updated,
-                                'YYYY-MM-DD\THH24:MI:SS.US') >= now() -
-                                ('1 week')::INTERVAL
+                   WHERE project.updated >= to_char(
+                       NOW() - ('1 week')::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                    AND "user".id = project.owner_id
                    GROUP BY project.id, "user".name, "user".email_addr;''')
         db.session.execute(sql)
@@ -153,9 +148,8 @@ def new_tasks_week():
                       SELECT TO_DATE(task.created,
                                      'YYYY-MM-DD\THH24:MI:SS.US') AS day,
                       COUNT(task.id) AS day_tasks
-                      FROM task WHERE TO_DATE(task.created,
-                                              'YYYY-MM-DD\THH24:MI:SS.US')
-                                          >= now() - ('1 week'):: INTERVAL
+                      FROM task WHERE task.created >= to_char(
+                          NOW() - ('1 week')::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                       GROUP BY day ORDER BY day ASC;''')
         db.session.execute(sql)
         db.session.commit()
@@ -168,13 +162,12 @@ def new_task_runs_week():
         return _refresh_materialized_view('dashboard_week_new_task_run')
     else:
         sql = text('''CREATE MATERIALIZED VIEW dashboard_week_new_task_run AS
-                      SELECT TO_DATE(task_run.finish_time,
-                                     'YYYY-MM-DD\THH24:MI:SS.US') AS day,
-                      COUNT(task_run.id) AS day_task_runs
-                      FROM task_run WHERE TO_DATE(task_run.finish_time,
-                                              'YYYY-MM-DD\THH24:MI:SS.US')
-                                          >= now() - ('1 week'):: INTERVAL
-                      GROUP BY day;''')
+                      SELECT TO_DATE(contribution_rollup.day, 'YYYY-MM-DD')
+                      AS day, SUM(n_task_runs) AS day_task_runs
+                      FROM contribution_rollup
+                      WHERE contribution_rollup.day >= to_char(
+                          NOW() - ('1 week')::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
+                      GROUP BY contribution_rollup.day;''')
         db.session.execute(sql)
         db.session.commit()
         return "Materialized view created"
@@ -189,9 +182,8 @@ def new_users_week():
                       SELECT TO_DATE("user".created,
                                      'YYYY-MM-DD\THH24:MI:SS.US') AS day,
                       COUNT("user".id) AS day_users
-                      FROM "user" WHERE TO_DATE("user".created,
-                                              'YYYY-MM-DD\THH24:MI:SS.US')
-                                          >= now() - ('1 week'):: INTERVAL
+                      FROM "user" WHERE "user".created >= to_char(
+                          NOW() - ('1 week')::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                       GROUP BY day;''')
         db.session.execute(sql)
         db.session.commit()
@@ -208,9 +200,9 @@ def returning_users_week():
                     SELECT user_id, TO_DATE(task_run.finish_time,
                     'YYYY-MM-DD\THH24:MI:SS.US') AS day
                    FROM task_run
-                   WHERE TO_DATE(task_run.finish_time,
-                   'YYYY-MM-DD\THH24:MI:SS.US') >= NOW()
-                   - ('1 week')::INTERVAL GROUP BY day, task_run.user_id)
+                   WHERE task_run.finish_time >= to_char(
+                       NOW() - ('1 week')::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
+                   GROUP BY day, task_run.user_id)
                    SELECT user_id, COUNT(user_id) AS n_days
                    FROM data GROUP BY user_id HAVING(count(user_id) > 1)
                    ORDER by n_days;
@@ -64,10 +64,40 @@ REDIS_DB = 0
 
 REDIS_KEYPREFIX = 'pybossa_cache'
 
+# Cache backend: redis, memory (single process installs) or null
+CACHE_BACKEND = 'redis'
+CACHE_MEMORY_SIZE = 10000
+
+# In process cache in front of Redis (0 disables it)
+LOCAL_CACHE_SIZE = 0
+LOCAL_CACHE_TIMEOUT = 30
+
+# Codec of the cached values: pickle or zpickle (compressed above the
+# threshold, in bytes)
+CACHE_CODEC = 'zpickle'
+CACHE_COMPRESS_THRESHOLD = 1024
+
+# Count hits, misses, recompute time and size of the cached functions
+# (shown in /admin/cache/), adding them up in Redis every interval seconds
+CACHE_METRICS = False
+CACHE_METRICS_FLUSH_INTERVAL = 60
+
+# Count the volunteers of the projects and the site with Redis HyperLogLogs
+# (standard error of 0.81%) instead of COUNT(DISTINCT) queries
+VOLUNTEERS_HLL = False
+
+# Rank the users with a Redis sorted set kept up to date as task runs are
+# saved, instead of ranking every user from the task_run table
+LEADERBOARD_SORTED_SET = False
+
+# Locations of IP addresses kept in memory by every process
+GEOIP_CACHE_SIZE = 10000
+
 ## Default cache timeouts
 # Project cache
 AVATAR_TIMEOUT = 30 * 24 * 60 * 60
 APP_TIMEOUT = 15 * 60
+PROJECT_COUNTERS_TIMEOUT = 24 * 60 * 60
 REGISTERED_USERS_TIMEOUT = 15 * 60
 ANON_USERS_TIMEOUT = 5 * 60 * 60
 STATS_FRONTPAGE_TIMEOUT = 12 * 60 * 60
@@ -115,6 +145,21 @@ WEEKLY_UPDATE_STATS = 'Sunday'
 # Enable Server Sent Events
 SSE = False
 
+# Serve tasks from Redis pools of open tasks per project (sorted by priority
+# and by number of answers) instead of scanning the task and task_run tables
+# on every request
+SCHED_TASK_POOL = False
+
+# Lease the missing answers of a task to the volunteers that request it, so
+# the schedulers skip tasks that already have enough volunteers working on them
+SCHED_TASK_LEASES = False
+# Seconds a volunteer keeps the lease of a requested task
+TASK_LEASE_TIMEOUT = 10 * 60
+
+# Keep Redis bitmaps of the tasks every user has answered, so the schedulers
+# and the available tasks counters do not query task_run for every request
+SCHED_ANSWERED_BITMAPS = False
+
 # Pro user features. False will make the feature available to all regular users,
 # while True will make it available only to pro users
 PRO_FEATURES = {
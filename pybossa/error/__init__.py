@@ -48,7 +48,8 @@ class ErrorStatus(object):
                     "DataError": 415,
                     "AttributeError": 415,
                     "DBIntegrityError": 415,
-                    "TooManyRequests": 429}
+                    "TooManyRequests": 429,
+                    "ServiceUnavailable": 503}
 
     def format_exception(self, e, target, action):
         """
@@ -62,7 +63,8 @@ class ErrorStatus(object):
             status = self.error_status.get(exception_cls)
         else: # pragma: no cover
             status = 500
-        if exception_cls in ('BadRequest', 'Forbidden','Unauthorized'):
+        if exception_cls in ('BadRequest', 'Forbidden','Unauthorized',
+                             'ServiceUnavailable'):
             e.message = e.description
         error = dict(action=action.upper(),
                      status="failed",
@@ -32,13 +32,14 @@ The objects are:
     * csrf: for CSRF protection
     * newsletter: for subscribing users to Mailchimp newsletter
     * assets: for assets management (SASS, etc.)
+    * geolocator: for the locations of IP addresses
 
 """
 __all__ = ['sentinel', 'db', 'signer', 'mail', 'login_manager', 'facebook',
            'twitter', 'google', 'misaka', 'babel', 'uploader', 'debug_toolbar',
            'csrf', 'timeouts', 'ratelimits', 'user_repo', 'project_repo',
            'task_repo', 'blog_repo', 'auditlog_repo', 'newsletter', 'importer',
-           'flickr', 'plugin_manager', 'assets']
+           'flickr', 'plugin_manager', 'assets', 'geolocator']
 
 # CACHE
 from pybossa.sentinel import Sentinel
@@ -123,3 +124,7 @@ plugin_manager = PluginManager()
 
 from flask.ext.assets import Environment
 assets = Environment()
+
+# Geolocation of IP addresses
+from pybossa.geolocation import GeoLocator
+geolocator = GeoLocator()
@@ -0,0 +1,81 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Locations (latitude, longitude, etc.) of IP addresses.
+
+The GeoLite City database is opened once per process, memory mapped, and
+the locations of the most recently resolved IP addresses are kept in a
+bounded LRU cache.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import pygeoip
+
+
+class GeoLocator(object):
+
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = False
+        self.max_size = 10000
+        self._reader = None
+        self._lock = threading.Lock()
+        self._locations = OrderedDict()
+        if app is not None:  # pragma: no cover
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = os.path.join(app.root_path, '..', 'dat',
+                                 'GeoLiteCity.dat')
+        self.enabled = os.path.exists(self.path)
+        self.max_size = app.config['GEOIP_CACHE_SIZE']
+        self._reader = None
+        self.clear()
+
+    def location(self, ip):
+        """Return the location of an IP address, with latitude and longitude
+        0 if it is unknown."""
+        with self._lock:
+            location = self._locations.pop(ip, None)
+            if location is not None:
+                self._locations[ip] = location
+        if location is None:
+            location = self._lookup(ip) or dict(latitude=0, longitude=0)
+            with self._lock:
+                self._locations[ip] = location
+                while len(self._locations) > self.max_size:
+                    self._locations.popitem(last=False)
+        return dict(location)
+
+    def clear(self):
+        with self._lock:
+            self._locations.clear()
+
+    def _lookup(self, ip):
+        if not self.enabled:
+            return None
+        return self._get_reader().record_by_addr(ip)
+
+    def _get_reader(self):
+        if self._reader is None:
+            with self._lock:
+                if self._reader is None:
+                    self._reader = pygeoip.GeoIP(self.path,
+                                                 pygeoip.MMAP_CACHE)
+        return self._reader
@@ -116,9 +116,11 @@ def get_periodic_jobs(queue):
         if queue == 'quaterly' else []
     dashboard_jobs = get_dashboard_jobs() if queue == 'low' else []
     weekly_update_jobs = get_weekly_stats_update_projects() if queue == 'low' else []
+    volunteer_jobs = get_volunteer_counter_jobs() if queue == 'low' else []
+    leaderboard_jobs = get_leaderboard_jobs() if queue == 'low' else []
     _all = [zip_jobs, jobs, project_jobs, autoimport_jobs,
             engage_jobs, non_contrib_jobs, dashboard_jobs,
-            weekly_update_jobs]
+            weekly_update_jobs, volunteer_jobs, leaderboard_jobs]
     return (job for sublist in _all for job in sublist if job['queue'] == queue)
 
 
@@ -176,6 +178,30 @@ def get_project_jobs(queue='super'):
                             queue=queue)
 
 
+def get_volunteer_counter_jobs(queue='low'):
+    """Return the jobs loading the volunteer HyperLogLogs of the site and
+    of every project from the task runs (if VOLUNTEERS_HLL is enabled)."""
+    from sqlalchemy.sql import text
+    from pybossa.core import db
+    if not current_app.config.get('VOLUNTEERS_HLL'):
+        return
+    yield dict(name=load_volunteer_counters, args=[None], kwargs={},
+               timeout=(30 * MINUTE), queue=queue)
+    sql = text('''SELECT id FROM project''')
+    for row in db.slave_session.execute(sql):
+        yield dict(name=load_volunteer_counters, args=[row.id], kwargs={},
+                   timeout=(10 * MINUTE), queue=queue)
+
+
+def get_leaderboard_jobs(queue='low'):
+    """Return the job loading the Redis leaderboard from the task runs (if
+    LEADERBOARD_SORTED_SET is enabled)."""
+    if not current_app.config.get('LEADERBOARD_SORTED_SET'):
+        return
+    yield dict(name=load_leaderboard, args=[], kwargs={},
+               timeout=(30 * MINUTE), queue=queue)
+
+
 def create_dict_jobs(data, function, timeout=(10 * MINUTE), queue='low'):
     """Create a dict job."""
     for d in data:
@@ -196,11 +222,11 @@ def get_inactive_users_jobs(queue='quaterly'):
                WHERE user_id IS NOT NULL
                AND user_id NOT IN
                (SELECT user_id FROM task_run WHERE user_id IS NOT NULL
-               AND to_date(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-               >= NOW() - '3 month'::INTERVAL
+               AND task_run.finish_time >= to_char(
+                   NOW() - '3 month'::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                GROUP BY task_run.user_id order by user_id)
-               AND to_date(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-               >= NOW() - '1 year'::INTERVAL
+               AND task_run.finish_time >= to_char(
+                   NOW() - '1 year'::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                GROUP BY user_id ORDER BY user_id;''')
     results = db.slave_session.execute(sql)
     for row in results:
@@ -326,6 +352,55 @@ def get_project_stats(_id, short_name):  # pragma: no cover
     stats.get_stats(_id, current_app.config.get('GEO'))
 
 
+def load_volunteer_counters(project_id):
+    """Load the volunteer HyperLogLogs of a project (or of the whole site if
+    project_id is None) with the exact volunteers in the task_run table."""
+    from sqlalchemy.sql import text
+    from pybossa.core import db, sentinel
+    from pybossa.volunteer_counter import (VolunteerCounter, SITE,
+                                           project_scope)
+    if project_id is None:
+        scope = SITE
+        where = 'TRUE'
+    else:
+        scope = project_scope(project_id)
+        where = 'project_id=:project_id'
+    params = dict(project_id=project_id)
+    sql = text('''SELECT DISTINCT user_id FROM task_run
+               WHERE user_id IS NOT NULL AND %s''' % where)
+    user_ids = (row.user_id for row in db.slave_session.execute(sql, params))
+    sql = text('''SELECT DISTINCT user_ip FROM task_run
+               WHERE user_ip IS NOT NULL AND user_id IS NULL AND %s''' % where)
+    user_ips = (row.user_ip for row in db.slave_session.execute(sql, params))
+    VolunteerCounter(sentinel.master).load(scope, user_ids, user_ips)
+    return True
+
+
+def load_leaderboard():
+    """Load the Redis leaderboard with the number of task runs of every
+    user in the task_run table."""
+    from sqlalchemy.sql import text
+    from pybossa.core import db, sentinel
+    from pybossa.leaderboard import Leaderboard
+    sql = text('''SELECT user_id, COUNT(*) AS score FROM task_run
+               WHERE user_id IS NOT NULL GROUP BY user_id''')
+    scores = ((row.user_id, row.score)
+              for row in db.slave_session.execute(sql))
+    Leaderboard(sentinel.master).load(scores)
+    return True
+
+
+def rebuild_alias_table(project_id):
+    """Build again the weighted random table of a project, so it samples
+    its new tasks and priorities."""
+    from pybossa.core import sentinel
+    from pybossa.sched import load_alias_table
+    from pybossa.task_pool import PriorityAliasTable
+    table = PriorityAliasTable(sentinel.master)
+    table.start_rebuild(project_id)
+    return load_alias_table(table, project_id)
+
+
 @with_cache_disabled
 def warm_up_stats():  # pragma: no cover
     """Background job for warming stats."""
@@ -409,8 +484,8 @@ def get_non_updated_projects():
     from sqlalchemy.sql import text
     from pybossa.model.project import Project
     from pybossa.core import db
-    sql = text('''SELECT id FROM project WHERE TO_DATE(updated,
-                'YYYY-MM-DD\THH24:MI:SS.US') <= NOW() - '3 month':: INTERVAL
+    sql = text('''SELECT id FROM project WHERE updated < to_char(
+                NOW() - '3 month'::INTERVAL + '1 day'::INTERVAL, 'YYYY-MM-DD')
                AND contacted != True AND published = True
                AND project.id NOT IN
                (SELECT task.project_id FROM task
@@ -0,0 +1,79 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+import json
+
+
+class LastAnswers(object):
+
+    """Latest answer (task run info) given to every task of a project.
+
+    Answers of a project are stored in a Redis hash with the task ids as
+    fields, so the answers of several tasks are read with one HMGET and all
+    of them can be dropped at once. Tasks without answers are stored as None.
+    The hash expires ANSWERS_TTL after it is created (writes do not extend
+    it), and it is dropped if it grows beyond MAX_ANSWERS tasks.
+    """
+
+    KEY_PREFIX = 'pybossa:last_answers:project:%s'
+    ANSWERS_TTL = 24 * 60 * 60
+    MAX_ANSWERS = 10000
+
+    def __init__(self, redis_conn):
+        self.conn = redis_conn
+
+    def set(self, project_id, task_id, info):
+        key = self.KEY_PREFIX % project_id
+        pipeline = self.conn.pipeline()
+        pipeline.hset(key, task_id, json.dumps(info))
+        self._execute_bounded(pipeline, key)
+
+    def set_missing(self, project_id, answers):
+        """Store a dict of task ids and answers, without overwriting the
+        answers stored in the meantime."""
+        if not answers:
+            return
+        key = self.KEY_PREFIX % project_id
+        pipeline = self.conn.pipeline()
+        for task_id, info in answers.iteritems():
+            pipeline.hsetnx(key, task_id, json.dumps(info))
+        self._execute_bounded(pipeline, key)
+
+    def get_many(self, project_id, task_ids):
+        """Return a dict with the cached answer of the given tasks (tasks
+        not in the cache are left out)."""
+        if not task_ids:
+            return {}
+        answers = self.conn.hmget(self.KEY_PREFIX % project_id, task_ids)
+        return dict((task_id, json.loads(answer))
+                    for task_id, answer in zip(task_ids, answers)
+                    if answer is not None)
+
+    def delete(self, project_id, task_id):
+        self.conn.hdel(self.KEY_PREFIX % project_id, task_id)
+
+    def reset(self, project_id):
+        self.conn.delete(self.KEY_PREFIX % project_id)
+
+    def _execute_bounded(self, pipeline, key):
+        pipeline.ttl(key)
+        pipeline.hlen(key)
+        ttl, size = pipeline.execute()[-2:]
+        if size > self.MAX_ANSWERS:
+            self.conn.delete(key)
+        elif ttl is None or ttl < 0:
+            self.conn.expire(key, self.ANSWERS_TTL)
@@ -0,0 +1,123 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Leaderboard of the users, as a Redis sorted set.
+
+The score of a user is the number of task runs they have submitted. Task runs
+are added as they are saved, but the leaderboard is only read once it has
+been loaded from the task_run table (see jobs.load_leaderboard), which also
+puts right any score that drifted in the meantime.
+"""
+
+
+def _score(value):
+    return int(float(value))
+
+
+class Leaderboard(object):
+
+    KEY = 'pybossa:leaderboard'
+    LOADED_KEY = 'pybossa:leaderboard:loaded'
+    LOAD_CHUNK = 1000
+
+    def __init__(self, redis_conn):
+        self.conn = redis_conn
+
+    def add(self, user_id, amount=1):
+        """Add amount to the score of a user, dropping the user from the
+        leaderboard if no task runs are left."""
+        if user_id is None:
+            return
+        score = self.conn.zincrby(self.KEY, user_id, amount)
+        if score <= 0:
+            self.conn.zrem(self.KEY, user_id)
+
+    def subtract(self, scores):
+        """Subtract the given (user_id, score) pairs from the scores of the
+        users, dropping the users left without task runs."""
+        pipeline = self.conn.pipeline()
+        for user_id, score in scores:
+            pipeline.zincrby(self.KEY, user_id, -score)
+        pipeline.zremrangebyscore(self.KEY, '-inf', 0)
+        pipeline.execute()
+
+    def is_loaded(self):
+        return self.conn.exists(self.LOADED_KEY)
+
+    def top(self, n):
+        """Return (user_id, rank, score) for the n users with the highest
+        scores, or None if the leaderboard is not loaded. Users with the same
+        score share their rank, as with the SQL rank() function."""
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.exists(self.LOADED_KEY)
+        pipeline.zrevrange(self.KEY, 0, max(n, 1) - 1, withscores=True,
+                           score_cast_func=_score)
+        loaded, members = pipeline.execute()
+        if not loaded:
+            return None
+        top = []
+        for position, (user_id, score) in enumerate(members[:n]):
+            if top and top[-1][2] == score:
+                rank = top[-1][1]
+            else:
+                rank = position + 1
+            top.append((int(user_id), rank, score))
+        return top
+
+    def rank_and_score(self, user_id):
+        """Return a dict with the rank and score of a user (both None if the
+        user has no task runs), or None if the leaderboard is not loaded."""
+        pipeline = self.conn.pipeline(transaction=False)
+        pipeline.exists(self.LOADED_KEY)
+        pipeline.zscore(self.KEY, user_id)
+        loaded, score = pipeline.execute()
+        if not loaded:
+            return None
+        if score is None:
+            return dict(rank=None, score=None)
+        # Rank after the users with a higher score, so ties share their rank
+        higher = self.conn.zcount(self.KEY, '(%s' % score, '+inf')
+        return dict(rank=higher + 1, score=_score(score))
+
+    def load(self, scores):
+        """Replace the leaderboard with the given (user_id, score) pairs.
+
+        The leaderboard is built aside and renamed, so it can be read
+        meanwhile.
+        """
+        tmp_key = '%s:loading' % self.KEY
+        pipeline = self.conn.pipeline()
+        pipeline.delete(tmp_key)
+        chunk = []
+        empty = True
+        for user_id, score in scores:
+            chunk.extend((score, user_id))
+            if len(chunk) >= 2 * self.LOAD_CHUNK:
+                pipeline.zadd(tmp_key, *chunk)
+                chunk = []
+            empty = False
+        if chunk:
+            pipeline.zadd(tmp_key, *chunk)
+        if empty:
+            pipeline.delete(self.KEY)
+        else:
+            pipeline.rename(tmp_key, self.KEY)
+        pipeline.set(self.LOADED_KEY, 1)
+        pipeline.execute()
+
+    def reset(self):
+        self.conn.delete(self.LOADED_KEY, self.KEY)
@@ -0,0 +1,119 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+from sqlalchemy import Integer, Boolean, Text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.sql import text
+
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+# Day ('YYYY-MM-DD'), hour and kind of volunteer of the task_run rows
+BUCKET = '''LEFT(task_run.finish_time, 10) AS day,
+         CAST(COALESCE(NULLIF(SUBSTRING(task_run.finish_time FROM 12 FOR 2),
+                              ''), '0') AS INTEGER) AS hour,
+         task_run.user_id IS NULL AS anonymous'''
+
+
+class ContributionRollup(db.Model, DomainObject):
+
+    """Task runs of a project per hour, kept up to date by the model event
+    listeners in the same transaction as the task runs."""
+
+    __tablename__ = 'contribution_rollup'
+
+    #: Project.id of the project
+    project_id = Column(Integer, ForeignKey('project.id', ondelete='CASCADE'),
+                        primary_key=True)
+    #: Day (YYYY-MM-DD) of the finish_time of the task runs
+    day = Column(Text, primary_key=True)
+    #: Hour of the finish_time of the task runs
+    hour = Column(Integer, primary_key=True)
+    #: If the task runs are from anonymous users
+    anonymous = Column(Boolean, primary_key=True)
+    #: Number of task runs
+    n_task_runs = Column(Integer, nullable=False, default=0)
+    #: Number of tasks whose latest task run is in this hour
+    n_answered_tasks = Column(Integer, nullable=False, default=0)
+
+
+def add_to_rollup(conn, project_id, bucket, n_task_runs, n_answered_tasks):
+    """Add to the counts of the rollup row of a bucket (a row with day, hour
+    and anonymous), creating it if it is missing."""
+    params = dict(project_id=project_id, day=bucket.day, hour=bucket.hour,
+                  anonymous=bucket.anonymous, n_task_runs=n_task_runs,
+                  n_answered_tasks=n_answered_tasks)
+    update = text('''UPDATE contribution_rollup
+                  SET n_task_runs=n_task_runs + :n_task_runs,
+                  n_answered_tasks=n_answered_tasks + :n_answered_tasks
+                  WHERE project_id=:project_id AND day=:day AND hour=:hour
+                  AND anonymous=:anonymous''')
+    if conn.execute(update, params).rowcount > 0:
+        return
+    insert = text('''INSERT INTO contribution_rollup (project_id, day, hour,
+                  anonymous, n_task_runs, n_answered_tasks)
+                  VALUES (:project_id, :day, :hour, :anonymous, :n_task_runs,
+                  :n_answered_tasks)''')
+    savepoint = conn.begin_nested()
+    try:
+        conn.execute(insert, params)
+        savepoint.commit()
+    except IntegrityError:
+        # Another transaction created the row meanwhile
+        savepoint.rollback()
+        conn.execute(update, params)
+
+
+def task_run_bucket(conn, finish_time, user_id):
+    """Return the bucket of a task run with the given finish_time and
+    user_id, as BUCKET computes it for the task_run rows."""
+    sql = text('''SELECT %s FROM
+               (SELECT CAST(:finish_time AS TEXT) AS finish_time,
+                CAST(:user_id AS INTEGER) AS user_id) AS task_run''' % BUCKET)
+    return conn.execute(sql, dict(finish_time=finish_time,
+                                  user_id=user_id)).first()
+
+
+def latest_bucket(conn, task_id):
+    """Return the bucket of the latest task run of a task, or None."""
+    sql = text('''SELECT %s FROM task_run WHERE task_run.task_id=:task_id
+               ORDER BY task_run.finish_time DESC, task_run.id DESC
+               LIMIT 1''' % BUCKET)
+    return conn.execute(sql, dict(task_id=task_id)).first()
+
+
+def refresh_contribution_rollup(conn, project_id):
+    """Compute again the rollup rows of a project from its task runs (conn
+    is a connection or a session)."""
+    conn.execute(text('''DELETE FROM contribution_rollup
+                      WHERE project_id=:project_id'''),
+                 dict(project_id=project_id))
+    sql = text('''
+               INSERT INTO contribution_rollup (project_id, day, hour,
+               anonymous, n_task_runs, n_answered_tasks)
+               SELECT :project_id, day, hour, anonymous, COUNT(*),
+               COUNT(CASE WHEN last = 1 THEN 1 END)
+               FROM (SELECT %s,
+                     ROW_NUMBER() OVER (PARTITION BY task_id
+                                        ORDER BY finish_time DESC, id DESC)
+                     AS last
+                     FROM task_run WHERE project_id=:project_id) AS task_runs
+               GROUP BY day, hour, anonymous;
+               ''' % BUCKET)
+    conn.execute(sql, dict(project_id=project_id))
@@ -17,8 +17,11 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 from datetime import datetime
 
+from flask import current_app
 from rq import Queue
-from sqlalchemy import event
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.sql import text
 
 from pybossa.feed import update_feed
 from pybossa.model import update_project_timestamp, update_target_timestamp
@@ -30,12 +33,46 @@ from pybossa.model.task_run import TaskRun
 from pybossa.model.webhook import Webhook
 from pybossa.model.user import User
 from pybossa.model.result import Result
+from pybossa.model.project_stats import refresh_project_stats
+from pybossa.model.contribution_rollup import (BUCKET, add_to_rollup,
+                                               task_run_bucket, latest_bucket)
 from pybossa.core import result_repo
-from pybossa.jobs import webhook, notify_blog_users
+from pybossa.jobs import webhook, notify_blog_users, rebuild_alias_table
 from pybossa.core import sentinel
+from pybossa.task_pool import TaskPool, AnswersPool, PriorityAliasTable
+from pybossa.contributions_guard import TaskLeases
+from pybossa.answered_tasks import AnsweredTasks
+from pybossa.last_answers import LastAnswers
+from pybossa.volunteer_counter import VolunteerCounter
+from pybossa.leaderboard import Leaderboard
+import pybossa.cache.projects as cached_projects
 
 webhook_queue = Queue('high', connection=sentinel.master)
 mail_queue = Queue('super', connection=sentinel.master)
+sched_queue = Queue('medium', connection=sentinel.master)
+
+AFTER_COMMIT = 'after_commit'
+LATEST_BUCKETS = 'latest_buckets'
+
+
+def after_commit(target, function, *args):
+    """Call function with args once the session of target commits, so the
+    caches in Redis only see committed changes. The call is dropped if the
+    session rolls back."""
+    session = object_session(target)
+    session.info.setdefault(AFTER_COMMIT, []).append((function, args))
+
+
+@event.listens_for(Session, 'after_commit')
+def run_after_commit(session):
+    for function, args in session.info.pop(AFTER_COMMIT, []):
+        function(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def drop_after_commit(session):
+    session.info.pop(AFTER_COMMIT, None)
+    session.info.pop(LATEST_BUCKETS, None)
 
 
 @event.listens_for(Blogpost, 'after_insert')
@@ -70,6 +107,30 @@ def add_project_event(mapper, conn, target):
     update_feed(obj)
 
 
+@event.listens_for(Project, 'after_insert')
+def add_project_stats(mapper, conn, target):
+    """Create the stats row of a new project."""
+    sql_query = text('''INSERT INTO project_stats (project_id, n_tasks,
+                     n_completed_tasks, n_answers, n_task_runs, n_results,
+                     contribution_time, n_timed_task_runs)
+                     VALUES (:project_id, 0, 0, 0, 0, 0, 0, 0)''')
+    conn.execute(sql_query, dict(project_id=target.id))
+
+
+def update_project_stats(conn, project_id, sql_query, **params):
+    """Run an UPDATE of the stats row of a project, computing the row again
+    if it is missing."""
+    params['project_id'] = project_id
+    if conn.execute(text(sql_query), params).rowcount == 0:
+        refresh_project_stats(conn, project_id)
+
+
+def previous_value(target, attr):
+    """Return the value an attribute of target had before the flush."""
+    history = getattr(inspect(target).attrs, attr).history
+    return history.deleted[0] if history.deleted else getattr(target, attr)
+
+
 @event.listens_for(Task, 'after_insert')
 def add_task_event(mapper, conn, target):
     """Update PyBossa feed with new task."""
@@ -88,6 +149,60 @@ def add_task_event(mapper, conn, target):
     update_feed(obj)
 
 
+def add_task_stats(conn, project_id, n_tasks, n_completed_tasks, n_answers):
+    """Add to the task counters in the stats of a project."""
+    sql_query = '''UPDATE project_stats SET n_tasks=n_tasks + :n_tasks,
+                n_completed_tasks=n_completed_tasks + :n_completed_tasks,
+                n_answers=n_answers + :n_answers
+                WHERE project_id=:project_id'''
+    update_project_stats(conn, project_id, sql_query, n_tasks=n_tasks,
+                         n_completed_tasks=n_completed_tasks,
+                         n_answers=n_answers)
+
+
+@event.listens_for(Task, 'after_insert')
+def count_task_stats(mapper, conn, target):
+    """Count the task in the stats of its project."""
+    add_task_stats(conn, target.project_id, 1,
+                   int(target.state == 'completed'), target.n_answers or 0)
+
+
+@event.listens_for(Task, 'after_update')
+def update_task_stats(mapper, conn, target):
+    """Move the state and n_answers of the task in the stats of its
+    project."""
+    project_id = previous_value(target, 'project_id')
+    completed = int(previous_value(target, 'state') == 'completed')
+    n_answers = previous_value(target, 'n_answers') or 0
+    new_completed = int(target.state == 'completed')
+    new_n_answers = target.n_answers or 0
+    if project_id != target.project_id:
+        add_task_stats(conn, project_id, -1, -completed, -n_answers)
+        add_task_stats(conn, target.project_id, 1, new_completed,
+                       new_n_answers)
+    elif (completed, n_answers) != (new_completed, new_n_answers):
+        add_task_stats(conn, project_id, 0, new_completed - completed,
+                       new_n_answers - n_answers)
+
+
+@event.listens_for(Task, 'before_delete')
+def remove_task_stats(mapper, conn, target):
+    """Take the task, and its results (deleted by the database with it),
+    out of the stats of its project."""
+    project_id = previous_value(target, 'project_id')
+    add_task_stats(conn, project_id, -1,
+                   -int(previous_value(target, 'state') == 'completed'),
+                   -(previous_value(target, 'n_answers') or 0))
+    sql_query = text('''SELECT COUNT(id) FROM result WHERE task_id=:task_id
+                     AND info IS NOT NULL AND cast(info AS TEXT) != 'null'
+                     AND cast(info AS TEXT) != ''''')
+    n_results = conn.execute(sql_query, dict(task_id=target.id)).scalar()
+    if n_results:
+        sql_query = '''UPDATE project_stats SET n_results=n_results - :n
+                    WHERE project_id=:project_id'''
+        update_project_stats(conn, project_id, sql_query, n=n_results)
+
+
 @event.listens_for(User, 'after_insert')
 def add_user_event(mapper, conn, target):
     """Update PyBossa feed with new user."""
@@ -123,9 +238,10 @@ def is_task_completed(conn, task_id):
 
 
 def update_task_state(conn, task_id):
+    """Mark a task as completed, returning False if it already was."""
     sql_query = ("UPDATE task SET state=\'completed\' \
-                 where id=%s") % task_id
-    conn.execute(sql_query)
+                 where id=%s and state IS DISTINCT FROM \'completed\'") % task_id
+    return conn.execute(sql_query).rowcount > 0
 
 
 def push_webhook(project_obj, task_id, result_id):
@@ -199,11 +315,343 @@ def on_taskrun_submit(mapper, conn, target):
         project_obj['id'] = target.project_id
 
     add_user_contributed_to_feed(conn, target.user_id, project_obj)
+    task_pools = current_app.config.get('SCHED_TASK_POOL')
+    if task_pools:
+        after_commit(target, AnswersPool(sentinel.master).increment,
+                     target.project_id, target.task_id)
+    user = dict(user_id=target.user_id, user_ip=target.user_ip)
+    if current_app.config.get('SCHED_TASK_LEASES'):
+        TaskLeases(sentinel.master).release(target.task_id, user)
+    if current_app.config.get('SCHED_ANSWERED_BITMAPS'):
+        after_commit(target, AnsweredTasks(sentinel.master).add,
+                     target.project_id, user, target.task_id)
+    sched = (project_obj['info'] or {}).get('sched')
+    if sched == 'incremental':
+        after_commit(target, LastAnswers(sentinel.master).set,
+                     target.project_id, target.task_id, target.info)
+    after_commit(target, cached_projects.add_task_run, target.project_id,
+                 target.finish_time)
+    if current_app.config.get('VOLUNTEERS_HLL'):
+        after_commit(target, VolunteerCounter(sentinel.master).add,
+                     target.project_id, target.user_id, target.user_ip)
+    elif target.user_id is None:
+        after_commit(target, cached_projects.delete_n_anonymous_volunteers,
+                     target.project_id)
+    else:
+        after_commit(target, cached_projects.delete_n_registered_volunteers,
+                     target.project_id)
+    if current_app.config.get('LEADERBOARD_SORTED_SET'):
+        after_commit(target, Leaderboard(sentinel.master).add, target.user_id)
+    add_task_run_stats(conn, target.project_id, 1,
+                       new=task_run_values(target))
+    add_task_run_rollup(conn, target)
     if is_task_completed(conn, target.task_id) and project_obj['published']:
-        update_task_state(conn, target.task_id)
+        if update_task_state(conn, target.task_id):
+            after_commit(target, cached_projects.complete_task,
+                         target.project_id)
+            sql_query = '''UPDATE project_stats
+                        SET n_completed_tasks=n_completed_tasks + 1
+                        WHERE project_id=:project_id'''
+            update_project_stats(conn, target.project_id, sql_query)
         update_feed(project_obj)
         result_id = create_result(conn, target.project_id, target.task_id)
         push_webhook(project_obj, target.task_id, result_id)
+        if task_pools:
+            after_commit(target, remove_from_task_pools, target.project_id,
+                         target.task_id)
+        if sched == 'weighted_random':
+            after_commit(target, PriorityAliasTable(sentinel.master).remove,
+                         target.project_id, target.task_id)
+        if sched == 'incremental':
+            # Only open tasks are served with their last answer
+            after_commit(target, LastAnswers(sentinel.master).delete,
+                         target.project_id, target.task_id)
+
+
+# Seconds spent on the added (new_) or removed (old_) task run, or NULL
+CONTRIBUTION_TIME = '''EXTRACT(EPOCH FROM
+    to_timestamp(:%(prefix)sfinish_time, 'YYYY-MM-DD-THH24-MI-SS.US') -
+    to_timestamp(:%(prefix)screated, 'YYYY-MM-DD-THH24-MI-SS.US'))'''
+
+
+def add_task_run_stats(conn, project_id, n_task_runs, new=None, old=None):
+    """Add n_task_runs to the task runs in the stats of a project, counting
+    the contribution time and finish_time of the new task run and taking out
+    those of the old one (new and old are TaskRun values, or None).
+
+    last_activity is only computed again if the old task run was the latest
+    one."""
+    new_time = CONTRIBUTION_TIME % {'prefix': 'new_'}
+    old_time = CONTRIBUTION_TIME % {'prefix': 'old_'}
+    sql_query = '''UPDATE project_stats
+                SET n_task_runs=n_task_runs + :n_task_runs,
+                contribution_time=contribution_time + COALESCE(%s, 0)
+                - COALESCE(%s, 0),
+                n_timed_task_runs=n_timed_task_runs
+                + (CASE WHEN %s IS NULL THEN 0 ELSE 1 END)
+                - (CASE WHEN %s IS NULL THEN 0 ELSE 1 END),
+                last_activity=CASE
+                WHEN :old_finish_time IS NULL
+                OR last_activity > :old_finish_time
+                THEN GREATEST(last_activity, :new_finish_time)
+                ELSE (SELECT MAX(finish_time) FROM task_run
+                      WHERE project_id=:project_id) END
+                WHERE project_id=:project_id''' % (new_time, old_time,
+                                                   new_time, old_time)
+    params = dict(n_task_runs=n_task_runs)
+    for prefix, values in (('new_', new), ('old_', old)):
+        for attr in ('created', 'finish_time'):
+            params[prefix + attr] = values[attr] if values else None
+    update_project_stats(conn, project_id, sql_query, **params)
+
+
+def task_run_values(target, previous=False):
+    """Return the values of a task run used by its project stats."""
+    value = previous_value if previous else getattr
+    return dict((attr, value(target, attr))
+                for attr in ('project_id', 'created', 'finish_time'))
+
+
+@event.listens_for(TaskRun, 'after_update')
+def update_task_run_stats(mapper, conn, target):
+    """Move the contribution time and finish_time of the task run in the
+    stats of its project."""
+    old = task_run_values(target, previous=True)
+    new = task_run_values(target)
+    if old == new:
+        return
+    if old['project_id'] != new['project_id']:
+        add_task_run_stats(conn, old['project_id'], -1, old=old)
+        add_task_run_stats(conn, new['project_id'], 1, new=new)
+    else:
+        add_task_run_stats(conn, new['project_id'], 0, new=new, old=old)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def remove_task_run_stats(mapper, conn, target):
+    """Take the task run out of the stats of its project."""
+    old = task_run_values(target, previous=True)
+    add_task_run_stats(conn, old['project_id'], -1, old=old)
+
+
+def add_task_run_rollup(conn, target):
+    """Count the task run in the contribution rollup of its project, moving
+    its task to the bucket of the task run if it is the latest one."""
+    sql_query = text('''(SELECT %s, task_run.finish_time, TRUE AS current
+                     FROM task_run WHERE task_run.id=:task_run_id)
+                     UNION ALL
+                     (SELECT %s, task_run.finish_time, FALSE AS current
+                     FROM task_run WHERE task_run.task_id=:task_id
+                     AND task_run.id!=:task_run_id
+                     ORDER BY task_run.finish_time DESC, task_run.id DESC
+                     LIMIT 1)
+                     ORDER BY current DESC''' % (BUCKET, BUCKET))
+    rows = conn.execute(sql_query, dict(task_id=target.task_id,
+                                        task_run_id=target.id)).fetchall()
+    task_run = rows[0]
+    previous = rows[1] if len(rows) > 1 else None
+    latest = previous is None or task_run.finish_time >= previous.finish_time
+    if latest and previous is not None:
+        add_to_rollup(conn, target.project_id, previous, 0, -1)
+    add_to_rollup(conn, target.project_id, task_run, 1, int(latest))
+
+
+def rollup_changed(target):
+    """Return True if the flush changes the bucket of the task run."""
+    attrs = inspect(target).attrs
+    return any(getattr(attrs, attr).history.has_changes()
+               for attr in ('project_id', 'task_id', 'finish_time', 'user_id'))
+
+
+def keep_latest_bucket(conn, target):
+    """Remember the bucket of the latest task run of the task, once per
+    task and flush, before its task runs change."""
+    task_id = previous_value(target, 'task_id')
+    latest = object_session(target).info.setdefault(LATEST_BUCKETS, {})
+    if task_id not in latest:
+        latest[task_id] = (previous_value(target, 'project_id'),
+                           latest_bucket(conn, task_id))
+
+
+@event.listens_for(TaskRun, 'before_update')
+def keep_latest_bucket_on_update(mapper, conn, target):
+    if rollup_changed(target):
+        keep_latest_bucket(conn, target)
+
+
+@event.listens_for(TaskRun, 'before_delete')
+def keep_latest_bucket_on_delete(mapper, conn, target):
+    keep_latest_bucket(conn, target)
+
+
+def move_latest_bucket(conn, target):
+    """Move the task of the task run to the bucket of its latest task run.
+
+    All the task runs of the flush are written by then, so it is done once
+    per task, by the first task run of the task."""
+    task_id = previous_value(target, 'task_id')
+    latest = object_session(target).info.get(LATEST_BUCKETS, {})
+    if task_id not in latest:
+        return
+    project_id, old = latest.pop(task_id)
+    new = latest_bucket(conn, task_id)
+    if old is not None and new is not None and tuple(old) == tuple(new):
+        return
+    if old is not None:
+        add_to_rollup(conn, project_id, old, 0, -1)
+    if new is not None:
+        add_to_rollup(conn, target.project_id, new, 0, 1)
+
+
+@event.listens_for(TaskRun, 'after_update')
+def update_task_run_rollup(mapper, conn, target):
+    """Move the task run to its new bucket in the contribution rollup."""
+    if not rollup_changed(target):
+        return
+    old = task_run_bucket(conn, previous_value(target, 'finish_time'),
+                          previous_value(target, 'user_id'))
+    new = task_run_bucket(conn, target.finish_time, target.user_id)
+    project_id = previous_value(target, 'project_id')
+    if project_id != target.project_id or tuple(old) != tuple(new):
+        add_to_rollup(conn, project_id, old, -1, 0)
+        add_to_rollup(conn, target.project_id, new, 1, 0)
+    move_latest_bucket(conn, target)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def remove_task_run_rollup(mapper, conn, target):
+    """Take the task run out of the contribution rollup."""
+    bucket = task_run_bucket(conn, previous_value(target, 'finish_time'),
+                             previous_value(target, 'user_id'))
+    add_to_rollup(conn, previous_value(target, 'project_id'), bucket, -1, 0)
+    move_latest_bucket(conn, target)
+
+
+def has_info(info):
+    """Return True if a result info counts as a result."""
+    return info is not None and info != ''
+
+
+@event.listens_for(Result, 'after_insert')
+@event.listens_for(Result, 'after_update')
+def update_n_results(mapper, conn, target):
+    """Keep the number of results with info in the project stats."""
+    history = inspect(target).attrs.info.history
+    if not history.has_changes():
+        return
+    before = has_info(history.deleted[0]) if history.deleted else False
+    n_results = int(has_info(target.info)) - int(before)
+    if n_results != 0:
+        sql_query = '''UPDATE project_stats SET n_results=n_results + :n
+                    WHERE project_id=:project_id'''
+        update_project_stats(conn, target.project_id, sql_query, n=n_results)
+        after_commit(target, cached_projects.add_results, target.project_id,
+                     n_results)
+
+
+def add_to_task_pools(project_id, task_id, priority_0):
+    """Add a task to the scheduler task pools of its project."""
+    TaskPool(sentinel.master).add(project_id, task_id, priority_0)
+    AnswersPool(sentinel.master).add(project_id, task_id)
+
+
+def remove_from_task_pools(project_id, task_id):
+    """Remove a task from the scheduler task pools of its project."""
+    TaskPool(sentinel.master).remove(project_id, task_id)
+    AnswersPool(sentinel.master).remove(project_id, task_id)
+
+
+@event.listens_for(Task, 'after_insert')
+@event.listens_for(Task, 'after_update')
+def update_task_pools(mapper, conn, target):
+    """Add the task to (or remove it from) the project task pools."""
+    if current_app.config.get('SCHED_TASK_POOL'):
+        if target.state == 'completed':
+            after_commit(target, remove_from_task_pools, target.project_id,
+                         target.id)
+        else:
+            after_commit(target, add_to_task_pools, target.project_id,
+                         target.id, target.priority_0)
+
+
+@event.listens_for(Task, 'after_delete')
+def remove_deleted_task(mapper, conn, target):
+    """Remove a deleted task from the project task pools."""
+    if current_app.config.get('SCHED_TASK_POOL'):
+        after_commit(target, remove_from_task_pools, target.project_id,
+                     target.id)
+
+
+@event.listens_for(Task, 'after_insert')
+def count_task(mapper, conn, target):
+    """Count the task in the cached counters of its project."""
+    after_commit(target, cached_projects.add_task, target.project_id,
+                 target.state == 'completed')
+
+
+def request_alias_table_rebuild(project_id):
+    """Schedule a rebuild of the weighted random table of a project, unless
+    it is not loaded or a rebuild is already pending."""
+    if PriorityAliasTable(sentinel.master).request_rebuild(project_id):
+        sched_queue.enqueue(rebuild_alias_table, project_id)
+
+
+# The weighted random table and the last answers are only loaded in Redis
+# for projects using those schedulers (and dropped when a project leaves
+# them), so the listeners below leave it to Redis to skip other projects
+# instead of reading the scheduler of the project in the flush.
+
+@event.listens_for(Task, 'after_insert')
+def add_to_alias_table(mapper, conn, target):
+    """Build the weighted random scheduler table again to include the task."""
+    after_commit(target, request_alias_table_rebuild, target.project_id)
+
+
+@event.listens_for(Task, 'after_update')
+def update_alias_table(mapper, conn, target):
+    """Keep the weighted random scheduler table in sync with the task."""
+    attrs = inspect(target).attrs
+    completed = (target.state == 'completed' and
+                 attrs.state.history.has_changes())
+    priority_changed = attrs.priority_0.history.has_changes()
+    if not (completed or priority_changed):
+        return
+    if completed:
+        after_commit(target, PriorityAliasTable(sentinel.master).remove,
+                     target.project_id, target.id)
+    else:
+        after_commit(target, request_alias_table_rebuild, target.project_id)
+
+
+@event.listens_for(Task, 'after_delete')
+def remove_from_alias_table(mapper, conn, target):
+    after_commit(target, PriorityAliasTable(sentinel.master).remove,
+                 target.project_id, target.id)
+
+
+@event.listens_for(Project, 'after_update')
+def drop_scheduler_caches(mapper, conn, target):
+    """Forget the weighted random table and the last answers of a project
+    that does not use their scheduler, as they are only kept up to date for
+    it."""
+    sched = (target.info or {}).get('sched')
+    if sched != 'weighted_random':
+        after_commit(target, PriorityAliasTable(sentinel.master).reset,
+                     target.id)
+    if sched != 'incremental':
+        after_commit(target, LastAnswers(sentinel.master).reset, target.id)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def remove_deleted_answer(mapper, conn, target):
+    """Let the user get again the task of a deleted task run, and forget the
+    cached last answer of the task."""
+    if current_app.config.get('SCHED_ANSWERED_BITMAPS'):
+        user = dict(user_id=target.user_id, user_ip=target.user_ip)
+        after_commit(target, AnsweredTasks(sentinel.master).remove,
+                     target.project_id, user, target.task_id)
+    after_commit(target, LastAnswers(sentinel.master).delete,
+                 target.project_id, target.task_id)
 
 
 @event.listens_for(Blogpost, 'after_insert')
@@ -39,7 +39,7 @@ class Project(db.Model, DomainObject):
     #: ID of the project
     id = Column(Integer, primary_key=True)
     #: UTC timestamp when the project is created
-    created = Column(Text, default=make_timestamp)
+    created = Column(Text, default=make_timestamp, index=True)
     #: UTC timestamp when the project is updated (or any of its relationships)
     updated = Column(Text, default=make_timestamp, onupdate=make_timestamp)
     #: Project name
@@ -0,0 +1,86 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy import Integer, Float, Text
+from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.sql import text
+
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+class ProjectStats(db.Model, DomainObject):
+
+    """Counters of a project, kept up to date by the model event listeners
+    in the same transaction as the tasks, task runs and results."""
+
+    __tablename__ = 'project_stats'
+
+    #: Project.id of the project
+    project_id = Column(Integer, ForeignKey('project.id', ondelete='CASCADE'),
+                        primary_key=True)
+    #: Number of tasks
+    n_tasks = Column(Integer, nullable=False, default=0)
+    #: Number of completed tasks
+    n_completed_tasks = Column(Integer, nullable=False, default=0)
+    #: Sum of the n_answers of the tasks (answers to collect)
+    n_answers = Column(Integer, nullable=False, default=0)
+    #: Number of task runs
+    n_task_runs = Column(Integer, nullable=False, default=0)
+    #: Number of results with info
+    n_results = Column(Integer, nullable=False, default=0)
+    #: finish_time of the latest task run
+    last_activity = Column(Text)
+    #: Seconds spent on all the task runs (finish_time - created)
+    contribution_time = Column(Float, nullable=False, default=0)
+    #: Number of task runs with a contribution time, to average it
+    n_timed_task_runs = Column(Integer, nullable=False, default=0)
+
+
+def refresh_project_stats(conn, project_id):
+    """Compute again the stats row of a project from its tasks, task runs and
+    results (conn is a connection or a session)."""
+    conn.execute(text('DELETE FROM project_stats WHERE project_id=:project_id'),
+                 dict(project_id=project_id))
+    sql = text('''
+               INSERT INTO project_stats (project_id, n_tasks,
+               n_completed_tasks, n_answers, n_task_runs, n_results,
+               last_activity, contribution_time, n_timed_task_runs)
+               SELECT :project_id,
+               (SELECT COUNT(id) FROM task WHERE project_id=:project_id),
+               (SELECT COUNT(id) FROM task WHERE project_id=:project_id
+                AND state='completed'),
+               (SELECT COALESCE(SUM(n_answers), 0) FROM task
+                WHERE project_id=:project_id),
+               (SELECT COUNT(id) FROM task_run WHERE project_id=:project_id),
+               (SELECT COUNT(id) FROM result WHERE project_id=:project_id
+                AND info IS NOT NULL AND cast(info AS TEXT) != 'null'
+                AND cast(info AS TEXT) != ''),
+               (SELECT MAX(finish_time) FROM task_run
+                WHERE project_id=:project_id),
+               (SELECT COALESCE(EXTRACT(EPOCH FROM SUM(
+                to_timestamp(finish_time, 'YYYY-MM-DD-THH24-MI-SS.US') -
+                to_timestamp(created, 'YYYY-MM-DD-THH24-MI-SS.US'))), 0)
+                FROM task_run WHERE project_id=:project_id),
+               (SELECT COUNT(
+                to_timestamp(finish_time, 'YYYY-MM-DD-THH24-MI-SS.US') -
+                to_timestamp(created, 'YYYY-MM-DD-THH24-MI-SS.US'))
+                FROM task_run WHERE project_id=:project_id)
+               WHERE EXISTS (SELECT 1 FROM project WHERE id=:project_id);
+               ''')
+    conn.execute(sql, dict(project_id=project_id))
@@ -17,7 +17,7 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy import Integer, Text, Boolean
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.dialects.postgresql import ARRAY
 
@@ -30,6 +30,9 @@ class Result(db.Model, DomainObject):
     """A result associated for a task and its task runs."""
 
     __tablename__ = 'result'
+    __table_args__ = (
+        Index('ix_result_project_id_task_id', 'project_id', 'task_id'),
+    )
 
     #: ID of the Result
     id = Column(Integer, primary_key=True)
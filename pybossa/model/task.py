@@ -17,7 +17,7 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy import Integer, Boolean, Float, UnicodeText, Text
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.dialects.postgresql import JSON
 
@@ -31,12 +31,16 @@ class Task(db.Model, DomainObject):
     associated to a project.
     '''
     __tablename__ = 'task'
+    __table_args__ = (
+        Index('ix_task_project_id_state_priority_0', 'project_id', 'state',
+              'priority_0'),
+    )
 
 
     #: Task.ID
     id = Column(Integer, primary_key=True)
     #: UTC timestamp when the task was created.
-    created = Column(Text, default=make_timestamp)
+    created = Column(Text, default=make_timestamp, index=True)
     #: Project.ID that this task is associated with.
     project_id = Column(Integer, ForeignKey('project.id', ondelete='CASCADE'), nullable=False)
     #: Task.state: ongoing or completed.
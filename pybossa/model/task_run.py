@@ -17,7 +17,7 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy import Integer, Text
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import JSON
 
 from pybossa.core import db
@@ -29,6 +29,15 @@ class TaskRun(db.Model, DomainObject):
     '''A run of a given task by a specific user.
     '''
     __tablename__ = 'task_run'
+    __table_args__ = (
+        Index('ix_task_run_project_id_finish_time', 'project_id',
+              'finish_time'),
+        Index('ix_task_run_project_id_user_id_task_id', 'project_id',
+              'user_id', 'task_id'),
+        Index('ix_task_run_project_id_user_ip', 'project_id', 'user_ip'),
+        Index('ix_task_run_task_id_finish_time', 'task_id', 'finish_time',
+              'id'),
+    )
 
     #: ID of the TaskRun
     id = Column(Integer, primary_key=True)
@@ -38,13 +47,13 @@ class TaskRun(db.Model, DomainObject):
     project_id = Column(Integer, ForeignKey('project.id'), nullable=False)
     #: Task.id of the task associated with this TaskRun.
     task_id = Column(Integer, ForeignKey('task.id', ondelete='CASCADE'),
-                     nullable=False)
+                     nullable=False, index=True)
     #: User.id of the user contributing the TaskRun (only if authenticated)
-    user_id = Column(Integer, ForeignKey('user.id'))
+    user_id = Column(Integer, ForeignKey('user.id'), index=True)
     #: User.ip of the user contributing the TaskRun (only if anonymous)
     user_ip = Column(Text)
     #: UTC timestamp for when TaskRun is saved to DB.
-    finish_time = Column(Text, default=make_timestamp)
+    finish_time = Column(Text, default=make_timestamp, index=True)
     timeout = Column(Integer)
     calibration = Column(Integer)
     #: Value of the answer.
@@ -37,7 +37,7 @@ class User(db.Model, DomainObject, UserMixin):
 
     id = Column(Integer, primary_key=True)
     #: UTC timestamp of the user when it's created.
-    created = Column(Text, default=make_timestamp)
+    created = Column(Text, default=make_timestamp, index=True)
     email_addr = Column(Unicode(length=254), unique=True, nullable=False)
     #: Name of the user (this is used as the nickname).
     name = Column(Unicode(length=254), unique=True, nullable=False)
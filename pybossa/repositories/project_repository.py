@@ -16,14 +16,17 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
+from flask import current_app
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import text
 from sqlalchemy import cast, Date
 
 from pybossa.model.project import Project
 from pybossa.model.category import Category
 from pybossa.exc import WrongObjectError, DBIntegrityError
 from pybossa.cache import projects as cached_projects
-from pybossa.core import uploader
+from pybossa.core import uploader, sentinel
+from pybossa.leaderboard import Leaderboard
 
 
 class ProjectRepository(object):
@@ -88,13 +91,27 @@ class ProjectRepository(object):
     def delete(self, project):
         self._validate_can_be('deleted', project)
         project = self.db.session.query(Project).filter(Project.id==project.id).first()
+        scores = self._leaderboard_scores(project.id)
         self.db.session.delete(project)
         self.db.session.commit()
         cached_projects.delete_project(project.short_name)
         cached_projects.clean(project.id)
+        if scores:
+            Leaderboard(sentinel.master).subtract(scores)
         self._delete_zip_files_from_store(project)
 
 
+    def _leaderboard_scores(self, project_id):
+        """Return the number of task runs of each user in the project, to
+        subtract them from the leaderboard once the project is deleted."""
+        if not current_app.config.get('LEADERBOARD_SORTED_SET'):
+            return []
+        sql = text('''SELECT user_id, COUNT(*) AS score FROM task_run
+                   WHERE project_id=:project_id AND user_id IS NOT NULL
+                   GROUP BY user_id''')
+        return [(row.user_id, row.score) for row in
+                self.db.session.execute(sql, dict(project_id=project_id))]
+
     # Methods for Category objects
     def get_category(self, id=None):
         if id is None:
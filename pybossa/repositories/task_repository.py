@@ -16,15 +16,23 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
+from flask import current_app
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import cast, Date
 
 from pybossa.repositories import Repository
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
+from pybossa.model.project_stats import refresh_project_stats
+from pybossa.model.contribution_rollup import refresh_contribution_rollup
 from pybossa.exc import WrongObjectError, DBIntegrityError
 from pybossa.cache import projects as cached_projects
-from pybossa.core import uploader
+from pybossa.core import uploader, sentinel
+from pybossa.task_pool import TaskPool, AnswersPool, PriorityAliasTable
+from pybossa.answered_tasks import AnsweredTasks
+from pybossa.last_answers import LastAnswers
+from pybossa.volunteer_counter import VolunteerCounter, project_scope
+from pybossa.leaderboard import Leaderboard
 from sqlalchemy import text
 
 
@@ -101,7 +109,8 @@ class TaskRepository(Repository):
         try:
             self.db.session.add(element)
             self.db.session.commit()
-            cached_projects.clean_project(element.project_id)
+            # The counters of the project are updated by the model listeners
+            cached_projects.delete_browse_tasks(element.project_id)
         except IntegrityError as e:
             self.db.session.rollback()
             raise DBIntegrityError(e)
@@ -117,10 +126,16 @@ class TaskRepository(Repository):
             raise DBIntegrityError(e)
 
     def delete(self, element):
+        if isinstance(element, TaskRun):
+            scores = [(element.user_id, 1)] if element.user_id else []
+        else:
+            scores = self._leaderboard_scores('task_id=:task_id',
+                                              task_id=element.id)
         self._delete(element)
         project = element.project
         self.db.session.commit()
         cached_projects.clean_project(element.project_id)
+        self._subtract_from_leaderboard(scores)
         self._delete_zip_files_from_store(project)
 
     def delete_valid_from_project(self, project):
@@ -131,18 +146,34 @@ class TaskRepository(Repository):
                    (SELECT task_id FROM result
                    WHERE result.project_id=:project_id GROUP BY result.task_id);
                    ''')
+        scores = self._leaderboard_scores(
+            '''project_id=:project_id AND task_id NOT IN
+            (SELECT task_id FROM result WHERE project_id=:project_id)''',
+            project_id=project.id)
         self.db.session.execute(sql, dict(project_id=project.id))
+        refresh_project_stats(self.db.session, project.id)
+        refresh_contribution_rollup(self.db.session, project.id)
         self.db.session.commit()
         cached_projects.clean_project(project.id)
+        self._reset_task_pools(project.id)
+        self._reset_volunteer_counters(project.id)
+        self._subtract_from_leaderboard(scores)
         self._delete_zip_files_from_store(project)
 
     def delete_taskruns_from_project(self, project):
         sql = text('''
                    DELETE FROM task_run WHERE project_id=:project_id;
                    ''')
+        scores = self._leaderboard_scores('project_id=:project_id',
+                                          project_id=project.id)
         self.db.session.execute(sql, dict(project_id=project.id))
+        refresh_project_stats(self.db.session, project.id)
+        refresh_contribution_rollup(self.db.session, project.id)
         self.db.session.commit()
         cached_projects.clean_project(project.id)
+        self._reset_task_pools(project.id)
+        self._reset_volunteer_counters(project.id)
+        self._subtract_from_leaderboard(scores)
         self._delete_zip_files_from_store(project)
 
     def update_tasks_redundancy(self, project, n_answer):
@@ -166,8 +197,10 @@ class TaskRepository(Repository):
                    and project_tasks.id=task.id
                    ''')
         self.db.session.execute(sql, dict(n_answers=n_answer, project_id=project.id))
+        refresh_project_stats(self.db.session, project.id)
         self.db.session.commit()
         cached_projects.clean_project(project.id)
+        self._reset_task_pools(project.id)
 
     def _validate_can_be(self, action, element):
         if not isinstance(element, Task) and not isinstance(element, TaskRun):
@@ -181,6 +214,33 @@ class TaskRepository(Repository):
         inst = self.db.session.query(table).filter(table.id==element.id).first()
         self.db.session.delete(inst)
 
+    def _reset_task_pools(self, project_id):
+        TaskPool(sentinel.master).reset(project_id)
+        AnswersPool(sentinel.master).reset(project_id)
+        PriorityAliasTable(sentinel.master).reset(project_id)
+        AnsweredTasks(sentinel.master).reset(project_id)
+        LastAnswers(sentinel.master).reset(project_id)
+
+    def _reset_volunteer_counters(self, project_id):
+        # Volunteers cannot be removed from a HyperLogLog: count them exactly
+        # until the counters are loaded again
+        VolunteerCounter(sentinel.master).reset(project_scope(project_id))
+
+    def _leaderboard_scores(self, where, **params):
+        """Return the number of task runs of each user among the task runs
+        matching where, to subtract them from the leaderboard once deleted."""
+        if not current_app.config.get('LEADERBOARD_SORTED_SET'):
+            return []
+        sql = text('''SELECT user_id, COUNT(*) AS score FROM task_run
+                   WHERE %s AND user_id IS NOT NULL
+                   GROUP BY user_id''' % where)
+        return [(row.user_id, row.score)
+                for row in self.db.session.execute(sql, params)]
+
+    def _subtract_from_leaderboard(self, scores):
+        if scores and current_app.config.get('LEADERBOARD_SORTED_SET'):
+            Leaderboard(sentinel.master).subtract(scores)
+
     def _delete_zip_files_from_store(self, project):
         from pybossa.core import json_exporter, csv_exporter
         global uploader
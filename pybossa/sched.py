@@ -16,25 +16,96 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 """Scheduler module for PyBossa tasks."""
+import base64
+import inspect
+import json
+from flask import current_app
+from rq import Queue
 from sqlalchemy.sql import text
 from pybossa.model.task import Task
-from pybossa.model.task_run import TaskRun
-from pybossa.core import db
+from pybossa.core import db, sentinel
+from pybossa.task_pool import TaskPool, AnswersPool, PriorityAliasTable
+from pybossa.contributions_guard import TaskLeases
+from pybossa.answered_tasks import AnsweredTasks
+from pybossa.last_answers import LastAnswers
 import random
 
 
 session = db.slave_session
+sched_queue = Queue('medium', connection=sentinel.master)
 
+N_CANDIDATES = 10
+POOL_PAGE_SIZE = 100
+# Extra rows fetched per candidate when leases may discard some of them
+LEASE_OVERFETCH = 10
+# Tasks drawn per round (and rounds) by the weighted random scheduler
+WEIGHTED_SAMPLES = 30
+WEIGHTED_ROUNDS = 3
+# Keyset conditions to resume the depth first and breadth first orders
+PRIORITY_KEYSET = '''AND (priority_0 < :cursor_key
+                     OR (priority_0 = :cursor_key AND id > :cursor_id))'''
+ANSWERS_KEYSET = '''HAVING COUNT(task_run.task_id) > :cursor_key
+                    OR (COUNT(task_run.task_id) = :cursor_key
+                        AND task.id > :cursor_id)'''
 
-def new_task(project_id, sched, user_id=None, user_ip=None, offset=0):
+
+def new_task(project_id, sched, user_id=None, user_ip=None, offset=0,
+             cursor=None):
     """Get a new task by calling the appropriate scheduler function."""
-    sched_map = {
-        'default': get_depth_first_task,
-        'breadth_first': get_breadth_first_task,
-        'depth_first': get_depth_first_task,
-        'incremental': get_incremental_task}
+    tasks = new_tasks(project_id, sched, user_id, user_ip, offset=offset,
+                      cursor=cursor)
+    if tasks:
+        return tasks[0]
+    return None
+
+
+def new_tasks(project_id, sched, user_id=None, user_ip=None, offset=0,
+              limit=1, cursor=None):
+    """Get up to limit new tasks from a single scheduler evaluation.
+
+    If a cursor (see task_cursor) is given, the scheduler resumes right
+    after the task the cursor points to. Schedulers without a cursor
+    argument ignore it.
+    """
     scheduler = sched_map.get(sched, sched_map['default'])
-    return scheduler(project_id, user_id, user_ip, offset=offset)
+    kwargs = dict(offset=offset, limit=limit)
+    if cursor is not None:
+        cursor = decode_cursor(cursor)
+        if accepts_cursor(scheduler):
+            kwargs['cursor'] = cursor
+    return scheduler(project_id, user_id, user_ip, **kwargs)
+
+
+def task_cursor(sched, task):
+    """Return an opaque cursor to resume the scheduler right after the task,
+    or None if the scheduler serves tasks in random order."""
+    scheduler = sched_map.get(sched, sched_map['default'])
+    if scheduler == get_depth_first_tasks:
+        return encode_cursor(task.priority_0, task.id)
+    if scheduler == get_breadth_first_tasks:
+        sql = text('''SELECT COUNT(id) FROM task_run
+                   WHERE task_id=:task_id;''')
+        n_task_runs = session.execute(sql, dict(task_id=task.id)).scalar()
+        return encode_cursor(n_task_runs, task.id)
+    return None
+
+
+def accepts_cursor(scheduler):
+    args, varargs, keywords, defaults = inspect.getargspec(scheduler)
+    return 'cursor' in args or keywords is not None
+
+
+def encode_cursor(key, task_id):
+    return base64.urlsafe_b64encode(json.dumps([key, task_id]))
+
+
+def decode_cursor(cursor):
+    """Return the (sort key, task id) a cursor points to."""
+    try:
+        key, task_id = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        return float(key or 0), int(task_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor: %s' % cursor)
 
 
 def get_breadth_first_task(project_id, user_id=None, user_ip=None, offset=0):
@@ -46,49 +117,78 @@ def get_breadth_first_task(project_id, user_id=None, user_ip=None, offset=0):
     (this is not a big issue as all it means is that you may end up with some
     tasks run more than is strictly needed!)
     """
+    return _first(get_breadth_first_tasks(project_id, user_id, user_ip,
+                                          offset=offset))
+
+
+def get_breadth_first_tasks(project_id, user_id=None, user_ip=None, offset=0,
+                            limit=1, cursor=None):
+    """Get up to limit tasks with the least number of task runs (after the
+    (number of task runs, task id) cursor, if given)."""
+    n_candidates = max(N_CANDIDATES, offset + limit)
+    if current_app.config.get('SCHED_TASK_POOL'):
+        task_ids = get_pooled_candidate_task_ids(project_id, user_id, user_ip,
+                                                 breadth_first=True,
+                                                 n_candidates=n_candidates,
+                                                 cursor=cursor)
+        return _get_tasks(task_ids[offset:offset + limit])
+    if current_app.config.get('SCHED_ANSWERED_BITMAPS'):
+        task_ids = get_paged_candidate_task_ids(project_id, user_id, user_ip,
+                                                breadth_first=True,
+                                                n_candidates=n_candidates,
+                                                cursor=cursor)
+        return _get_tasks(task_ids[offset:offset + limit])
+    params = dict(project_id=project_id, limit=n_rows(n_candidates))
+    keyset = _keyset(ANSWERS_KEYSET, cursor, params)
     if user_id and not user_ip:
         sql = text('''
                    SELECT task.id, COUNT(task_run.task_id) AS taskcount
                    FROM task
-                   LEFT JOIN task_run ON (task.id = task_run.task_id)
+                   LEFT JOIN task_run ON (task.id = task_run.task_id
+                                          AND task_run.project_id=:project_id)
                    WHERE NOT EXISTS
                    (SELECT 1 FROM task_run WHERE project_id=:project_id AND
                    user_id=:user_id AND task_id=task.id)
                    AND task.project_id=:project_id AND task.state !='completed'
-                   group by task.id ORDER BY taskcount, id ASC LIMIT 10;
-                   ''')
-        rows = session.execute(sql,
-                               dict(project_id=project_id, user_id=user_id))
+                   group by task.id %s ORDER BY taskcount, id ASC LIMIT :limit;
+                   ''' % keyset)
+        rows = session.execute(sql, dict(params, user_id=user_id))
     else:
         if not user_ip:  # pragma: no cover
             user_ip = '127.0.0.1'
         sql = text('''
                    SELECT task.id, COUNT(task_run.task_id) AS taskcount
                    FROM task
-                   LEFT JOIN task_run ON (task.id = task_run.task_id)
+                   LEFT JOIN task_run ON (task.id = task_run.task_id
+                                          AND task_run.project_id=:project_id)
                    WHERE NOT EXISTS
                    (SELECT 1 FROM task_run WHERE project_id=:project_id AND
                    user_ip=:user_ip AND task_id=task.id)
                    AND task.project_id=:project_id AND task.state !='completed'
-                   group by task.id ORDER BY taskcount, id ASC LIMIT 10;
-                   ''')
+                   group by task.id %s ORDER BY taskcount, id ASC LIMIT :limit;
+                   ''' % keyset)
 
-        rows = session.execute(sql,
-                               dict(project_id=project_id, user_ip=user_ip))
-    task_ids = [x[0] for x in rows]
-    total_remaining = len(task_ids) - offset
-    if total_remaining <= 0:
-        return None
-    return session.query(Task).get(task_ids[offset])
+        rows = session.execute(sql, dict(params, user_ip=user_ip))
+    task_ids = skip_leased([x[0] for x in rows], user_id, user_ip)
+    task_ids = task_ids[:n_candidates]
+    return _get_tasks(task_ids[offset:offset + limit])
 
 
 def get_depth_first_task(project_id, user_id=None, user_ip=None, offset=0):
     """Get a new task for a given project."""
-    candidate_task_ids = get_candidate_task_ids(project_id, user_id, user_ip)
-    total_remaining = len(candidate_task_ids) - offset
-    if total_remaining <= 0:
-        return None
-    return session.query(Task).get(candidate_task_ids[offset])
+    return _first(get_depth_first_tasks(project_id, user_id, user_ip,
+                                        offset=offset))
+
+
+def get_depth_first_tasks(project_id, user_id=None, user_ip=None, offset=0,
+                          limit=1, cursor=None):
+    """Get up to limit new tasks for a given project (after the
+    (priority_0, task id) cursor, if given)."""
+    candidate_task_ids = get_candidate_task_ids(project_id, user_id, user_ip,
+                                                max(N_CANDIDATES,
+                                                    offset + limit),
+                                                cursor)
+    return _get_tasks(candidate_task_ids[offset:offset + limit])
 
 
 def get_incremental_task(project_id, user_id=None, user_ip=None, offset=0):
@@ -97,38 +197,161 @@ def get_incremental_task(project_id, user_id=None, user_ip=None, offset=0):
     It is an important strategy when dealing with large tasks, as
     transcriptions.
     """
-    candidate_task_ids = get_candidate_task_ids(project_id, user_id, user_ip)
+    return _first(get_incremental_tasks(project_id, user_id, user_ip,
+                                        offset=offset))
+
+
+def get_incremental_tasks(project_id, user_id=None, user_ip=None, offset=0,
+                          limit=1, cursor=None):
+    """Get up to limit random tasks for a given project with their last
+    given answer (tasks are random, so the cursor is ignored)."""
+    candidate_task_ids = get_candidate_task_ids(project_id, user_id, user_ip,
+                                                max(N_CANDIDATES, limit))
     total_remaining = len(candidate_task_ids)
     if total_remaining == 0:
-        return None
-    rand = random.randrange(0, total_remaining)
-    task_id = candidate_task_ids[rand]
-    task = session.query(Task).get(task_id)
-    # Find last answer for the task
-    q = session.query(TaskRun)\
-        .filter(TaskRun.task_id == task.id)\
-        .order_by(TaskRun.finish_time.desc())
-    last_task_run = q.first()
-    if last_task_run:
-        task.info['last_answer'] = last_task_run.info
-        # TODO: As discussed in GitHub #53
-        # it is necessary to create a lock in the task!
-    return task
-
-
-def get_candidate_task_ids(project_id, user_id=None, user_ip=None):
+        return []
+    task_ids = random.sample(candidate_task_ids, min(limit, total_remaining))
+    tasks = _get_tasks(task_ids)
+    last_answers = get_last_answers(project_id, task_ids)
+    for task in tasks:
+        if last_answers.get(task.id) is not None:
+            task.info['last_answer'] = last_answers[task.id]
+    return tasks
+
+
+def get_last_answers(project_id, task_ids):
+    """Return a dict with the info of the latest task run of every task."""
+    cache = LastAnswers(sentinel.master)
+    last_answers = cache.get_many(project_id, task_ids)
+    missing = [task_id for task_id in task_ids if task_id not in last_answers]
+    if missing:
+        sql = text('''SELECT DISTINCT ON (task_id) task_id, info
+                   FROM task_run WHERE task_id = ANY(:task_ids)
+                   ORDER BY task_id, finish_time DESC;''')
+        rows = session.execute(sql, dict(task_ids=missing))
+        answers = dict((task_id, None) for task_id in missing)
+        answers.update((row.task_id, row.info) for row in rows)
+        cache.set_missing(project_id, answers)
+        last_answers.update(answers)
+    return last_answers
+
+
+def get_weighted_random_task(project_id, user_id=None, user_ip=None,
+                             offset=0):
+    """Get a random task for a given project, with a probability
+    proportional to its priority_0."""
+    return _first(get_weighted_random_tasks(project_id, user_id, user_ip,
+                                            offset=offset))
+
+
+def get_weighted_random_tasks(project_id, user_id=None, user_ip=None,
+                              offset=0, limit=1, cursor=None):
+    """Get up to limit random tasks for a given project, with probabilities
+    proportional to their priority_0.
+
+    Unlike depth first, volunteers do not all get the same highest priority
+    tasks. If sampling keeps hitting tasks the user cannot take, it falls
+    back to depth first order. Tasks are random, so the cursor is ignored.
+    """
+    n_candidates = max(N_CANDIDATES, limit)
+    table = PriorityAliasTable(sentinel.master)
+    if not table.is_loaded(project_id):
+        # The table is built by a job, serve depth first meanwhile
+        request_alias_table_load(table, project_id)
+        return get_depth_first_tasks(project_id, user_id, user_ip,
+                                     offset, limit)
+    candidate_task_ids = []
+    for i in range(WEIGHTED_ROUNDS):
+        task_ids = table.sample(project_id, WEIGHTED_SAMPLES + n_candidates)
+        task_ids = [task_id for task_id in task_ids
+                    if task_id not in candidate_task_ids]
+        if not task_ids:
+            break
+        task_ids = exclude_answered(project_id, task_ids, user_id, user_ip)
+        candidate_task_ids += skip_leased(task_ids, user_id, user_ip)
+        if len(candidate_task_ids) >= offset + limit:
+            break
+    if candidate_task_ids[offset:offset + limit]:
+        return _get_tasks(candidate_task_ids[offset:offset + limit])
+    return get_depth_first_tasks(project_id, user_id, user_ip, offset, limit)
+
+
+def request_alias_table_load(table, project_id):
+    """Schedule the job building the priority alias table of a project,
+    unless it is already scheduled."""
+    from pybossa.jobs import rebuild_alias_table
+    if table.request_load(project_id):
+        sched_queue.enqueue(rebuild_alias_table, project_id)
+
+
+def load_alias_table(table, project_id):
+    """Build the priority alias table of a project with its open tasks,
+    unless another process is building it. Return whether it was built."""
+    if not table.lock(project_id):
+        return False
+    try:
+        sql = text('''SELECT id, priority_0 FROM task
+                   WHERE project_id=:project_id AND state !='completed';''')\
+            .execution_options(stream=True)
+        rows = session.execute(sql, dict(project_id=project_id))
+        table.load(project_id, ((row.id, row.priority_0) for row in rows))
+    finally:
+        table.unlock(project_id)
+    return True
+
+
+sched_map = {
+    'default': get_depth_first_tasks,
+    'breadth_first': get_breadth_first_tasks,
+    'depth_first': get_depth_first_tasks,
+    'incremental': get_incremental_tasks,
+    'weighted_random': get_weighted_random_tasks}
+
+_sched_variants = [('default', 'Default'), ('breadth_first', 'Breadth First'),
+                   ('depth_first', 'Depth First'),
+                   ('incremental', 'Incremental'),
+                   ('weighted_random', 'Weighted Random')]
+
+
+def register_scheduler(name, description, scheduler):
+    """Make a new scheduler available to the projects (e.g. from a plugin).
+
+    The scheduler is called with (project_id, user_id, user_ip, offset,
+    limit) and has to return a list of up to limit tasks. If it also has a
+    cursor argument, it gets the (sort key, task id) cursor the client sent
+    with ?cursor=, or None.
+    """
+    from pybossa.forms.forms import TaskSchedulerForm
+    sched_map[name] = scheduler
+    _sched_variants[:] = [variant for variant in _sched_variants
+                          if variant[0] != name]
+    _sched_variants.append((name, description))
+    TaskSchedulerForm.update_sched_options(sched_variants())
+
+
+def get_candidate_task_ids(project_id, user_id=None, user_ip=None,
+                           n_candidates=N_CANDIDATES, cursor=None):
     """Get all available tasks for a given project and user."""
+    if current_app.config.get('SCHED_TASK_POOL'):
+        return get_pooled_candidate_task_ids(project_id, user_id, user_ip,
+                                             n_candidates=n_candidates,
+                                             cursor=cursor)
+    if current_app.config.get('SCHED_ANSWERED_BITMAPS'):
+        return get_paged_candidate_task_ids(project_id, user_id, user_ip,
+                                            n_candidates=n_candidates,
+                                            cursor=cursor)
     rows = None
+    params = dict(project_id=project_id, limit=n_rows(n_candidates))
+    keyset = _keyset(PRIORITY_KEYSET, cursor, params)
     if user_id and not user_ip:
         query = text('''
                      SELECT id FROM task WHERE NOT EXISTS
                      (SELECT task_id FROM task_run WHERE
                      project_id=:project_id AND user_id=:user_id
                         AND task_id=task.id)
-                     AND project_id=:project_id AND state !='completed'
-                     ORDER BY priority_0 DESC, id ASC LIMIT 10''')
-        rows = session.execute(query, dict(project_id=project_id,
-                                           user_id=user_id))
+                     AND project_id=:project_id AND state !='completed' %s
+                     ORDER BY priority_0 DESC, id ASC LIMIT :limit''' % keyset)
+        rows = session.execute(query, dict(params, user_id=user_id))
     else:
         if not user_ip:
             user_ip = '127.0.0.1'
@@ -137,14 +360,223 @@ def get_candidate_task_ids(project_id, user_id=None, user_ip=None):
                      (SELECT task_id FROM task_run WHERE
                      project_id=:project_id AND user_ip=:user_ip
                         AND task_id=task.id)
-                     AND project_id=:project_id AND state !='completed'
-                     ORDER BY priority_0 DESC, id ASC LIMIT 10''')
-        rows = session.execute(query, dict(project_id=project_id,
-                                           user_ip=user_ip))
+                     AND project_id=:project_id AND state !='completed' %s
+                     ORDER BY priority_0 DESC, id ASC LIMIT :limit''' % keyset)
+        rows = session.execute(query, dict(params, user_ip=user_ip))
+
+    task_ids = skip_leased([t.id for t in rows], user_id, user_ip)
+    return task_ids[:n_candidates]
+
+
+def get_pooled_candidate_task_ids(project_id, user_id=None, user_ip=None,
+                                  breadth_first=False,
+                                  n_candidates=N_CANDIDATES, cursor=None):
+    """Get available tasks for a given project and user from a task pool.
+
+    Pages through the Redis pool of open tasks (already sorted by priority,
+    or by number of task runs if breadth_first) and only hits the DB (or the
+    answered tasks bitmaps) to drop the tasks the user has already answered.
+    """
+    if breadth_first:
+        pool = AnswersPool(sentinel.master)
+        if not pool.is_loaded(project_id):
+            load_answers_pool(pool, project_id)
+    else:
+        pool = TaskPool(sentinel.master)
+        if not pool.is_loaded(project_id):
+            load_task_pool(pool, project_id)
+
+    start = 0
+    if cursor:
+        start = pool.position_after(project_id, cursor[1], cursor[0])
+
+    def page(start, stop):
+        return pool.task_ids(project_id, start, stop)
+
+    return _page_candidates(page, project_id, user_id, user_ip, n_candidates,
+                            start)
+
+
+def get_paged_candidate_task_ids(project_id, user_id=None, user_ip=None,
+                                 breadth_first=False,
+                                 n_candidates=N_CANDIDATES, cursor=None):
+    """Get available tasks for a given project and user paging through its
+    open tasks, without checking the task runs of the user in the DB."""
+    params = dict(project_id=project_id)
+    if breadth_first:
+        keyset = _keyset(ANSWERS_KEYSET, cursor, params)
+        sql = text('''SELECT task.id FROM task
+                   LEFT JOIN task_run ON (task.id = task_run.task_id
+                                          AND task_run.project_id=:project_id)
+                   WHERE task.project_id=:project_id
+                   AND task.state !='completed'
+                   GROUP BY task.id %s
+                   ORDER BY COUNT(task_run.task_id), id ASC
+                   LIMIT :limit OFFSET :offset;''' % keyset)
+    else:
+        keyset = _keyset(PRIORITY_KEYSET, cursor, params)
+        sql = text('''SELECT id FROM task
+                   WHERE project_id=:project_id AND state !='completed' %s
+                   ORDER BY priority_0 DESC, id ASC
+                   LIMIT :limit OFFSET :offset;''' % keyset)
+
+    def page(start, stop):
+        rows = session.execute(sql, dict(params, limit=stop - start + 1,
+                                         offset=start))
+        return [row.id for row in rows]
+
+    return _page_candidates(page, project_id, user_id, user_ip, n_candidates)
+
+
+def _page_candidates(page, project_id, user_id, user_ip, n_candidates,
+                     start=0):
+    """Collect up to n_candidates task ids from the pages of open tasks
+    returned by page(start, stop), skipping answered and leased tasks."""
+    candidate_task_ids = []
+    while len(candidate_task_ids) < n_candidates:
+        task_ids = page(start, start + POOL_PAGE_SIZE - 1)
+        if not task_ids:
+            break
+        task_ids = exclude_answered(project_id, task_ids, user_id, user_ip)
+        candidate_task_ids += skip_leased(task_ids, user_id, user_ip)
+        start += POOL_PAGE_SIZE
+    return candidate_task_ids[:n_candidates]
+
+
+def load_task_pool(pool, project_id):
+    """Fill the task pool of a project with its open tasks."""
+    sql = text('''SELECT id, priority_0 FROM task
+               WHERE project_id=:project_id AND state !='completed';''')\
+        .execution_options(stream=True)
+    rows = session.execute(sql, dict(project_id=project_id))
+    pool.load(project_id, ((row.id, row.priority_0) for row in rows))
+
+
+def load_answers_pool(pool, project_id):
+    """Fill the answers pool of a project with its open tasks and their
+    number of task runs."""
+    sql = text('''SELECT task.id, COUNT(task_run.id) AS n_task_runs
+               FROM task LEFT JOIN task_run ON (task.id = task_run.task_id
+                                                AND task_run.project_id=:project_id)
+               WHERE task.project_id=:project_id AND task.state !='completed'
+               GROUP BY task.id;''').execution_options(stream=True)
+    rows = session.execute(sql, dict(project_id=project_id))
+    pool.load(project_id, ((row.id, row.n_task_runs) for row in rows))
+
+
+def exclude_answered(project_id, task_ids, user_id=None, user_ip=None):
+    """Return the given task ids without the ones answered by the user."""
+    if current_app.config.get('SCHED_ANSWERED_BITMAPS'):
+        if user_id and not user_ip:
+            user = dict(user_id=user_id, user_ip=None)
+        else:
+            user = dict(user_id=None, user_ip=user_ip or '127.0.0.1')
+        remaining = AnsweredTasks(sentinel.master).exclude(project_id, user,
+                                                           task_ids)
+        if remaining is None:
+            answered_tasks = load_answered_tasks(project_id, user)
+            remaining = answered_tasks.exclude(project_id, user, task_ids)
+        if remaining is None:
+            return list(task_ids)
+        return remaining
+    if user_id and not user_ip:
+        query = text('''SELECT task_id FROM task_run
+                     WHERE project_id=:project_id AND user_id=:user_id
+                     AND task_id = ANY(:task_ids);''')
+        params = dict(project_id=project_id, user_id=user_id,
+                      task_ids=task_ids)
+    else:
+        if not user_ip:
+            user_ip = '127.0.0.1'
+        query = text('''SELECT task_id FROM task_run
+                     WHERE project_id=:project_id AND user_ip=:user_ip
+                     AND task_id = ANY(:task_ids);''')
+        params = dict(project_id=project_id, user_ip=user_ip,
+                      task_ids=task_ids)
+    answered = set(row.task_id for row in session.execute(query, params))
+    return [task_id for task_id in task_ids if task_id not in answered]
+
+
+def load_answered_tasks(project_id, user):
+    """Return the answered tasks bitmaps, making sure the one of the user
+    for the project is loaded."""
+    answered_tasks = AnsweredTasks(sentinel.master)
+    if answered_tasks.is_loaded(project_id, user):
+        return answered_tasks
+    if answered_tasks.base(project_id) is None:
+        sql = text('''SELECT MIN(id) AS base FROM task
+                   WHERE project_id=:project_id;''')
+        base = session.execute(sql, dict(project_id=project_id)).scalar()
+        if base is None:
+            return answered_tasks
+        answered_tasks.set_base(project_id, base)
+    if user['user_id']:
+        sql = text('''SELECT task_id FROM task_run
+                   WHERE project_id=:project_id AND user_id=:user_id;''')
+        params = dict(project_id=project_id, user_id=user['user_id'])
+    else:
+        sql = text('''SELECT task_id FROM task_run
+                   WHERE project_id=:project_id AND user_ip=:user_ip;''')
+        params = dict(project_id=project_id, user_ip=user['user_ip'])
+    rows = session.execute(sql, params)
+    answered_tasks.load(project_id, user, [row.task_id for row in rows])
+    return answered_tasks
+
+
+def skip_leased(task_ids, user_id=None, user_ip=None):
+    """Return the given task ids without the ones whose missing answers are
+    all leased to other users (only when SCHED_TASK_LEASES is enabled)."""
+    if not task_ids or not current_app.config.get('SCHED_TASK_LEASES'):
+        return task_ids
+    user = dict(user_id=user_id, user_ip=user_ip or '127.0.0.1')
+    leases = TaskLeases(sentinel.master)
+    return leases.available(task_ids, user, n_answers_left(task_ids))
+
+
+def n_answers_left(task_ids):
+    """Return a dict with the number of answers each task still needs."""
+    sql = text('''SELECT task.id, task.n_answers - COUNT(task_run.id)
+               AS n_answers_left
+               FROM task LEFT JOIN task_run ON (task.id = task_run.task_id
+                                                AND task_run.task_id = ANY(:task_ids))
+               WHERE task.id = ANY(:task_ids) GROUP BY task.id;''')
+    rows = session.execute(sql, dict(task_ids=task_ids))
+    n_left = dict((task_id, 0) for task_id in task_ids)
+    n_left.update((row.id, row.n_answers_left) for row in rows)
+    return n_left
+
+
+def n_rows(n_candidates=N_CANDIDATES):
+    """Return how many candidate rows the scheduler queries should fetch."""
+    if current_app.config.get('SCHED_TASK_LEASES'):
+        return n_candidates * LEASE_OVERFETCH
+    return n_candidates
+
+
+def _keyset(clause, cursor, params):
+    """Return the SQL clause resuming a query after the cursor, adding its
+    values to the query params."""
+    if not cursor:
+        return ''
+    params.update(cursor_key=cursor[0], cursor_id=cursor[1])
+    return clause
+
+
+def _get_tasks(task_ids):
+    """Return the tasks with the given ids, keeping their order."""
+    if not task_ids:
+        return []
+    tasks = session.query(Task).filter(Task.id.in_(task_ids)).all()
+    tasks_by_id = dict((task.id, task) for task in tasks)
+    return [tasks_by_id[task_id] for task_id in task_ids
+            if task_id in tasks_by_id]
+
 
-    return [t.id for t in rows]
+def _first(tasks):
+    if tasks:
+        return tasks[0]
+    return None
 
 
 def sched_variants():
-    return [('default', 'Default'), ('breadth_first', 'Breadth First'),
-            ('depth_first', 'Depth First')]
+    return list(_sched_variants)
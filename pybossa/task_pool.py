@@ -0,0 +1,266 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Per project pools of open tasks stored in Redis.
+
+TaskPool and AnswersPool are sorted sets. Tasks are stored as zero padded
+ids, so Redis ordering (score first, then member) matches
+ORDER BY <score>, id ASC:
+
+    * TaskPool scores tasks by -priority_0 (depth first order).
+    * AnswersPool scores tasks by their number of task runs (breadth first
+      order).
+
+PriorityAliasTable is an alias table (Vose's method) to sample open tasks
+in proportion to their priority_0 in O(1).
+"""
+import random
+import struct
+
+
+class TaskPool(object):
+
+    KEY_PREFIX = 'pybossa:task_pool:project:%s'
+    LOADED_KEY_PREFIX = 'pybossa:task_pool:project:%s:loaded'
+    POOL_TTL = 60 * 60
+    LOAD_CHUNK = 1000
+
+    def __init__(self, redis_conn):
+        self.conn = redis_conn
+
+    def is_loaded(self, project_id):
+        return self.conn.exists(self.LOADED_KEY_PREFIX % project_id)
+
+    def load(self, project_id, tasks):
+        """Replace the pool of a project with the given (id, value) pairs."""
+        key = self.KEY_PREFIX % project_id
+        pipeline = self.conn.pipeline()
+        pipeline.delete(key)
+        chunk = []
+        for task_id, value in tasks:
+            chunk += [self._score(value), self._member(task_id)]
+            if len(chunk) >= 2 * self.LOAD_CHUNK:
+                pipeline.zadd(key, *chunk)
+                chunk = []
+        if chunk:
+            pipeline.zadd(key, *chunk)
+        pipeline.expire(key, self.POOL_TTL)
+        pipeline.setex(self.LOADED_KEY_PREFIX % project_id, self.POOL_TTL, 1)
+        pipeline.execute()
+
+    def add(self, project_id, task_id, priority_0):
+        if self.is_loaded(project_id):
+            self.conn.zadd(self.KEY_PREFIX % project_id,
+                           self._score(priority_0), self._member(task_id))
+
+    def remove(self, project_id, task_id):
+        self.conn.zrem(self.KEY_PREFIX % project_id, self._member(task_id))
+
+    def reset(self, project_id):
+        self.conn.delete(self.KEY_PREFIX % project_id,
+                         self.LOADED_KEY_PREFIX % project_id)
+
+    def task_ids(self, project_id, start=0, stop=-1):
+        """Return the ids of the open tasks between two positions of the
+        pool (both included)."""
+        members = self.conn.zrange(self.KEY_PREFIX % project_id, start, stop)
+        return [int(member) for member in members]
+
+    def size(self, project_id):
+        return self.conn.zcard(self.KEY_PREFIX % project_id)
+
+    def position_after(self, project_id, task_id, value):
+        """Return the position right after a task in the pool. If the task
+        is not in the pool any more, return the first position with its
+        score, as its id cannot be compared with the other ids there."""
+        key = self.KEY_PREFIX % project_id
+        rank = self.conn.zrank(key, self._member(task_id))
+        if rank is not None:
+            return rank + 1
+        return self.conn.zcount(key, '-inf', '(%s' % self._score(value))
+
+    def _score(self, priority_0):
+        return -float(priority_0 or 0)
+
+    def _member(self, task_id):
+        return '%010d' % task_id
+
+
+class AnswersPool(TaskPool):
+
+    KEY_PREFIX = 'pybossa:task_answers:project:%s'
+    LOADED_KEY_PREFIX = 'pybossa:task_answers:project:%s:loaded'
+
+    def add(self, project_id, task_id, n_task_runs=0):
+        """Add a task to the pool, keeping its count if it is already there."""
+        key = self.KEY_PREFIX % project_id
+        member = self._member(task_id)
+        if (self.is_loaded(project_id) and
+                self.conn.zscore(key, member) is None):
+            self.conn.zadd(key, self._score(n_task_runs), member)
+
+    def increment(self, project_id, task_id):
+        """Count a new task run for a task of the pool."""
+        key = self.KEY_PREFIX % project_id
+        member = self._member(task_id)
+        if self.conn.zscore(key, member) is not None:
+            self.conn.zincrby(key, member, 1)
+
+    def _score(self, n_task_runs):
+        return int(n_task_runs or 0)
+
+
+class PriorityAliasTable(object):
+
+    """Sample the open tasks of a project in proportion to their priority.
+
+    The table is a Redis string of fixed size records (task id, probability
+    of keeping it, alias task id), so drawing a task only reads one record
+    with GETRANGE. Closed tasks are not removed from the table but added to
+    a set of removed tasks that samples skip; once they are more than
+    REBUILD_RATIO of the table it is dropped and built again on next use.
+    The table is built in the background (see jobs.rebuild_alias_table),
+    the first time it is requested and whenever new tasks or priority
+    changes, which can not be patched into it, request a rebuild. Only the
+    holder of the lock of a project builds its table.
+    """
+
+    KEY_PREFIX = 'pybossa:task_alias:project:%s'
+    REMOVED_KEY_PREFIX = 'pybossa:task_alias:project:%s:removed'
+    LOCK_KEY_PREFIX = 'pybossa:task_alias:project:%s:lock'
+    REBUILD_KEY_PREFIX = 'pybossa:task_alias:project:%s:rebuild'
+    TABLE_TTL = 60 * 60
+    LOCK_TTL = 5 * 60
+    REBUILD_RATIO = 0.25
+    # Weight added to priority_0, so tasks without priority are served too
+    PRIORITY_FLOOR = 0.01
+    RECORD = struct.Struct('<ifi')
+
+    def __init__(self, redis_conn):
+        self.conn = redis_conn
+
+    def is_loaded(self, project_id):
+        return self.conn.exists(self.KEY_PREFIX % project_id)
+
+    def load(self, project_id, tasks):
+        """Build the table of a project from (id, priority_0) pairs."""
+        tasks = list(tasks)
+        task_ids = [task_id for task_id, priority_0 in tasks]
+        weights = [float(priority_0 or 0) + self.PRIORITY_FLOOR
+                   for task_id, priority_0 in tasks]
+        probs, aliases = self._build(weights)
+        data = ''.join(self.RECORD.pack(task_id, prob, task_ids[alias])
+                       for task_id, prob, alias
+                       in zip(task_ids, probs, aliases))
+        pipeline = self.conn.pipeline()
+        pipeline.delete(self.REMOVED_KEY_PREFIX % project_id)
+        pipeline.setex(self.KEY_PREFIX % project_id, self.TABLE_TTL, data)
+        pipeline.execute()
+
+    def remove(self, project_id, task_id):
+        """Stop sampling a task of a loaded table."""
+        key = self.KEY_PREFIX % project_id
+        removed_key = self.REMOVED_KEY_PREFIX % project_id
+        if not self.is_loaded(project_id):
+            return
+        pipeline = self.conn.pipeline()
+        pipeline.sadd(removed_key, task_id)
+        pipeline.expire(removed_key, self.TABLE_TTL)
+        pipeline.scard(removed_key)
+        pipeline.strlen(key)
+        n_removed, size = pipeline.execute()[2:]
+        if n_removed > self.REBUILD_RATIO * size / self.RECORD.size:
+            self.reset(project_id)
+
+    def reset(self, project_id):
+        self.conn.delete(self.KEY_PREFIX % project_id,
+                         self.REMOVED_KEY_PREFIX % project_id)
+
+    def lock(self, project_id):
+        """Take the lock to build the table of a project, and return whether
+        it was free."""
+        return bool(self.conn.set(self.LOCK_KEY_PREFIX % project_id, 1,
+                                  nx=True, ex=self.LOCK_TTL))
+
+    def unlock(self, project_id):
+        self.conn.delete(self.LOCK_KEY_PREFIX % project_id)
+
+    def request_rebuild(self, project_id):
+        """Flag the loaded table of a project to be built again, and return
+        whether the caller has to schedule the rebuild (the table is loaded
+        and no rebuild is pending)."""
+        if not self.is_loaded(project_id):
+            return False
+        return self.request_load(project_id)
+
+    def request_load(self, project_id):
+        """Flag the table of a project to be built, and return whether the
+        caller has to schedule the build (no build is pending)."""
+        return bool(self.conn.set(self.REBUILD_KEY_PREFIX % project_id, 1,
+                                  nx=True, ex=self.LOCK_TTL))
+
+    def start_rebuild(self, project_id):
+        """Clear the rebuild flag, so changes made from now on request a
+        new one."""
+        self.conn.delete(self.REBUILD_KEY_PREFIX % project_id)
+
+    def sample(self, project_id, n_samples):
+        """Draw n_samples tasks and return the distinct ids of the ones that
+        are still open, in order of appearance."""
+        key = self.KEY_PREFIX % project_id
+        n_records = self.conn.strlen(key) / self.RECORD.size
+        if n_records == 0:
+            return []
+        pipeline = self.conn.pipeline(transaction=False)
+        for i in range(n_samples):
+            start = random.randrange(n_records) * self.RECORD.size
+            pipeline.getrange(key, start, start + self.RECORD.size - 1)
+        task_ids = []
+        for record in pipeline.execute():
+            if len(record) < self.RECORD.size:  # pragma: no cover
+                continue  # The table was rebuilt in the meantime
+            task_id, prob, alias_task_id = self.RECORD.unpack(record)
+            if random.random() >= prob:
+                task_id = alias_task_id
+            if task_id not in task_ids:
+                task_ids.append(task_id)
+        removed_key = self.REMOVED_KEY_PREFIX % project_id
+        for task_id in task_ids:
+            pipeline.sismember(removed_key, task_id)
+        removed = pipeline.execute()
+        return [task_id for task_id, is_removed in zip(task_ids, removed)
+                if not is_removed]
+
+    def _build(self, weights):
+        """Return the probability and alias index of every slot."""
+        n = len(weights)
+        total = sum(weights)
+        probs = [weight * n / total for weight in weights]
+        aliases = range(n)
+        small = [i for i, prob in enumerate(probs) if prob < 1.0]
+        large = [i for i, prob in enumerate(probs) if prob >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            aliases[less] = more
+            probs[more] = probs[more] + probs[less] - 1.0
+            if probs[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        for i in small + large:
+            probs[i] = 1.0
+        return probs, aliases
@@ -299,22 +299,20 @@ def get_user_id_or_ip():
 
 
 def with_cache_disabled(f):
-    """Decorator that disables the cache for the execution of a function.
+    """Decorator that disables reading the cache for the execution of a
+    function, so the cached values are computed and written again.
     It enables it back when the function call is done.
     """
-    import os
-
     @wraps(f)
     def wrapper(*args, **kwargs):
-        env_cache_disabled = os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
-        if env_cache_disabled is None or env_cache_disabled is '0':
-            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '1'
-        return_value = f(*args, **kwargs)
-        if env_cache_disabled is None:
-            del os.environ['PYBOSSA_REDIS_CACHE_DISABLED']
-        else:
-            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = env_cache_disabled
-        return return_value
+        from pybossa import cache
+        from pybossa.cache.backends import WriteOnlyBackend
+        backend = cache.backend
+        cache.backend = WriteOnlyBackend(backend)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            cache.backend = backend
     return wrapper
 
 
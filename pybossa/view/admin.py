@@ -35,6 +35,7 @@ from pybossa.model.category import Category
 from pybossa.util import admin_required, UnicodeWriter
 from pybossa.cache import projects as cached_projects
 from pybossa.cache import categories as cached_cat
+import pybossa.cache as cache
 from pybossa.auth import ensure_authorized_to
 from pybossa.core import project_repo, user_repo, sentinel
 from pybossa.feed import get_update_feed
@@ -409,3 +410,21 @@ def dashboard():
     except Exception as e:  # pragma: no cover
         current_app.logger.error(e)
         return abort(500)
+
+
+@blueprint.route('/cache/')
+@login_required
+@admin_required
+def cache_metrics():
+    """Return the cache metrics of every cached function as JSON, sorted by
+    hits, misses, time, size, hit_ratio, avg_time or avg_size (desc)."""
+    if cache.metrics is None:
+        return format_error('Cache metrics are disabled', 404)
+    sort = request.args.get('sort', 'time')
+    if sort not in ('hits', 'misses', 'time', 'size', 'hit_ratio',
+                    'avg_time', 'avg_size'):
+        return format_error('Invalid sort field: %s' % sort, 400)
+    cache.metrics.flush(sentinel.master)
+    entries = cache.metrics.get_all(sentinel.master)
+    entries.sort(key=lambda entry: entry[sort], reverse=True)
+    return Response(json.dumps(entries), mimetype='application/json')
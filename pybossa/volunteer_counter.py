@@ -0,0 +1,106 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Approximate number of distinct volunteers, as Redis HyperLogLogs.
+
+There is a HyperLogLog of registered (user ids) and one of anonymous (user
+IPs) volunteers for every project, and two for the whole site. Counts have a
+standard error of 0.81%, and take 12 KB of memory per HyperLogLog.
+
+Task runs are added as they are saved, but a HyperLogLog is only counted once
+it has been loaded from the task_run table (see jobs.load_volunteer_counters),
+so volunteers older than the counter are not missed.
+"""
+
+REGISTERED = 'registered'
+ANONYMOUS = 'anonymous'
+SITE = 'site'
+
+
+def project_scope(project_id):
+    return 'project:%s' % project_id
+
+
+class VolunteerCounter(object):
+
+    KEY_PREFIX = 'pybossa:volunteers:%s:%s'
+    LOADED_KEY_PREFIX = 'pybossa:volunteers:%s:loaded'
+    LOAD_CHUNK = 1000
+
+    def __init__(self, redis_conn):
+        self.conn = redis_conn
+
+    def add(self, project_id, user_id, user_ip):
+        """Add the volunteer of a task run to its project and to the site."""
+        if user_id is not None:
+            kind, member = REGISTERED, user_id
+        elif user_ip is not None:
+            kind, member = ANONYMOUS, user_ip
+        else:
+            return
+        pipeline = self.conn.pipeline(transaction=False)
+        for scope in (project_scope(project_id), SITE):
+            pipeline.execute_command('PFADD', self.KEY_PREFIX % (scope, kind),
+                                     member)
+        pipeline.execute()
+
+    def is_loaded(self, scope):
+        return self.conn.exists(self.LOADED_KEY_PREFIX % scope)
+
+    def count(self, scope, kind):
+        """Return the approximate number of volunteers of a kind, or None if
+        the counters of the scope are not loaded."""
+        return self.count_many([scope], kind)[0]
+
+    def count_many(self, scopes, kind):
+        pipeline = self.conn.pipeline(transaction=False)
+        for scope in scopes:
+            pipeline.exists(self.LOADED_KEY_PREFIX % scope)
+            pipeline.execute_command('PFCOUNT', self.KEY_PREFIX % (scope, kind))
+        results = pipeline.execute()
+        return [count if loaded else None
+                for loaded, count in zip(results[::2], results[1::2])]
+
+    def load(self, scope, user_ids, user_ips):
+        """Replace the counters of a scope with the given volunteers.
+
+        The counters are built aside and renamed, so they can be counted
+        meanwhile.
+        """
+        pipeline = self.conn.pipeline()
+        for kind, members in ((REGISTERED, user_ids), (ANONYMOUS, user_ips)):
+            key = self.KEY_PREFIX % (scope, kind)
+            tmp_key = '%s:loading' % key
+            pipeline.delete(tmp_key)
+            # PFADD without members creates an empty HyperLogLog
+            pipeline.execute_command('PFADD', tmp_key)
+            chunk = []
+            for member in members:
+                chunk.append(member)
+                if len(chunk) >= self.LOAD_CHUNK:
+                    pipeline.execute_command('PFADD', tmp_key, *chunk)
+                    chunk = []
+            if chunk:
+                pipeline.execute_command('PFADD', tmp_key, *chunk)
+            pipeline.rename(tmp_key, key)
+        pipeline.set(self.LOADED_KEY_PREFIX % scope, 1)
+        pipeline.execute()
+
+    def reset(self, scope):
+        self.conn.delete(self.LOADED_KEY_PREFIX % scope,
+                         self.KEY_PREFIX % (scope, REGISTERED),
+                         self.KEY_PREFIX % (scope, ANONYMOUS))
@@ -27,6 +27,7 @@ LOCALES = [('en', 'English'), ('es', u'Español'),
            ('ja', u'日本語'), ('el', u'ελληνικά')]
 ENFORCE_PRIVACY = False
 REDIS_CACHE_ENABLED = False
+CACHE_BACKEND = 'memory'
 REDIS_SENTINEL = [('localhost', 26379)]
 REDIS_KEYPREFIX = 'pybossa_cache'
 WTF_CSRF_ENABLED = False
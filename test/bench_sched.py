@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Scheduler benchmark and load simulation.
+
+It rebuilds the test DB (settings_test.py) with a synthetic project for
+every scheduler and reports:
+
+    * the latency (p50/p99) and number of SQL queries of sched.new_task,
+    * the latency (p50/p99) of the newtask API and of the taskrun API (the
+      answer POSTs) while the volunteers answer their tasks, and
+    * the over-assignment rate: answers collected beyond task.n_answers
+      divided by all the answers collected during the simulation.
+
+Run it from the test folder, for example:
+
+    python bench_sched.py --tasks 100000 --volunteers 500 --concurrency 50 \
+        --config SCHED_TASK_POOL=True --config SCHED_TASK_LEASES=True
+"""
+import ast
+import json
+import optparse
+import random
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from default import flask_app, db, rebuild_db
+from factories import ProjectFactory, UserFactory, reset_all_pk_sequences
+from pybossa.core import sentinel
+from pybossa.model.project_stats import refresh_project_stats
+from pybossa.model.contribution_rollup import refresh_contribution_rollup
+from pybossa.model.task import Task
+from pybossa.model.task_run import TaskRun
+import pybossa.sched as sched
+
+INSERT_CHUNK = 10000
+
+
+class QueryCounter(object):
+
+    """Count the SQL statements run by every engine."""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.count += 1
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * len(values))))]
+
+
+def n_task_runs(options):
+    """Return how many task runs a task gets before the simulation starts."""
+    if random.random() >= options.answered:
+        return 0
+    if options.distribution == 'skewed':
+        return min(options.n_answers, int(random.paretovariate(1.2)))
+    return random.randint(1, options.n_answers)
+
+
+def create_volunteers(options):
+    """Return the volunteers as dicts with user_id, user_ip and api_key."""
+    n_anonymous = int(options.volunteers * options.anonymous)
+    volunteers = [dict(user_id=None, user_ip='10.0.%d.%d' % divmod(i, 256),
+                       api_key=None) for i in range(n_anonymous)]
+    for user in UserFactory.create_batch(options.volunteers - n_anonymous):
+        volunteers.append(dict(user_id=user.id, user_ip=None,
+                               api_key=user.api_key))
+    return volunteers
+
+
+def create_project(sched_name, volunteers, options):
+    """Create a project with options.tasks tasks and their task runs, and
+    return its id."""
+    project = ProjectFactory.create(info={'sched': sched_name,
+                                          'task_presenter': '<div></div>'})
+    project_id = project.id
+    task_runs = []
+    tasks = []
+    for i in range(options.tasks):
+        n_runs = min(n_task_runs(options), len(volunteers))
+        state = 'completed' if n_runs >= options.n_answers else 'ongoing'
+        tasks.append(dict(project_id=project_id, state=state, quorum=0,
+                          calibration=0, priority_0=random.random(),
+                          n_answers=options.n_answers, info={}))
+        task_runs.append(n_runs)
+        if len(tasks) == INSERT_CHUNK:
+            db.session.execute(Task.__table__.insert(), tasks)
+            tasks = []
+    if tasks:
+        db.session.execute(Task.__table__.insert(), tasks)
+    db.session.commit()
+
+    sql = text('SELECT id FROM task WHERE project_id=:project_id ORDER BY id')
+    task_ids = [row.id for row in
+                db.session.execute(sql, dict(project_id=project_id))]
+    rows = []
+    for task_id, n_runs in zip(task_ids, task_runs):
+        for volunteer in random.sample(volunteers, n_runs):
+            rows.append(dict(project_id=project_id, task_id=task_id,
+                             user_id=volunteer['user_id'],
+                             user_ip=volunteer['user_ip'],
+                             info={'answer': 'yes'}))
+        if len(rows) >= INSERT_CHUNK:
+            db.session.execute(TaskRun.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(TaskRun.__table__.insert(), rows)
+    # The bulk inserts skip the model listeners that keep the stats
+    refresh_project_stats(db.session, project_id)
+    refresh_contribution_rollup(db.session, project_id)
+    db.session.commit()
+    db.session.remove()
+    return project_id
+
+
+def bench_new_task(project_id, sched_name, volunteers, queries, options):
+    """Time sched.new_task for random volunteers."""
+    latencies = []
+    n_queries = 0
+    for i in range(options.requests):
+        volunteer = random.choice(volunteers)
+        start_queries = queries.count
+        start = time.time()
+        sched.new_task(project_id, sched_name, volunteer['user_id'],
+                       volunteer['user_ip'])
+        latencies.append(time.time() - start)
+        n_queries += queries.count - start_queries
+        db.slave_session.remove()
+    return dict(p50=percentile(latencies, 50), p99=percentile(latencies, 99),
+                queries=float(n_queries) / max(options.requests, 1))
+
+
+def simulate_volunteers(project_id, volunteers, options):
+    """Let volunteers request and answer tasks through the API.
+
+    options.concurrency volunteers are working on a task at any time: every
+    step a new volunteer requests a task and the oldest one in flight
+    submits the answer of its task.
+    """
+    client = flask_app.test_client()
+    last_id = db.session.execute('SELECT MAX(id) FROM task_run').scalar() or 0
+    in_flight = []
+    latencies = []
+    submit_latencies = []
+    for i in range(options.requests):
+        volunteer = random.choice(volunteers)
+        start = time.time()
+        task = request_task(client, project_id, volunteer)
+        latencies.append(time.time() - start)
+        if task:
+            in_flight.append((volunteer, task))
+        if len(in_flight) > options.concurrency:
+            start = time.time()
+            submit_answer(client, project_id, *in_flight.pop(0))
+            submit_latencies.append(time.time() - start)
+        reset_ratelimits()
+    for volunteer, task in in_flight:
+        start = time.time()
+        submit_answer(client, project_id, volunteer, task)
+        submit_latencies.append(time.time() - start)
+    return dict(p50=percentile(latencies, 50), p99=percentile(latencies, 99),
+                submit_p50=percentile(submit_latencies, 50),
+                submit_p99=percentile(submit_latencies, 99),
+                over_assignment=over_assignment(project_id, last_id))
+
+
+def request_task(client, project_id, volunteer):
+    url = '/api/project/%s/newtask' % project_id
+    if volunteer['api_key']:
+        url += '?api_key=%s' % volunteer['api_key']
+    res = client.get(url, environ_base=environ(volunteer))
+    task = json.loads(res.data)
+    return task if task.get('id') else None
+
+
+def submit_answer(client, project_id, volunteer, task):
+    url = '/api/taskrun'
+    if volunteer['api_key']:
+        url += '?api_key=%s' % volunteer['api_key']
+    data = dict(project_id=project_id, task_id=task['id'],
+                info={'answer': 'yes'})
+    client.post(url, data=json.dumps(data), environ_base=environ(volunteer))
+
+
+def environ(volunteer):
+    return {'REMOTE_ADDR': volunteer['user_ip'] or '127.0.0.1'}
+
+
+def reset_ratelimits():
+    keys = list(sentinel.master.scan_iter('rate-limit/*'))
+    if keys:
+        sentinel.master.delete(*keys)
+
+
+def over_assignment(project_id, last_id):
+    """Return the answers collected beyond task.n_answers by the simulation
+    (task runs with an id greater than last_id) divided by all the answers
+    it collected."""
+    sql = text('''SELECT task.n_answers, COUNT(task_run.id) AS n_task_runs,
+               SUM(CASE WHEN task_run.id > :last_id THEN 1 ELSE 0 END)
+               AS n_submitted
+               FROM task JOIN task_run ON (task.id = task_run.task_id)
+               WHERE task.project_id=:project_id GROUP BY task.id;''')
+    extra = submitted = 0
+    params = dict(project_id=project_id, last_id=last_id)
+    for row in db.session.execute(sql, params):
+        submitted += row.n_submitted
+        extra += min(max(row.n_task_runs - row.n_answers, 0), row.n_submitted)
+    db.session.remove()
+    return float(extra) / submitted if submitted else 0.0
+
+
+def run(options):
+    queries = QueryCounter()
+    sched_names = options.schedulers or sorted(sched.sched_map.keys())
+    report = []
+    for sched_name in sched_names:
+        random.seed(options.seed)
+        with flask_app.app_context():
+            rebuild_db()
+            reset_all_pk_sequences()
+            sentinel.master.flushall()
+            volunteers = create_volunteers(options)
+            project_id = create_project(sched_name, volunteers, options)
+            new_task = bench_new_task(project_id, sched_name, volunteers,
+                                      queries, options)
+            api = simulate_volunteers(project_id, volunteers, options)
+        report.append((sched_name, new_task, api))
+    print_report(report)
+
+
+def print_report(report):
+    header = ('scheduler', 'p50 ms', 'p99 ms', 'queries', 'api p50 ms',
+              'api p99 ms', 'post p50 ms', 'post p99 ms', 'over-assigned')
+    print '%-15s %10s %10s %10s %12s %12s %12s %12s %14s' % header
+    for sched_name, new_task, api in report:
+        print ('%-15s %10.2f %10.2f %10.1f %12.2f %12.2f %12.2f %12.2f '
+               '%13.2f%%' % (
+                   sched_name, new_task['p50'] * 1000, new_task['p99'] * 1000,
+                   new_task['queries'], api['p50'] * 1000, api['p99'] * 1000,
+                   api['submit_p50'] * 1000, api['submit_p99'] * 1000,
+                   api['over_assignment'] * 100))
+
+
+def parse_config(option, opt, value, parser):
+    key, _, value = value.partition('=')
+    parser.values.config[key] = ast.literal_eval(value)
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--tasks', type='int', default=10000,
+                      help='tasks of every synthetic project_id')
+    parser.add_option('--n-answers', dest='n_answers', type='int', default=3,
+                      help='answers needed by every task')
+    parser.add_option('--answered', type='float', default=0.5,
+                      help='fraction of tasks with answers before starting')
+    parser.add_option('--distribution', choices=['uniform', 'skewed'],
+                      default='uniform',
+                      help='distribution of the answers of answered tasks')
+    parser.add_option('--volunteers', type='int', default=200)
+    parser.add_option('--anonymous', type='float', default=0.3,
+                      help='fraction of anonymous volunteers')
+    parser.add_option('--requests', type='int', default=1000,
+                      help='calls per scheduler and simulated requests')
+    parser.add_option('--concurrency', type='int', default=20,
+                      help='volunteers working on a task at the same time')
+    parser.add_option('--scheduler', dest='schedulers', action='append',
+                      help='scheduler to benchmark (default: all)')
+    parser.add_option('--config', action='callback', callback=parse_config,
+                      type='string', default={},
+                      help='KEY=VALUE to override a setting, e.g. '
+                           'SCHED_TASK_POOL=True')
+    parser.add_option('--seed', type='int', default=42)
+    options, args = parser.parse_args()
+    flask_app.config.update(options.config)
+    run(options)
+
+
+if __name__ == '__main__':
+    main()
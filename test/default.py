@@ -25,6 +25,7 @@ from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
 from pybossa.model.user import User
 import pybossa.model as model
+from pybossa import cache
 from functools import wraps
 from factories import reset_all_pk_sequences
 import random
@@ -33,7 +34,6 @@ from mock import MagicMock
 
 
 os.environ['PYBOSSA_SETTINGS'] = '../settings_test.py'
-os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '1'
 
 flask_app = create_app(run_as_server=False)
 
@@ -62,6 +62,11 @@ def rebuild_db():
     db.create_all()
 
 
+def clear_cache():
+    """Drop the values of the in-process cache backend."""
+    cache.backend.clear()
+
+
 class Test(object):
     def setUp(self):
         self.flask_app = flask_app
@@ -69,6 +74,7 @@ class Test(object):
         with self.flask_app.app_context():
             rebuild_db()
             reset_all_pk_sequences()
+        clear_cache()
 
     def tearDown(self):
         with self.flask_app.app_context():
@@ -76,6 +82,7 @@ class Test(object):
             db.session.remove()
             self.redis_flushall()
             reset_all_pk_sequences()
+        clear_cache()
 
     fullname = u'T Tester'
     fullname2 = u'T Tester 2'
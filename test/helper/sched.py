@@ -17,6 +17,8 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 from helper import web
 from default import model, db
+from pybossa.core import sentinel
+from pybossa.last_answers import LastAnswers
 
 
 class Helper(web.Helper):
@@ -47,6 +49,8 @@ class Helper(web.Helper):
         """Deletes all TaskRuns for a given project_id"""
         db.session.query(model.task_run.TaskRun).filter_by(project_id=project_id).delete()
         db.session.commit()
+        # Bulk deletes skip the listeners that keep the last answers cache
+        LastAnswers(sentinel.master).reset(project_id)
         # Update task.state
         db.session.query(model.task.Task).filter_by(project_id=project_id)\
                   .update({"state": "ongoing"})
@@ -757,6 +757,44 @@ class TestAdmin(web.Helper):
         assert "No data" not in res.data, res.data
         assert "New Users" in res.data, res.data
 
+    @with_context
+    def test_admin_cache_metrics_auth_user(self):
+        """Test ADMIN cache metrics requires admin"""
+        url = '/admin/cache/'
+        self.register()
+        self.signout()
+        self.register(fullname="juan", name="juan")
+        res = self.app.get(url, follow_redirects=True)
+        assert res.status_code == 403, res.status_code
+
+    @with_context
+    @patch('pybossa.cache.metrics', None)
+    def test_admin_cache_metrics_disabled(self):
+        """Test ADMIN cache metrics returns 404 if metrics are disabled"""
+        self.register()
+        res = self.app.get('/admin/cache/', follow_redirects=True)
+        assert res.status_code == 404, res.status_code
+
+    @with_context
+    def test_admin_cache_metrics_sorted(self):
+        """Test ADMIN cache metrics returns the entries sorted by the given
+        field"""
+        from pybossa.cache.metrics import CacheMetrics
+        metrics = CacheMetrics()
+        metrics.miss('n_tasks', 0.1, 10)
+        metrics.hit('get_stats')
+        metrics.miss('get_stats', 5.0, 10000)
+        self.register()
+        with patch('pybossa.cache.metrics', metrics):
+            res = self.app.get('/admin/cache/?sort=avg_time')
+            invalid = self.app.get('/admin/cache/?sort=name')
+
+        entries = json.loads(res.data)
+        assert [entry['name'] for entry in entries] == ['get_stats',
+                                                        'n_tasks'], entries
+        assert entries[0]['hits'] == 1, entries
+        assert invalid.status_code == 400, invalid.status_code
+
     @with_context
     @patch('pybossa.view.admin.DASHBOARD_QUEUE')
     def test_admin_dashboard_admin_refresh_user_data(self, mock):
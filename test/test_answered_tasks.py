@@ -0,0 +1,99 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from redis import StrictRedis
+from pybossa.answered_tasks import AnsweredTasks
+
+
+class TestAnsweredTasks(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.answered = AnsweredTasks(self.connection)
+        self.anon_user = {'user_id': None, 'user_ip': '127.0.0.1'}
+        self.auth_user = {'user_id': 33, 'user_ip': None}
+
+    def test_set_base_keeps_first_base(self):
+        self.answered.set_base(1, 100)
+
+        assert self.answered.set_base(1, 50) == 100
+
+    def test_is_not_loaded_by_default(self):
+        assert not self.answered.is_loaded(1, self.auth_user)
+
+    def test_load_marks_bitmap_as_loaded(self):
+        self.answered.set_base(1, 100)
+        self.answered.load(1, self.auth_user, [])
+
+        assert self.answered.is_loaded(1, self.auth_user)
+        assert not self.answered.is_loaded(1, self.anon_user)
+
+    def test_exclude_drops_loaded_tasks(self):
+        self.answered.set_base(1, 100)
+        self.answered.load(1, self.auth_user, [100, 109])
+
+        remaining = self.answered.exclude(1, self.auth_user, [100, 101, 109])
+
+        assert remaining == [101], remaining
+
+    def test_exclude_returns_none_if_not_loaded(self):
+        self.answered.set_base(1, 100)
+
+        assert self.answered.exclude(1, self.auth_user, [100]) is None
+
+    def test_exclude_skips_tasks_below_base(self):
+        self.answered.set_base(1, 100)
+        self.answered.load(1, self.auth_user, [100])
+
+        remaining = self.answered.exclude(1, self.auth_user, [99, 100])
+
+        assert remaining == [99], remaining
+
+    def test_add_marks_task_as_answered(self):
+        self.answered.set_base(1, 100)
+        self.answered.load(1, self.anon_user, [])
+        self.answered.add(1, self.anon_user, 105)
+
+        remaining = self.answered.exclude(1, self.anon_user, [105, 2000])
+
+        assert remaining == [2000], remaining
+
+    def test_add_does_nothing_without_base(self):
+        self.answered.add(1, self.anon_user, 105)
+
+        assert self.connection.keys('pybossa:answered_tasks:*') == []
+
+    def test_remove_marks_task_as_not_answered(self):
+        self.answered.set_base(1, 100)
+        self.answered.load(1, self.auth_user, [100, 101])
+        self.answered.remove(1, self.auth_user, 100)
+
+        remaining = self.answered.exclude(1, self.auth_user, [100, 101])
+
+        assert remaining == [100], remaining
+
+    def test_reset_drops_every_bitmap_of_the_project(self):
+        self.answered.set_base(1, 100)
+        self.answered.load(1, self.auth_user, [100])
+        self.answered.reset(1)
+
+        assert not self.answered.is_loaded(1, self.auth_user)
+        assert self.answered.base(1) is None
+        self.answered.set_base(1, 100)
+        assert self.answered.exclude(1, self.auth_user, [100]) is None
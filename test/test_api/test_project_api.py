@@ -17,7 +17,7 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 import json
 from mock import patch, call
-from default import db, with_context
+from default import db, with_context, flask_app
 from nose.tools import assert_equal, assert_raises
 from test_api import TestAPI
 
@@ -819,6 +819,116 @@ class TestProjectAPI(TestAPI):
         res = self.app.get(url)
         assert res.data == '{}', res.data
 
+    @with_context
+    def test_newtask_resumes_after_cursor(self):
+        """Test API newtask sends an X-Cursor header that resumes the
+        scheduler after the task"""
+        project = ProjectFactory.create(info=dict(sched='depth_first'))
+        tasks = TaskFactory.create_batch(3, project=project)
+        url = '/api/project/%s/newtask' % project.id
+
+        res = self.app.get(url)
+        first = json.loads(res.data)
+        cursor = res.headers.get('X-Cursor')
+        res = self.app.get('%s?cursor=%s' % (url, cursor))
+        second = json.loads(res.data)
+
+        assert cursor is not None, res.headers
+        assert first['id'] == tasks[0].id, first
+        assert second['id'] == tasks[1].id, second
+        assert res.headers.get('X-Cursor') != cursor, res.headers
+
+    @with_context
+    def test_newtask_has_no_cursor_for_random_schedulers(self):
+        """Test API newtask does not send an X-Cursor header for schedulers
+        that serve tasks in random order"""
+        project = ProjectFactory.create(info=dict(sched='incremental'))
+        TaskFactory.create_batch(2, project=project)
+
+        res = self.app.get('/api/project/%s/newtask' % project.id)
+
+        assert json.loads(res.data)['project_id'] == project.id, res.data
+        assert 'X-Cursor' not in res.headers, res.headers
+
+    @with_context
+    def test_newtasks_cursor_points_to_last_task(self):
+        """Test API newtasks sends the cursor of its last task"""
+        project = ProjectFactory.create(info=dict(sched='depth_first'))
+        tasks = TaskFactory.create_batch(5, project=project)
+        url = '/api/project/%s/newtasks?limit=2' % project.id
+
+        res = self.app.get(url)
+        cursor = res.headers.get('X-Cursor')
+        res = self.app.get('%s&cursor=%s' % (url, cursor))
+        data = json.loads(res.data)
+
+        assert [t['id'] for t in data] == [t.id for t in tasks[2:4]], data
+
+    @with_context
+    def test_newtasks_rejects_invalid_limit_and_offset(self):
+        """Test API newtask and newtasks answer 400 to a limit or offset that
+        is not a non negative integer"""
+        project = ProjectFactory.create()
+        TaskFactory.create(project=project)
+        urls = ['/api/project/%s/newtasks?limit=abc',
+                '/api/project/%s/newtasks?offset=abc',
+                '/api/project/%s/newtask?offset=abc',
+                '/api/project/%s/newtask?offset=-1']
+
+        for url in urls:
+            res = self.app.get(url % project.id)
+            error = json.loads(res.data)
+
+            assert res.status_code == 400, (url, res.status_code)
+            assert error['exception_cls'] == 'BadRequest', error
+
+    @with_context
+    def test_newtasks(self):
+        """Test API newtasks returns a list of tasks and allows posting a
+        task run for each of them"""
+        project = ProjectFactory.create()
+        TaskFactory.create_batch(3, project=project)
+        url = '/api/project/%s/newtasks?limit=2' % project.id
+
+        res = self.app.get(url)
+        data = json.loads(res.data)
+
+        assert len(data) == 2, data
+        for task in data:
+            taskrun = dict(project_id=project.id, task_id=task['id'],
+                           info='answer')
+            res = self.app.post('/api/taskrun', data=json.dumps(taskrun))
+            assert res.status_code == 200, res.data
+
+    @with_context
+    def test_newtasks_pages_with_offset(self):
+        """Test API newtasks returns the tasks after offset, also past the
+        first candidates of the scheduler"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(17, project=project)
+        url = '/api/project/%s/newtasks?limit=5&offset=10' % project.id
+
+        res = self.app.get(url)
+        data = json.loads(res.data)
+
+        assert [t['id'] for t in data] == [t.id for t in tasks[10:15]], data
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_LEASES': True})
+    def test_newtasks_skips_fully_leased_tasks(self):
+        """Test API newtasks does not return tasks leased by others"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project, n_answers=1)
+        url = '/api/project/%s/newtasks?limit=2' % project.id
+
+        res = self.app.get(url, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        first = json.loads(res.data)
+        res = self.app.get(url, environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        second = json.loads(res.data)
+
+        assert [t['id'] for t in first] == [tasks[0].id, tasks[1].id], first
+        assert [t['id'] for t in second] == [tasks[2].id], second
+
     @patch('pybossa.repositories.project_repository.uploader')
     def test_project_delete_deletes_zip_files(self, uploader):
         """Test API project delete deletes also zip files of tasks and taskruns"""
@@ -19,7 +19,11 @@
 import hashlib
 from mock import patch
 from pybossa.cache import (get_key_to_hash, get_hash_key, cache, memoize,
-                           delete_cached, delete_memoized)
+                           delete_cached, delete_memoized, delete_namespace,
+                           memoize_many, codec, counter, counter_many,
+                           incr_counter, set_counter, delete_counter)
+from pybossa.cache.backends import RedisBackend
+from pybossa.cache.serializers import PickleCodec, CompressedPickleCodec
 from pybossa.sentinel import Sentinel
 from settings_test import REDIS_SENTINEL, REDIS_KEYPREFIX
 
@@ -63,6 +67,39 @@ class TestCacheHashFunctions(object):
 
 
 
+class TestCacheCodecs(object):
+
+    def test_pickle_codec(self):
+        """Test CACHE PickleCodec loads the values it dumps"""
+        codec = PickleCodec()
+        value = {'a': [1, 2.5, u'ñ', None]}
+
+        assert codec.loads(codec.dumps(value)) == value
+
+
+    def test_compressed_pickle_codec_does_not_compress_small_values(self):
+        """Test CACHE CompressedPickleCodec leaves values under the
+        threshold uncompressed"""
+        codec = CompressedPickleCodec(threshold=100)
+        data = codec.dumps('small')
+
+        assert data[0] == 'p', data
+        assert codec.loads(data) == 'small'
+
+
+    def test_compressed_pickle_codec_compresses_big_values(self):
+        """Test CACHE CompressedPickleCodec compresses values over the
+        threshold"""
+        codec = CompressedPickleCodec(threshold=100)
+        value = [{'id': i, 'n_answers': 30} for i in range(100)]
+        data = codec.dumps(value)
+
+        assert data[0] == 'z', data
+        assert len(data) < len(PickleCodec().dumps(value))
+        assert codec.loads(data) == value
+
+
+
 class FakeApp(object):
     def __init__(self):
         self.config = { 'REDIS_SENTINEL': REDIS_SENTINEL }
@@ -70,24 +107,9 @@ class FakeApp(object):
 test_sentinel = Sentinel(app=FakeApp())
 
 @patch('pybossa.cache.sentinel', new=test_sentinel)
+@patch('pybossa.cache.backend', new=RedisBackend(test_sentinel))
 class TestCacheMemoizeFunctions(object):
 
-    @classmethod
-    def setup_class(cls):
-        # Enable the cache for tests within this class
-        import os
-        cls.cache = None
-        if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED'):
-            cls.cache = os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
-            del os.environ['PYBOSSA_REDIS_CACHE_DISABLED']
-
-    @classmethod
-    def teardown_class(cls):
-        # Restore the environment variables to its previous state
-        if cls.cache:
-            import os
-            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = cls.cache
-
     def setUp(self):
         test_sentinel.master.flushall()
 
@@ -99,7 +121,7 @@ class TestCacheMemoizeFunctions(object):
         def my_func():
             return 'my_func was called'
         my_func()
-        key = "%s::%s" % (REDIS_KEYPREFIX, 'my_cached_func')
+        key = "%s::%s:%s" % (REDIS_KEYPREFIX, 'my_cached_func', codec.name)
 
         assert test_sentinel.master.keys() == [key], test_sentinel.master.keys()
 
@@ -216,7 +238,7 @@ class TestCacheMemoizeFunctions(object):
         @cache(key_prefix='my_cached_func')
         def my_func():
             return 'my_func was called'
-        key = "%s::%s" % (REDIS_KEYPREFIX, 'my_cached_func')
+        key = "%s::%s:%s" % (REDIS_KEYPREFIX, 'my_cached_func', codec.name)
         my_func()
         assert test_sentinel.master.keys() == [key]
 
@@ -225,13 +247,28 @@ class TestCacheMemoizeFunctions(object):
         assert test_sentinel.master.keys() == [], 'Key was not deleted!'
 
 
+    def test_delete_cached_deletes_value_of_every_codec(self):
+        """Test CACHE delete_cached deletes the values stored with any
+        codec"""
+
+        key = "%s::%s:%s" % (REDIS_KEYPREFIX, 'my_cached_func', 'pickle')
+        other_key = "%s::%s:%s" % (REDIS_KEYPREFIX, 'my_cached_func',
+                                   'zpickle')
+        test_sentinel.master.set(key, 'value')
+        test_sentinel.master.set(other_key, 'value')
+
+        delete_succedeed = delete_cached('my_cached_func')
+        assert delete_succedeed is True, delete_succedeed
+        assert test_sentinel.master.keys() == [], 'Key was not deleted!'
+
+
     def test_delete_cached_returns_false_when_delete_fails(self):
         """Test CACHE delete_cached returns False if deletion is not successful"""
 
         @cache(key_prefix='my_cached_func')
         def my_func():
             return 'my_func was called'
-        key = "%s::%s" % (REDIS_KEYPREFIX, 'my_cached_func')
+        key = "%s::%s:%s" % (REDIS_KEYPREFIX, 'my_cached_func', codec.name)
         assert test_sentinel.master.keys() == []
 
         delete_succedeed = delete_cached('my_cached_func')
@@ -288,16 +325,294 @@ class TestCacheMemoizeFunctions(object):
         only function is specified and no arguments of the calls are provided"""
 
         @memoize()
-        def my_func(*args, **kwargs):
-            return [args, kwargs]
+        def my_func(arg, call_count=[]):
+            call_count.append(1)
+            return len(call_count)
         @memoize()
-        def my_other_func(*args, **kwargs):
-            return [args, kwargs]
-        my_func('arg', kwarg='kwarg')
-        my_func('other', kwarg='other')
-        my_other_func('arg', kwarg='kwarg')
-        assert len(test_sentinel.master.keys()) == 3
+        def my_other_func(arg, call_count=[]):
+            call_count.append(1)
+            return len(call_count)
+        my_func('arg')
+        my_func('other')
+        my_other_func('arg')
 
         delete_succedeed = delete_memoized(my_func)
         assert delete_succedeed is True, delete_succedeed
+        assert my_func('arg') == 3, 'Value was not deleted'
+        assert my_func('other') == 4, 'Value was not deleted'
+        assert my_other_func('arg') == 1, 'Other function value was deleted'
+
+
+    def test_delete_memoized_does_not_scan_keys(self):
+        """Test CACHE delete_memoized without arguments increments the
+        generation of the function instead of looking for its keys"""
+
+        @memoize()
+        def my_func(*args, **kwargs):
+            return [args, kwargs]
+        my_func('arg')
+        generation_key = "%s:%s_generation" % (REDIS_KEYPREFIX,
+                                               my_func.__name__)
+
+        with patch.object(test_sentinel.slave, 'keys') as keys:
+            delete_memoized(my_func)
+
+        assert not keys.called
+        assert test_sentinel.master.get(generation_key) == '1'
+        my_func('arg')
+        key_pattern = "%s:%s_args:%s:1:*" % (REDIS_KEYPREFIX, my_func.__name__,
+                                             codec.name)
+        assert len(test_sentinel.master.keys(key_pattern)) == 1
+
+
+    def test_delete_memoized_with_args_in_namespace(self):
+        """Test CACHE delete_memoized deletes a stored key of a function with
+        a namespace"""
+
+        @memoize(namespace=lambda arg: 'ns:%s' % arg)
+        def my_func(arg):
+            return arg
+        my_func('arg')
         assert len(test_sentinel.master.keys()) == 1
+
+        delete_succedeed = delete_memoized(my_func, 'arg')
+        assert delete_succedeed is True, delete_succedeed
+        assert test_sentinel.master.keys() == [], 'Key was not deleted!'
+
+
+    def test_delete_namespace_deletes_namespace_values(self):
+        """Test CACHE delete_namespace deletes the values of every function
+        in the namespace, and only them"""
+
+        @memoize(namespace=lambda arg, call_count=None: 'ns:%s' % arg)
+        def my_func(arg, call_count=[]):
+            call_count.append(1)
+            return len(call_count)
+        @memoize(namespace=lambda arg, call_count=None: 'ns:%s' % arg)
+        def my_other_func(arg, call_count=[]):
+            call_count.append(1)
+            return len(call_count)
+        my_func(1)
+        my_func(2)
+        my_other_func(1)
+
+        delete_succedeed = delete_namespace('ns:1')
+        assert delete_succedeed is True, delete_succedeed
+        assert my_func(1) == 3, 'Value was not deleted'
+        assert my_other_func(1) == 2, 'Value was not deleted'
+        assert my_func(2) == 2, 'Value of other namespace was deleted'
+
+
+    @patch('pybossa.cache.time')
+    def test_memoize_with_soft_timeout_recomputes_stale_value(self, fake_time):
+        """Test CACHE memoize recomputes the value after the soft timeout"""
+
+        fake_time.time.return_value = 1000
+        @memoize(timeout=300, soft_timeout=60)
+        def my_func(arg, call_count=[]):
+            call_count.append(1)
+            return len(call_count)
+        first_call = my_func('arg')
+        fake_time.time.return_value = 1059
+        second_call = my_func('arg')
+        fake_time.time.return_value = 1061
+        third_call = my_func('arg')
+
+        assert first_call == 1, first_call
+        assert second_call == 1, second_call
+        assert third_call == 2, third_call
+        assert test_sentinel.master.keys('*:lock') == []
+
+
+    @patch('pybossa.cache.time')
+    def test_memoize_with_soft_timeout_returns_stale_value_if_locked(
+            self, fake_time):
+        """Test CACHE memoize returns the stale value while another caller
+        recomputes it"""
+
+        fake_time.time.return_value = 1000
+        @memoize(timeout=300, soft_timeout=60)
+        def my_func(arg, call_count=[]):
+            call_count.append(1)
+            return len(call_count)
+        my_func('arg')
+        key, = test_sentinel.master.keys()
+        test_sentinel.master.set('%s:lock' % key, 1)
+        fake_time.time.return_value = 1061
+
+        assert my_func('arg') == 1
+
+
+    @patch('pybossa.cache.time')
+    def test_cache_with_soft_timeout_recomputes_stale_value(self, fake_time):
+        """Test CACHE cache recomputes the value after the soft timeout"""
+
+        fake_time.time.return_value = 1000
+        @cache(key_prefix='my_cached_func', timeout=300, soft_timeout=60)
+        def my_func(call_count=[]):
+            call_count.append(1)
+            return len(call_count)
+        my_func()
+        fake_time.time.return_value = 1061
+
+        assert my_func() == 2
+
+
+    def test_memoize_many_returns_values_in_order(self):
+        """Test CACHE memoize_many returns the value of every call"""
+
+        @memoize()
+        def my_func(arg):
+            return arg * 2
+
+        values = memoize_many(my_func, [(1,), (2,), (3,)])
+
+        assert values == [2, 4, 6], values
+
+
+    def test_memoize_many_uses_cached_values(self):
+        """Test CACHE memoize_many reads the values cached by the memoized
+        function and caches the missing ones"""
+
+        @memoize()
+        def my_func(arg, call_count=[]):
+            call_count.append(1)
+            return len(call_count)
+        my_func('a')
+
+        values = memoize_many(my_func, [('a',), ('b',)])
+
+        assert values == [1, 2], values
+        assert my_func('b') == 2, my_func('b')
+
+
+    def test_memoize_many_computes_misses_with_batch(self):
+        """Test CACHE memoize_many computes all the missing values with a
+        single call to the batch function"""
+
+        calls = []
+        def batch(args_list):
+            calls.append(args_list)
+            return [arg * 2 for arg, in args_list]
+        @memoize(batch=batch)
+        def my_func(arg):
+            return arg * 2
+        my_func(1)
+
+        values = memoize_many(my_func, [(1,), (2,), (3,)])
+
+        assert values == [2, 4, 6], values
+        assert calls == [[(2,), (3,)]], calls
+
+
+    def test_memoize_many_reads_cache_at_once(self):
+        """Test CACHE memoize_many reads every value with a single MGET"""
+
+        @memoize(namespace=lambda arg: 'ns:%s' % arg)
+        def my_func(arg):
+            return arg
+        memoize_many(my_func, [(1,), (2,)])
+
+        with patch.object(test_sentinel.slave, 'get') as get:
+            values = memoize_many(my_func, [(1,), (2,)])
+
+        assert values == [1, 2], values
+        assert not get.called
+
+
+    def test_counter_stores_value_as_string(self):
+        """Test CACHE counter stores the value of the function as a string"""
+
+        @counter()
+        def my_func(project_id):
+            return 3
+        key = '%s:my_func_counter:1' % REDIS_KEYPREFIX
+
+        assert my_func(1) == 3
+        assert test_sentinel.slave.get(key) == '3', test_sentinel.slave.get(key)
+
+
+    def test_counter_stores_none(self):
+        """Test CACHE counter caches None values"""
+
+        calls = []
+        @counter(type=str)
+        def my_func(project_id):
+            calls.append(project_id)
+            return None
+
+        assert my_func(1) is None
+        assert my_func(1) is None
+        assert calls == [1], calls
+
+
+    def test_incr_counter_updates_cached_counter(self):
+        """Test CACHE incr_counter adds to the cached value of a counter"""
+
+        @counter()
+        def my_func(project_id):
+            return 3
+        my_func(1)
+
+        incr_counter(my_func, 2, 1)
+
+        assert my_func(1) == 5, my_func(1)
+
+
+    def test_incr_counter_does_not_create_counter(self):
+        """Test CACHE incr_counter does nothing if the counter is not cached"""
+
+        @counter()
+        def my_func(project_id):
+            return 3
+
+        incr_counter(my_func, 1, 1)
+
+        assert my_func(1) == 3, my_func(1)
+
+
+    def test_set_counter_updates_cached_counter(self):
+        """Test CACHE set_counter replaces only a cached counter"""
+
+        @counter(type=str)
+        def my_func(project_id):
+            return 'computed'
+        my_func(1)
+
+        set_counter(my_func, 'set', 1)
+        set_counter(my_func, 'set', 2)
+
+        assert my_func(1) == 'set', my_func(1)
+        assert my_func(2) == 'computed', my_func(2)
+
+
+    def test_delete_counter(self):
+        """Test CACHE delete_counter makes the counter be computed again"""
+
+        values = [1, 2]
+        @counter()
+        def my_func(project_id):
+            return values.pop(0)
+        my_func(1)
+
+        delete_counter(my_func, 1)
+
+        assert my_func(1) == 2, my_func(1)
+
+
+    def test_counter_many_computes_misses_with_batch(self):
+        """Test CACHE counter_many computes the missing counters at once"""
+
+        calls = []
+        def batch(args_list):
+            calls.append(args_list)
+            return [arg * 2 for arg, in args_list]
+        @counter(batch=batch)
+        def my_func(arg):
+            return arg * 2
+        my_func(1)
+
+        values = counter_many(my_func, [(1,), (2,), (3,)])
+
+        assert values == [2, 4, 6], values
+        assert calls == [[(1,)], [(2,), (3,)]], calls
@@ -0,0 +1,225 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+from mock import patch
+from nose.tools import assert_raises
+from redis import StrictRedis
+from pybossa.cache import init_app
+from pybossa.cache.backends import (RedisBackend, MemoryBackend, NullBackend,
+                                    WriteOnlyBackend)
+
+
+class TestMemoryBackend(object):
+
+    def setUp(self):
+        self.backend = MemoryBackend()
+
+    def test_set_and_get(self):
+        self.backend.set('key', 'value', 60)
+
+        assert self.backend.get('key') == 'value', self.backend.get('key')
+        assert self.backend.get_many(['key', 'other']) == ['value', None]
+
+    @patch('pybossa.cache.backends.time')
+    def test_values_expire_after_timeout(self, fake_time):
+        fake_time.time.return_value = 100
+        self.backend.set('key', 'value', 60)
+
+        fake_time.time.return_value = 159
+        assert self.backend.get('key') == 'value'
+        fake_time.time.return_value = 161
+        assert self.backend.get('key') is None
+
+    def test_evicts_least_recently_used(self):
+        backend = MemoryBackend(max_size=2)
+        backend.set('one', 1, 60)
+        backend.set('two', 2, 60)
+        backend.get('one')
+        backend.set('three', 3, 60)
+
+        assert backend.get('two') is None
+        assert backend.get('one') == 1
+
+    def test_add_does_not_overwrite(self):
+        assert self.backend.add('key', 1, 60) is True
+        assert self.backend.add('key', 2, 60) is False
+        assert self.backend.get('key') == 1
+
+    def test_incr_counters_do_not_expire(self):
+        self.backend.incr('counter')
+        self.backend.incr('counter')
+
+        assert self.backend.get_counters(['counter', 'other']) == ['2', None]
+
+    def test_incr_existing_does_not_create_key(self):
+        self.backend.incr_existing('counter', 2)
+        assert self.backend.get('counter') is None
+
+        self.backend.set('counter', '1', 60)
+        self.backend.incr_existing('counter', 2)
+        assert self.backend.get('counter') == '3', self.backend.get('counter')
+
+    def test_set_existing_does_not_create_key(self):
+        self.backend.set_existing('key', 'value', 60)
+        assert self.backend.get('key') is None
+
+        self.backend.set('key', '', 60)
+        self.backend.set_existing('key', 'value', 60)
+        assert self.backend.get('key') == 'value', self.backend.get('key')
+
+    def test_delete(self):
+        self.backend.set('key', 'value', 60)
+
+        assert self.backend.delete(['key', 'other']) is True
+        assert self.backend.delete(['key']) is False
+        assert self.backend.get('key') is None
+
+    def test_get_generational(self):
+        self.backend.incr('generation')
+        self.backend.set('value:1.0:args', 'value', 60)
+
+        result = self.backend.get_generational(['generation', 'other'],
+                                               'value:', ':args')
+
+        assert result == (['1', '0'], 'value'), result
+
+
+class FakeSentinel(object):
+    def __init__(self, connection):
+        self.master = self.slave = connection
+
+
+class TestRedisBackend(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.backend = RedisBackend(FakeSentinel(self.connection))
+
+    def test_get_generational(self):
+        self.backend.incr('generation')
+        self.backend.set('value:1.0:args', 'value', 60)
+
+        result = self.backend.get_generational(['generation', 'other'],
+                                               'value:', ':args')
+
+        assert result == (['1', '0'], 'value'), result
+
+    def test_get_generational_missing_value(self):
+        result = self.backend.get_generational(['generation'], 'value:',
+                                               ':args')
+
+        assert result == (['0'], None), result
+
+
+class TestNullBackend(object):
+
+    def test_stores_nothing(self):
+        backend = NullBackend()
+        backend.set('key', 'value', 60)
+        backend.incr('counter')
+
+        assert backend.get('key') is None
+        assert backend.get_counters(['counter']) == [None]
+
+
+class TestWriteOnlyBackend(object):
+
+    def test_writes_without_reading(self):
+        memory = MemoryBackend()
+        memory.set('key', 'old', 60)
+        backend = WriteOnlyBackend(memory)
+
+        assert backend.get('key') is None
+        backend.set('key', 'new', 60)
+        assert memory.get('key') == 'new'
+
+    def test_reads_counters(self):
+        memory = MemoryBackend()
+        memory.incr('generation')
+        backend = WriteOnlyBackend(memory)
+
+        assert backend.get_counters(['generation']) == ['1']
+
+    def test_get_generational_reads_generations_only(self):
+        memory = MemoryBackend()
+        memory.incr('generation')
+        memory.set('value:1:args', 'value', 60)
+        backend = WriteOnlyBackend(memory)
+
+        result = backend.get_generational(['generation'], 'value:', ':args')
+
+        assert result == (['1'], None), result
+
+
+class FakeApp(object):
+    def __init__(self, **config):
+        self.config = dict(LOCAL_CACHE_SIZE=0, CACHE_MEMORY_SIZE=10)
+        self.config.update(config)
+
+
+class TestInitApp(object):
+
+    @patch('pybossa.cache.metrics')
+    @patch('pybossa.cache.codec')
+    @patch('pybossa.cache.backend')
+    def test_selects_backend(self, backend, codec, metrics):
+        import pybossa.cache as cache
+        for name, cls in (('redis', RedisBackend), ('memory', MemoryBackend),
+                          ('null', NullBackend)):
+            init_app(FakeApp(CACHE_BACKEND=name))
+
+            assert isinstance(cache.backend, cls), cache.backend
+
+    @patch('pybossa.cache.metrics')
+    @patch('pybossa.cache.codec')
+    @patch('pybossa.cache.backend')
+    def test_unknown_backend(self, backend, codec, metrics):
+        assert_raises(ValueError, init_app, FakeApp(CACHE_BACKEND='disk'))
+
+    @patch('pybossa.cache.metrics')
+    @patch('pybossa.cache.codec')
+    @patch('pybossa.cache.backend')
+    def test_selects_codec(self, backend, codec, metrics):
+        import pybossa.cache as cache
+        init_app(FakeApp(CACHE_BACKEND='null', CACHE_CODEC='zpickle',
+                         CACHE_COMPRESS_THRESHOLD=10))
+
+        assert cache.codec.name == 'zpickle', cache.codec.name
+        assert cache.codec.threshold == 10, cache.codec.threshold
+
+    @patch('pybossa.cache.metrics')
+    @patch('pybossa.cache.codec')
+    @patch('pybossa.cache.backend')
+    def test_unknown_codec(self, backend, codec, metrics):
+        assert_raises(ValueError, init_app,
+                      FakeApp(CACHE_BACKEND='null', CACHE_CODEC='json'))
+
+    @patch('pybossa.cache.metrics')
+    @patch('pybossa.cache.codec')
+    @patch('pybossa.cache.backend')
+    def test_enables_metrics(self, backend, codec, metrics):
+        import pybossa.cache as cache
+        from pybossa.cache.metrics import CacheMetrics
+        init_app(FakeApp(CACHE_BACKEND='null', CACHE_METRICS=True,
+                         CACHE_METRICS_FLUSH_INTERVAL=5))
+
+        assert isinstance(cache.metrics, CacheMetrics), cache.metrics
+
+        init_app(FakeApp(CACHE_BACKEND='null'))
+
+        assert cache.metrics is None, cache.metrics
@@ -24,9 +24,19 @@ from factories import CategoryFactory, ProjectFactory
 class TestCategoriesCache(Test):
 
     def test_get_all_returns_all_categories(self):
-        categories = [CategoryFactory.create()]
+        category = CategoryFactory.create()
 
-        assert cached_categories.get_all() == categories
+        categories = cached_categories.get_all()
+
+        assert [c.id for c in categories] == [category.id], categories
+        assert categories[0].short_name == category.short_name, categories
+
+    def test_get_all_caches_column_values(self):
+        CategoryFactory.create()
+
+        columns = cached_categories._get_all_columns()
+
+        assert all(isinstance(c, dict) for c in columns), columns
 
 
     def test_get_used_returns_only_categories_with_projects(self):
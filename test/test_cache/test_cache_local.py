@@ -0,0 +1,191 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from mock import patch, MagicMock
+from pybossa.cache.local import LocalCache, Invalidator, TwoTierBackend
+from pybossa.cache.backends import MemoryBackend
+
+
+class TestLocalCache(object):
+
+    def test_get_missing_key(self):
+        local_cache = LocalCache()
+
+        assert local_cache.get('key') is None
+
+    def test_set_and_get(self):
+        local_cache = LocalCache()
+        local_cache.set('key', 'value')
+
+        assert local_cache.get('key') == 'value', local_cache.get('key')
+
+    def test_evicts_least_recently_used(self):
+        local_cache = LocalCache(max_size=2)
+        local_cache.set('one', 1)
+        local_cache.set('two', 2)
+        local_cache.get('one')
+        local_cache.set('three', 3)
+
+        assert len(local_cache) == 2
+        assert local_cache.get('two') is None
+        assert local_cache.get('one') == 1
+        assert local_cache.get('three') == 3
+
+    @patch('pybossa.cache.local.time')
+    def test_entries_expire_after_ttl(self, fake_time):
+        fake_time.time.return_value = 100
+        local_cache = LocalCache(ttl=30)
+        local_cache.set('key', 'value')
+
+        fake_time.time.return_value = 129
+        assert local_cache.get('key') == 'value'
+        fake_time.time.return_value = 131
+        assert local_cache.get('key') is None
+
+    @patch('pybossa.cache.local.time')
+    def test_entries_expire_before_redis_timeout(self, fake_time):
+        fake_time.time.return_value = 100
+        local_cache = LocalCache(ttl=30)
+        local_cache.set('key', 'value', timeout=10)
+
+        fake_time.time.return_value = 111
+        assert local_cache.get('key') is None
+
+    def test_delete(self):
+        local_cache = LocalCache()
+        local_cache.set('key', 1)
+        local_cache.set('other', 2)
+        local_cache.delete('key')
+
+        assert local_cache.get('key') is None
+        assert local_cache.get('other') == 2
+
+
+class TestInvalidator(object):
+
+    def setUp(self):
+        self.local_cache = LocalCache()
+        self.invalidator = Invalidator(self.local_cache, 'channel')
+
+    def test_publish_deletes_key_and_publishes_it(self):
+        redis_conn = MagicMock()
+        self.local_cache.set('key', 'value')
+        self.invalidator.publish(redis_conn, 'key')
+
+        assert self.local_cache.get('key') is None
+        redis_conn.publish.assert_called_with('channel', 'key')
+
+
+class TestTwoTierBackend(object):
+
+    def setUp(self):
+        self.local_cache = LocalCache()
+        self.invalidator = MagicMock()
+        self.inner = MemoryBackend()
+        self.sentinel = MagicMock()
+        self.backend = TwoTierBackend(self.inner, self.local_cache,
+                                      self.invalidator, self.sentinel,
+                                      MagicMock())
+
+    def test_get_reads_local_cache_first(self):
+        self.local_cache.set('key', 'local')
+        self.inner.set('key', 'backend', 60)
+
+        assert self.backend.get('key') == 'local', self.backend.get('key')
+
+    def test_get_fills_local_cache(self):
+        self.inner.set('key', 'value', 60)
+
+        assert self.backend.get('key') == 'value'
+        assert self.local_cache.get('key') == 'value'
+
+    def test_get_many_keeps_keys_order(self):
+        self.local_cache.set('two', 2)
+        self.inner.set('one', 1, 60)
+
+        values = self.backend.get_many(['one', 'two', 'three'])
+
+        assert values == [1, 2, None], values
+
+    def test_set_writes_both_tiers(self):
+        self.backend.set('key', 'value', 60)
+
+        assert self.inner.get('key') == 'value'
+        assert self.local_cache.get('key') == 'value'
+
+    def test_delete_publishes_keys(self):
+        self.backend.set('key', 'value', 60)
+
+        self.backend.delete(['key'])
+
+        assert self.inner.get('key') is None
+        self.invalidator.publish.assert_called_with(self.sentinel.master,
+                                                    'key')
+
+    def test_get_generational_fills_local_cache(self):
+        self.inner.incr('generation')
+        self.inner.set('value:1:args', 'value', 60)
+
+        result = self.backend.get_generational(['generation'], 'value:',
+                                               ':args')
+
+        assert result == (['1'], 'value'), result
+        assert self.local_cache.get('generation') == '1'
+        assert self.local_cache.get('value:1:args') == 'value'
+
+    def test_get_generational_reads_local_cache_first(self):
+        self.local_cache.set('generation', '2')
+        self.local_cache.set('value:2:args', 'local')
+        self.inner.incr('generation')
+
+        result = self.backend.get_generational(['generation'], 'value:',
+                                               ':args')
+
+        assert result == (['2'], 'local'), result
+
+    def test_get_many_caches_falsy_values(self):
+        self.inner.set('key', '', 60)
+
+        assert self.backend.get_many(['key']) == ['']
+        assert self.local_cache.get('key') == ''
+
+    def test_memoized_function_is_read_locally_before_any_delete(self):
+        """Test the second call to a memoized function whose generation was
+        never incremented makes no call to the backend"""
+        from pybossa import cache
+        inner = MagicMock(wraps=self.inner)
+        backend = TwoTierBackend(inner, self.local_cache, self.invalidator,
+                                 self.sentinel, MagicMock())
+
+        @cache.memoize(timeout=60)
+        def square(n):
+            return n * n
+
+        with patch.object(cache, 'backend', backend):
+            assert square(3) == 9
+            inner.reset_mock()
+            assert square(3) == 9
+
+        assert inner.method_calls == [], inner.method_calls
+
+    def test_incr_publishes_key(self):
+        self.backend.incr('generation')
+
+        assert self.inner.get_counters(['generation']) == ['1']
+        self.invalidator.publish.assert_called_with(self.sentinel.master,
+                                                    'generation')
@@ -0,0 +1,84 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from mock import patch
+from redis import StrictRedis
+from pybossa.cache.metrics import CacheMetrics
+
+
+class TestCacheMetrics(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.metrics = CacheMetrics(flush_interval=60)
+
+    def test_flush_adds_counters_to_redis(self):
+        self.metrics.hit('n_tasks')
+        self.metrics.hit('n_tasks', 2)
+        self.metrics.miss('n_tasks', 0.5, 100)
+        self.metrics.flush(self.connection)
+
+        entry, = self.metrics.get_all(self.connection)
+
+        assert entry['name'] == 'n_tasks', entry
+        assert entry['hits'] == 3, entry
+        assert entry['misses'] == 1, entry
+        assert entry['hit_ratio'] == 0.75, entry
+        assert entry['avg_time'] == 0.5, entry
+        assert entry['avg_size'] == 100, entry
+
+    def test_flush_resets_process_counters(self):
+        self.metrics.hit('n_tasks')
+        self.metrics.flush(self.connection)
+        self.metrics.flush(self.connection)
+
+        entry, = self.metrics.get_all(self.connection)
+
+        assert entry['hits'] == 1, entry
+
+    def test_counters_of_several_processes_add_up(self):
+        other_metrics = CacheMetrics()
+        self.metrics.miss('get_stats', 2.0, 1000)
+        other_metrics.miss('get_stats', 4.0, 3000)
+        self.metrics.flush(self.connection)
+        other_metrics.flush(self.connection)
+
+        entry, = self.metrics.get_all(self.connection)
+
+        assert entry['misses'] == 2, entry
+        assert entry['avg_time'] == 3.0, entry
+        assert entry['avg_size'] == 2000, entry
+
+    @patch('pybossa.cache.metrics.time')
+    def test_should_flush_after_interval(self, fake_time):
+        fake_time.time.return_value = 100
+        metrics = CacheMetrics(flush_interval=60)
+
+        fake_time.time.return_value = 159
+        assert not metrics.should_flush()
+        fake_time.time.return_value = 160
+        assert metrics.should_flush()
+
+    def test_reset(self):
+        self.metrics.hit('n_tasks')
+        self.metrics.flush(self.connection)
+        self.metrics.reset(self.connection)
+
+        assert self.metrics.get_all(self.connection) == []
+        assert self.connection.keys('pybossa:cache_metrics*') == []
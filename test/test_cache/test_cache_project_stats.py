@@ -57,6 +57,40 @@ class TestProjectsStatsCache(Test):
         assert len(anon_users) == 1, len(anon_users)
         assert len(auth_users) == 1, len(auth_users)
 
+    def test_stats_users_returns_top_5_auth_users(self):
+        """Test CACHE PROJECT STATS user stats counts every user but only
+        returns the top 5 authenticated ones."""
+        pr = ProjectFactory.create()
+        top_user = TaskRunFactory.create(project=pr).user
+        TaskRunFactory.create(project=pr, user=top_user)
+        TaskRunFactory.create_batch(5, project=pr)
+        AnonymousTaskRunFactory.create(project=pr, user_ip='10.0.0.1')
+        AnonymousTaskRunFactory.create(project=pr, user_ip='10.0.0.2')
+        users, anon_users, auth_users = stats_users(pr.id)
+        assert users == dict(n_auth=6, n_anon=2), users
+        assert len(anon_users) == 2, len(anon_users)
+        assert len(auth_users) == 5, len(auth_users)
+        assert auth_users[0] == [top_user.id, 2], auth_users
+
+    def test_stats_format_users(self):
+        """Test CACHE PROJECT STATS format users returns the names of the top
+        users in order and the locations of the anonymous ones."""
+        pr = ProjectFactory.create()
+        top_user = TaskRunFactory.create(project=pr).user
+        TaskRunFactory.create(project=pr, user=top_user)
+        other_user = TaskRunFactory.create(project=pr).user
+        AnonymousTaskRunFactory.create(project=pr, user_ip='10.0.0.1')
+        users, anon_users, auth_users = stats_users(pr.id)
+
+        res = stats_format_users(pr.id, users, anon_users, auth_users)
+
+        top5 = [(u['name'], u['tasks']) for u in res['auth']['top5']]
+        assert top5 == [(top_user.name, 2), (other_user.name, 1)], top5
+        locs = res['anon']['locs']
+        assert locs == [dict(ip='10.0.0.1', tasks=1,
+                             loc=dict(latitude=0, longitude=0))], locs
+        assert res['anon']['top5'] == locs, res['anon']['top5']
+
     def test_stats_users_with_period(self):
         """Test CACHE PROJECT STATS user stats with period works."""
         pr = ProjectFactory.create()
@@ -69,6 +103,16 @@ class TestProjectsStatsCache(Test):
         assert len(anon_users) == 0, len(anon_users)
         assert len(auth_users) == 1, len(auth_users)
 
+    def test_stats_users_with_period_counts_whole_days(self):
+        """Test CACHE PROJECT STATS user stats with period only counts the
+        days fully within the period."""
+        pr = ProjectFactory.create()
+        d = datetime.utcnow() - timedelta(days=7)
+        d = d.replace(hour=23, minute=59)
+        TaskRunFactory.create(project=pr, finish_time=d.isoformat())
+        users, anon_users, auth_users = stats_users(pr.id, '1 week')
+        assert users['n_auth'] == 0, users
+
     def test_stats_dates(self):
         """Test CACHE PROJECT STATS date works."""
         pr = ProjectFactory.create()
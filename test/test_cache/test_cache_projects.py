@@ -16,13 +16,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
-from default import Test, with_context
+from default import Test, with_context, flask_app
 from pybossa.cache import projects as cached_projects
 from factories import UserFactory, ProjectFactory, TaskFactory, \
     TaskRunFactory, AnonymousTaskRunFactory
 from mock import patch
 import datetime
 from pybossa.core import result_repo
+from pybossa.cache import counter_key
+from pybossa.cache.backends import MemoryBackend
 
 
 class TestProjectsCache(Test):
@@ -317,6 +319,23 @@ class TestProjectsCache(Test):
         assert total_volunteers == 5, err_msg
 
 
+    @patch.dict(flask_app.config, {'VOLUNTEERS_HLL': False})
+    def test_n_volunteers_counts_new_task_runs(self):
+        """Test CACHE PROJECTS n_volunteers counts the volunteers of task runs
+        submitted after it was cached"""
+
+        project = self.create_project_with_contributors(anonymous=1, registered=1)
+        assert cached_projects.n_volunteers(project.id) == 2
+
+        task = TaskFactory.create(project=project)
+        TaskRunFactory.create(task=task)
+        AnonymousTaskRunFactory.create(task=task, user_ip='10.0.0.9')
+        total_volunteers = cached_projects.n_volunteers(project.id)
+
+        err_msg = "Volunteers is %s, it should be 4" % total_volunteers
+        assert total_volunteers == 4, err_msg
+
+
     def test_n_draft_no_drafts(self):
         """Test CACHE PROJECTS _n_draft returns 0 if there are no draft projects"""
         project = ProjectFactory.create(published=True)
@@ -415,9 +434,9 @@ class TestProjectsCache(Test):
         assert number_of_featured == 1, number_of_featured
 
 
-    @patch('pybossa.cache.pickle')
+    @patch('pybossa.cache.codec')
     @patch('pybossa.cache.projects._n_draft')
-    def test_n_count_calls_n_draft(self, _n_draft, pickle):
+    def test_n_count_calls_n_draft(self, _n_draft, codec):
         """Test CACHE PROJECTS n_count calls _n_draft when called with argument
         'draft'"""
         cached_projects.n_count('draft')
@@ -425,9 +444,9 @@ class TestProjectsCache(Test):
         _n_draft.assert_called_with()
 
 
-    @patch('pybossa.cache.pickle')
+    @patch('pybossa.cache.codec')
     @patch('pybossa.cache.projects._n_featured')
-    def test_n_count_calls_n_featuredt(self, _n_featured, pickle):
+    def test_n_count_calls_n_featuredt(self, _n_featured, codec):
         """Test CACHE PROJECTS n_count calls _n_featured when called with
         argument 'featured'"""
         cached_projects.n_count('featured')
@@ -571,3 +590,56 @@ class TestProjectsCache(Test):
         average_time = cached_projects.average_contribution_time(project.id)
 
         assert average_time == expected_average_time, average_time
+
+
+    def test_get_counters_returns_counters_of_every_project(self):
+        project = self.create_project_with_contributors(anonymous=2,
+                                                        registered=3)
+        TaskFactory.create(project=project, state='completed')
+        other_project = self.create_project_with_tasks(1, 1)
+        empty_project = ProjectFactory.create()
+        project_ids = [project.id, other_project.id, empty_project.id]
+
+        counters = cached_projects.get_counters(project_ids)
+
+        for project_id in project_ids:
+            expected = dict(
+                last_activity=cached_projects.last_activity(project_id),
+                overall_progress=cached_projects.overall_progress(project_id),
+                n_tasks=cached_projects.n_tasks(project_id),
+                n_volunteers=cached_projects.n_volunteers(project_id))
+            assert counters[project_id] == expected, counters[project_id]
+        assert counters[project.id]['n_volunteers'] == 5, counters
+        assert counters[other_project.id]['overall_progress'] == 50, counters
+        assert counters[empty_project.id]['last_activity'] is None, counters
+
+
+    @patch('pybossa.cache.backend', new_callable=MemoryBackend)
+    def test_counters_are_updated_when_saving_tasks_and_task_runs(self, backend):
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=1)
+        assert cached_projects.n_tasks(project.id) == 1
+        assert cached_projects.n_task_runs(project.id) == 0
+        assert cached_projects.n_completed_tasks(project.id) == 0
+        assert cached_projects.last_activity(project.id) is None
+
+        TaskFactory.create(project=project)
+        task_run = TaskRunFactory.create(task=task)
+        TaskRunFactory.create(task=task)
+
+        assert cached_projects.n_tasks(project.id) == 2
+        assert cached_projects.n_task_runs(project.id) == 2
+        assert cached_projects.n_completed_tasks(project.id) == 1
+        assert cached_projects.overall_progress(project.id) == 50
+        last_activity = cached_projects.last_activity(project.id)
+        assert last_activity >= task_run.finish_time, last_activity
+
+
+    @patch('pybossa.cache.backend', new_callable=MemoryBackend)
+    def test_counters_are_not_created_when_saving_task_runs(self, backend):
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project)
+        TaskRunFactory.create(task=task)
+
+        key = counter_key(cached_projects.n_task_runs, project.id)
+        assert backend.get(key) is None, backend.get(key)
@@ -16,8 +16,10 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
-from default import Test
+from mock import patch
+from default import Test, flask_app
 from pybossa.cache import users as cached_users
+from pybossa.jobs import load_leaderboard
 
 from factories import ProjectFactory, TaskFactory, TaskRunFactory, UserFactory
 from factories import reset_all_pk_sequences
@@ -273,6 +275,45 @@ class TestUsersCache(Test):
         assert len(leaderboard[0].keys()) == len(fields)
 
 
+    @patch.dict(flask_app.config, {'LEADERBOARD_SORTED_SET': True})
+    def test_get_leaderboard_from_sorted_set(self):
+        """Test CACHE USERS get_leaderboard reads the Redis leaderboard once
+        it is loaded, with the task runs saved afterwards"""
+        leader, second, third = UserFactory.create_batch(3)
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project)
+        TaskRunFactory.create_batch(3, user=leader, task=tasks[0])
+        TaskRunFactory.create(user=third, task=tasks[2])
+        load_leaderboard()
+        TaskRunFactory.create_batch(2, user=second, task=tasks[1])
+        user_out_of_top = UserFactory.create()
+
+        leaderboard = cached_users.get_leaderboard(
+            3, user_id=user_out_of_top.id)
+
+        ranks = [(user['id'], user['rank'], user['score'])
+                 for user in leaderboard]
+        assert ranks == [(leader.id, 1, 3), (second.id, 2, 2),
+                         (third.id, 3, 1), (user_out_of_top.id, -1, -1)], ranks
+        assert leaderboard[0]['name'] == leader.name, leaderboard[0]
+
+
+    @patch.dict(flask_app.config, {'LEADERBOARD_SORTED_SET': True})
+    def test_rank_and_score_from_sorted_set(self):
+        """Test CACHE USERS rank_and_score reads the Redis leaderboard once
+        it is loaded"""
+        users = UserFactory.create_batch(2)
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=5)
+        TaskRunFactory.create(user=users[0], task=task)
+        load_leaderboard()
+        TaskRunFactory.create_batch(2, user=users[1], task=task)
+
+        rank_and_score = cached_users.rank_and_score(users[0].id)
+
+        assert rank_and_score == dict(rank=2, score=1), rank_and_score
+
+
     def test_get_total_users_returns_0_if_no_users(self):
         total_users = cached_users.get_total_users()
 
@@ -198,13 +198,12 @@ class TestSiteStatsCache(Test):
         assert long_ago_contributing_user.id not in top5_ids
 
     @patch('pybossa.cache.site_stats.current_app')
-    @patch('pybossa.cache.site_stats.pygeoip.GeoIP')
-    def test_get_locs_returns_list_of_locations_with_each_different_ip(self, geoip_mock, current_app):
+    @patch.object(stats.geolocator, '_lookup')
+    def test_get_locs_returns_list_of_locations_with_each_different_ip(self, lookup, current_app):
         current_app.config = {'GEO': True}
-        geoip_instance = Mock()
+        stats.geolocator.clear()
         ip_addr = lambda ip: {"1.1.1.1": {'latitude': 1, 'longitude': 1}, "2.2.2.2": None}.get(ip)
-        geoip_instance.record_by_addr = ip_addr
-        geoip_mock.return_value = geoip_instance
+        lookup.side_effect = ip_addr
 
         AnonymousTaskRunFactory.create(user_ip="1.1.1.1")
         AnonymousTaskRunFactory.create(user_ip="1.1.1.1")
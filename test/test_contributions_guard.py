@@ -17,7 +17,7 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from redis import StrictRedis
-from pybossa.contributions_guard import ContributionsGuard
+from pybossa.contributions_guard import ContributionsGuard, TaskLeases
 from pybossa.model.task import Task
 from mock import patch
 
@@ -84,3 +84,87 @@ class TestContributionsGuard(object):
         self.guard.stamp(self.task, self.auth_user)
 
         assert self.guard.retrieve_timestamp(self.task, self.auth_user) == 'now'
+
+    def test_stamp_many_registers_every_task(self):
+        tasks = [Task(id=22), Task(id=23)]
+
+        self.guard.stamp_many(tasks, self.auth_user)
+
+        for task in tasks:
+            assert self.guard.check_task_stamped(task, self.auth_user) is True
+
+
+class TestTaskLeases(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.leases = TaskLeases(self.connection)
+        self.anon_user = {'user_id': None, 'user_ip': '127.0.0.1'}
+        self.auth_user = {'user_id': 33, 'user_ip': None}
+
+    def test_acquire_registers_lease_for_user(self):
+        key = 'pybossa:task_leases:task:22'
+
+        assert self.leases.acquire(22, self.auth_user, 1) is True
+
+        assert self.connection.zscore(key, '33') is not None
+
+    def test_acquire_fails_when_all_answers_are_leased(self):
+        self.leases.acquire(22, self.auth_user, 1)
+
+        assert self.leases.acquire(22, self.anon_user, 1) is False
+
+    def test_acquire_allows_as_many_leases_as_answers_left(self):
+        assert self.leases.acquire(22, self.auth_user, 2) is True
+        assert self.leases.acquire(22, self.anon_user, 2) is True
+        assert self.leases.acquire(22, {'user_id': 1, 'user_ip': None}, 2) is False
+
+    def test_acquire_succeeds_again_for_lease_owner(self):
+        self.leases.acquire(22, self.auth_user, 1)
+
+        assert self.leases.acquire(22, self.auth_user, 1) is True
+
+    def test_acquire_reclaims_expired_leases(self):
+        key = 'pybossa:task_leases:task:22'
+        self.connection.zadd(key, 1, '127.0.0.1')
+
+        assert self.leases.acquire(22, self.auth_user, 1) is True
+        assert self.connection.zscore(key, '127.0.0.1') is None
+
+    def test_acquire_expires_key(self):
+        self.leases.acquire(22, self.auth_user, 1)
+
+        ttl = self.connection.ttl('pybossa:task_leases:task:22')
+        assert 0 < ttl <= TaskLeases.LEASE_TTL, ttl
+
+    def test_release_frees_the_lease(self):
+        self.leases.acquire(22, self.auth_user, 1)
+        self.leases.release(22, self.auth_user)
+
+        assert self.leases.acquire(22, self.anon_user, 1) is True
+
+    def test_acquire_many_returns_leased_tasks(self):
+        self.leases.acquire(1, self.anon_user, 1)
+
+        leased = self.leases.acquire_many([1, 2, 3], self.auth_user,
+                                          {1: 1, 2: 1, 3: 0})
+
+        assert leased == [2], leased
+        assert self.connection.zscore('pybossa:task_leases:task:2', '33')
+
+    def test_available_skips_fully_leased_tasks(self):
+        self.leases.acquire(1, self.anon_user, 1)
+        self.leases.acquire(2, self.anon_user, 2)
+
+        available = self.leases.available([1, 2, 3], self.auth_user,
+                                          {1: 1, 2: 2, 3: 1})
+
+        assert available == [2, 3], available
+
+    def test_available_keeps_tasks_leased_by_the_user(self):
+        self.leases.acquire(1, self.auth_user, 1)
+
+        available = self.leases.available([1], self.auth_user, {1: 1})
+
+        assert available == [1], available
@@ -0,0 +1,89 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import pygeoip
+from mock import patch
+from pybossa.geolocation import GeoLocator
+
+
+class TestGeoLocator(object):
+
+    def setUp(self):
+        self.geolocator = GeoLocator()
+        self.geolocator.path = 'GeoLiteCity.dat'
+        self.geolocator.enabled = True
+        self.geolocator.max_size = 2
+
+    @patch('pybossa.geolocation.pygeoip.GeoIP')
+    def test_location_opens_the_database_once(self, geoip):
+        geoip.return_value.record_by_addr.return_value = {'latitude': 1}
+
+        self.geolocator.location('1.1.1.1')
+        self.geolocator.location('2.2.2.2')
+
+        geoip.assert_called_once_with('GeoLiteCity.dat', pygeoip.MMAP_CACHE)
+
+    @patch('pybossa.geolocation.pygeoip.GeoIP')
+    def test_location_is_memoized(self, geoip):
+        record_by_addr = geoip.return_value.record_by_addr
+        record_by_addr.return_value = {'latitude': 1, 'longitude': 2}
+
+        self.geolocator.location('1.1.1.1')
+        location = self.geolocator.location('1.1.1.1')
+
+        assert location == {'latitude': 1, 'longitude': 2}, location
+        assert record_by_addr.call_count == 1, record_by_addr.call_count
+
+    @patch('pybossa.geolocation.pygeoip.GeoIP')
+    def test_location_keeps_the_most_recently_used(self, geoip):
+        record_by_addr = geoip.return_value.record_by_addr
+        record_by_addr.return_value = {'latitude': 1, 'longitude': 2}
+
+        self.geolocator.location('1.1.1.1')
+        self.geolocator.location('2.2.2.2')
+        self.geolocator.location('1.1.1.1')
+        self.geolocator.location('3.3.3.3')
+        self.geolocator.location('1.1.1.1')
+        self.geolocator.location('2.2.2.2')
+
+        assert record_by_addr.call_count == 4, record_by_addr.call_count
+
+    @patch('pybossa.geolocation.pygeoip.GeoIP')
+    def test_location_of_unknown_ip(self, geoip):
+        geoip.return_value.record_by_addr.return_value = None
+
+        location = self.geolocator.location('10.0.0.1')
+
+        assert location == {'latitude': 0, 'longitude': 0}, location
+
+    @patch('pybossa.geolocation.pygeoip.GeoIP')
+    def test_location_without_database(self, geoip):
+        self.geolocator.enabled = False
+
+        location = self.geolocator.location('1.1.1.1')
+
+        assert location == {'latitude': 0, 'longitude': 0}, location
+        assert not geoip.called
+
+    @patch('pybossa.geolocation.pygeoip.GeoIP')
+    def test_location_returns_a_copy(self, geoip):
+        geoip.return_value.record_by_addr.return_value = {'latitude': 1}
+
+        self.geolocator.location('1.1.1.1')['latitude'] = 5
+
+        assert self.geolocator.location('1.1.1.1') == {'latitude': 1}
@@ -0,0 +1,80 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from redis import StrictRedis
+from pybossa.last_answers import LastAnswers
+
+
+class TestLastAnswers(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.answers = LastAnswers(self.connection)
+
+    def test_get_many_leaves_out_missing_tasks(self):
+        self.answers.set(1, 10, {'answer': 'yes'})
+
+        answers = self.answers.get_many(1, [10, 11])
+
+        assert answers == {10: {'answer': 'yes'}}, answers
+
+    def test_set_overwrites_answer(self):
+        self.answers.set(1, 10, {'answer': 'yes'})
+        self.answers.set(1, 10, {'answer': 'no'})
+
+        assert self.answers.get_many(1, [10]) == {10: {'answer': 'no'}}
+
+    def test_set_missing_does_not_overwrite_answer(self):
+        self.answers.set(1, 10, {'answer': 'yes'})
+        self.answers.set_missing(1, {10: {'answer': 'old'}, 11: None})
+
+        answers = self.answers.get_many(1, [10, 11])
+
+        assert answers == {10: {'answer': 'yes'}, 11: None}, answers
+
+    def test_set_expires_answers(self):
+        self.answers.set(1, 10, 'yes')
+
+        assert self.connection.ttl('pybossa:last_answers:project:1') > 0
+
+    def test_set_does_not_extend_expiration(self):
+        self.answers.set(1, 10, 'yes')
+        self.connection.expire('pybossa:last_answers:project:1', 100)
+        self.answers.set(1, 11, 'yes')
+
+        assert self.connection.ttl('pybossa:last_answers:project:1') <= 100
+
+    def test_set_drops_answers_beyond_max(self):
+        self.answers.MAX_ANSWERS = 2
+        for task_id in range(3):
+            self.answers.set(1, task_id, 'yes')
+
+        assert self.answers.get_many(1, range(3)) == {}
+
+    def test_delete(self):
+        self.answers.set(1, 10, 'yes')
+        self.answers.delete(1, 10)
+
+        assert self.answers.get_many(1, [10]) == {}
+
+    def test_reset(self):
+        self.answers.set(1, 10, 'yes')
+        self.answers.reset(1)
+
+        assert self.answers.get_many(1, [10]) == {}
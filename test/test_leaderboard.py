@@ -0,0 +1,102 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from redis import StrictRedis
+from pybossa.leaderboard import Leaderboard
+
+
+class TestLeaderboard(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.leaderboard = Leaderboard(self.connection)
+
+    def test_is_none_if_not_loaded(self):
+        self.leaderboard.add(1)
+
+        assert self.leaderboard.top(10) is None
+        assert self.leaderboard.rank_and_score(1) is None
+
+    def test_load_empty_leaderboard(self):
+        self.leaderboard.load([])
+
+        assert self.leaderboard.top(10) == []
+        assert self.leaderboard.rank_and_score(1) == dict(rank=None,
+                                                          score=None)
+
+    def test_load_replaces_leaderboard(self):
+        self.leaderboard.load([(1, 3), (2, 1)])
+        self.leaderboard.load([(2, 1)])
+
+        assert self.leaderboard.top(10) == [(2, 1, 1)]
+
+    def test_top_sorts_by_score(self):
+        self.leaderboard.load([(1, 1), (2, 5), (3, 2)])
+
+        top = self.leaderboard.top(2)
+
+        assert top == [(2, 1, 5), (3, 2, 2)], top
+
+    def test_top_ties_share_rank(self):
+        self.leaderboard.load([(1, 5), (2, 3), (3, 3), (4, 1)])
+
+        top = self.leaderboard.top(4)
+
+        assert [rank for user_id, rank, score in top] == [1, 2, 2, 4], top
+
+    def test_rank_and_score_ties_share_rank(self):
+        self.leaderboard.load([(1, 5), (2, 3), (3, 3), (4, 1)])
+
+        assert self.leaderboard.rank_and_score(3) == dict(rank=2, score=3)
+        assert self.leaderboard.rank_and_score(4) == dict(rank=4, score=1)
+
+    def test_add_increments_score(self):
+        self.leaderboard.load([(1, 1), (2, 2)])
+
+        self.leaderboard.add(1)
+        self.leaderboard.add(1)
+        self.leaderboard.add(None)
+
+        assert self.leaderboard.top(10) == [(1, 1, 3), (2, 2, 2)]
+
+    def test_add_drops_users_without_task_runs(self):
+        self.leaderboard.load([(1, 1), (2, 2)])
+
+        self.leaderboard.add(1, -1)
+
+        assert self.leaderboard.top(10) == [(2, 1, 2)]
+        assert self.leaderboard.rank_and_score(1) == dict(rank=None,
+                                                          score=None)
+
+    def test_subtract_decrements_scores(self):
+        self.leaderboard.load([(1, 3), (2, 2), (3, 1)])
+
+        self.leaderboard.subtract([(1, 1), (2, 2)])
+
+        assert self.leaderboard.top(10) == [(1, 1, 2), (3, 2, 1)]
+        assert self.leaderboard.rank_and_score(2) == dict(rank=None,
+                                                          score=None)
+
+    def test_reset(self):
+        self.leaderboard.load([(1, 1)])
+
+        self.leaderboard.reset()
+
+        assert not self.leaderboard.is_loaded()
+        assert self.connection.zcard(Leaderboard.KEY) == 0
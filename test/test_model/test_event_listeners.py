@@ -16,7 +16,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
-from default import Test, with_context
+from default import Test, with_context, flask_app
 from factories import TaskFactory, TaskRunFactory
 from mock import patch, MagicMock
 from pybossa.core import task_repo, result_repo
@@ -128,3 +128,98 @@ class TestModelEventListeners(Test):
         result = result[0]
         err_msg = "The result should ID should be the same"
         assert result_id == result.id, err_msg
+
+    @with_context
+    def test_update_task_state_only_once(self):
+        """Test update_task_state returns False for completed tasks."""
+        from pybossa.core import db
+        task = TaskFactory.create()
+        conn = db.engine.connect()
+
+        assert update_task_state(conn, task.id) is True
+        assert update_task_state(conn, task.id) is False
+
+    @with_context
+    @patch('pybossa.model.event_listeners.cached_projects')
+    def test_count_task(self, mock_cached_projects):
+        """Test count_task adds the task to the project counters."""
+        task = TaskFactory.create(state='completed')
+
+        mock_cached_projects.add_task.assert_called_with(task.project_id,
+                                                         True)
+
+    @with_context
+    def test_after_commit_calls_function_on_commit(self):
+        """Test after_commit calls the function once the session commits"""
+        from pybossa.core import db
+        task = TaskFactory.create()
+        function = MagicMock()
+
+        after_commit(task, function, 1, 2)
+        assert not function.called
+        db.session.commit()
+
+        function.assert_called_once_with(1, 2)
+
+    @with_context
+    def test_after_commit_drops_function_on_rollback(self):
+        """Test after_commit does not call the function if the session
+        rolls back"""
+        from pybossa.core import db
+        task = TaskFactory.create()
+        function = MagicMock()
+
+        task.n_answers = 5
+        db.session.flush()
+        after_commit(task, function)
+        db.session.rollback()
+        db.session.commit()
+
+        assert not function.called
+
+    @with_context
+    @patch('pybossa.model.event_listeners.cached_projects')
+    def test_counters_are_not_updated_on_rollback(self, mock_cached_projects):
+        """Test the cached counters are not updated for task runs that
+        are rolled back"""
+        from pybossa.core import db
+        task = TaskFactory.create()
+        mock_cached_projects.reset_mock()
+
+        db.session.add(TaskRunFactory.build(task=task, project=task.project))
+        db.session.flush()
+        db.session.rollback()
+
+        assert not mock_cached_projects.add_task_run.called
+
+    @with_context
+    @patch.dict(flask_app.config, {'VOLUNTEERS_HLL': True})
+    @patch('pybossa.model.event_listeners.VolunteerCounter')
+    def test_volunteers_are_not_counted_on_rollback(self, mock_counter):
+        """Test the volunteer counters are only updated for task runs that
+        are committed"""
+        from pybossa.core import db
+        task = TaskFactory.create()
+
+        db.session.add(TaskRunFactory.build(task=task, project=task.project))
+        db.session.flush()
+        db.session.rollback()
+        assert not mock_counter.return_value.add.called
+
+        task_run = TaskRunFactory.create(task=task, project=task.project)
+        mock_counter.return_value.add.assert_called_once_with(
+            task.project_id, task_run.user_id, task_run.user_ip)
+
+    @with_context
+    @patch('pybossa.model.event_listeners.cached_projects')
+    def test_taskrun_submit_counts_task_run(self, mock_cached_projects):
+        """Test on_taskrun_submit counts the task run and the task once
+        it is completed."""
+        task = TaskFactory.create(n_answers=1)
+        task_run = TaskRunFactory.create(task=task)
+
+        mock_cached_projects.add_task_run.assert_called_with(
+            task.project_id, task_run.finish_time)
+        mock_cached_projects.complete_task.assert_called_once_with(
+            task.project_id)
+
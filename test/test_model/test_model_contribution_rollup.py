@@ -0,0 +1,138 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+from datetime import datetime, timedelta
+
+from default import Test, db, with_context
+from factories import (ProjectFactory, TaskFactory, TaskRunFactory,
+                       AnonymousTaskRunFactory)
+from pybossa.core import task_repo
+from pybossa.model.contribution_rollup import refresh_contribution_rollup
+
+
+class TestModelContributionRollup(Test):
+
+    def rollup(self, project_id):
+        sql = '''SELECT day, hour, anonymous, n_task_runs, n_answered_tasks
+              FROM contribution_rollup WHERE project_id=:project_id
+              AND (n_task_runs != 0 OR n_answered_tasks != 0)
+              ORDER BY day, hour, anonymous'''
+        rows = db.session.execute(sql, dict(project_id=project_id))
+        return [tuple(row) for row in rows]
+
+    def refreshed_rollup(self, project_id):
+        refresh_contribution_rollup(db.session, project_id)
+        db.session.commit()
+        return self.rollup(project_id)
+
+    @with_context
+    def test_rollup_is_updated_with_task_runs(self):
+        """Test CONTRIBUTION_ROLLUP counts the task runs per hour."""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=3)
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        TaskRunFactory.create(task=tasks[0], finish_time=yesterday.isoformat())
+        TaskRunFactory.create(task=tasks[0])
+        AnonymousTaskRunFactory.create(task=tasks[1])
+
+        rollup = self.rollup(project.id)
+
+        today = datetime.utcnow()
+        assert rollup == [
+            (yesterday.strftime('%Y-%m-%d'), yesterday.hour, False, 1, 0),
+            (today.strftime('%Y-%m-%d'), today.hour, False, 1, 1),
+            (today.strftime('%Y-%m-%d'), today.hour, True, 1, 1)], rollup
+        assert rollup == self.refreshed_rollup(project.id)
+
+    @with_context
+    def test_older_task_run_does_not_move_task(self):
+        """Test CONTRIBUTION_ROLLUP keeps the task in the bucket of its
+        latest task run."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=3)
+        TaskRunFactory.create(task=task)
+        last_week = datetime.utcnow() - timedelta(days=7)
+        TaskRunFactory.create(task=task, finish_time=last_week.isoformat())
+
+        rollup = self.rollup(project.id)
+
+        assert [row[4] for row in rollup] == [0, 1], rollup
+        assert rollup == self.refreshed_rollup(project.id)
+
+    @with_context
+    def test_rollup_is_updated_when_deleting(self):
+        """Test CONTRIBUTION_ROLLUP takes out deleted task runs."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project)
+        task_runs = TaskRunFactory.create_batch(2, task=task)
+
+        task_repo.delete(task_runs[0])
+        assert self.rollup(project.id)[0][3:] == (1, 1)
+
+        task_repo.delete_taskruns_from_project(project)
+        assert self.rollup(project.id) == []
+
+    @with_context
+    def test_deleting_latest_task_run_moves_task(self):
+        """Test CONTRIBUTION_ROLLUP moves the task back to the bucket of its
+        previous task run when the latest one is deleted."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=3)
+        last_week = datetime.utcnow() - timedelta(days=7)
+        TaskRunFactory.create(task=task, finish_time=last_week.isoformat())
+        latest = TaskRunFactory.create(task=task)
+
+        task_repo.delete(latest)
+
+        rollup = self.rollup(project.id)
+        assert rollup == [(last_week.strftime('%Y-%m-%d'), last_week.hour,
+                           False, 1, 1)], rollup
+
+    @with_context
+    def test_deleting_task_takes_out_its_task_runs(self):
+        """Test CONTRIBUTION_ROLLUP takes out the task runs of a deleted
+        task."""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=3)
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        TaskRunFactory.create(task=tasks[0], finish_time=yesterday.isoformat())
+        TaskRunFactory.create(task=tasks[0])
+        AnonymousTaskRunFactory.create(task=tasks[0])
+        TaskRunFactory.create(task=tasks[1])
+
+        task_repo.delete(tasks[0])
+
+        rollup = self.rollup(project.id)
+        assert [row[3:] for row in rollup] == [(1, 1)], rollup
+        assert rollup == self.refreshed_rollup(project.id)
+
+    @with_context
+    def test_rollup_is_updated_when_updating(self):
+        """Test CONTRIBUTION_ROLLUP moves an updated task run, and its task,
+        to the bucket of its new finish_time."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=3)
+        TaskRunFactory.create(task=task)
+        task_run = TaskRunFactory.create(task=task)
+        last_week = datetime.utcnow() - timedelta(days=7)
+
+        task_run.finish_time = last_week.isoformat()
+        task_repo.update(task_run)
+
+        rollup = self.rollup(project.id)
+        assert [row[3:] for row in rollup] == [(1, 0), (1, 1)], rollup
+        assert rollup == self.refreshed_rollup(project.id)
@@ -0,0 +1,184 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, db, with_context
+from factories import ProjectFactory, TaskFactory, TaskRunFactory
+from pybossa.core import task_repo, result_repo
+from pybossa.model.project_stats import ProjectStats, refresh_project_stats
+
+
+class TestModelProjectStats(Test):
+
+    def stats(self, project_id):
+        stats = db.session.query(ProjectStats).get(project_id)
+        db.session.expire(stats)
+        return stats.dictize()
+
+    def refreshed_stats(self, project_id):
+        refresh_project_stats(db.session, project_id)
+        db.session.commit()
+        return self.stats(project_id)
+
+    @with_context
+    def test_new_project_has_empty_stats(self):
+        """Test PROJECT_STATS row is created with the project."""
+        project = ProjectFactory.create()
+
+        stats = self.stats(project.id)
+
+        assert stats['n_tasks'] == 0, stats
+        assert stats['n_task_runs'] == 0, stats
+        assert stats['last_activity'] is None, stats
+
+    @with_context
+    def test_stats_are_updated_with_tasks_and_task_runs(self):
+        """Test PROJECT_STATS is updated as tasks and task runs are saved."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=2)
+        TaskFactory.create(project=project, n_answers=3, state='completed')
+        TaskRunFactory.create(task=task)
+        last_task_run = TaskRunFactory.create(task=task)
+        TaskRunFactory.create(task=task)
+
+        stats = self.stats(project.id)
+
+        assert stats['n_tasks'] == 2, stats
+        assert stats['n_completed_tasks'] == 2, stats
+        assert stats['n_answers'] == 5, stats
+        assert stats['n_task_runs'] == 3, stats
+        assert stats['last_activity'] >= last_task_run.finish_time, stats
+        refreshed = self.refreshed_stats(project.id)
+        assert abs(stats.pop('contribution_time') -
+                   refreshed.pop('contribution_time')) < 1e-3, refreshed
+        assert stats == refreshed, refreshed
+
+    @with_context
+    def test_stats_count_results_with_info(self):
+        """Test PROJECT_STATS counts the results once they get info."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=1)
+        TaskRunFactory.create(task=task)
+        result = result_repo.get_by(project_id=project.id)
+        assert self.stats(project.id)['n_results'] == 0
+
+        result.info = dict(answer='yes')
+        result_repo.update(result)
+
+        assert self.stats(project.id)['n_results'] == 1
+        assert self.refreshed_stats(project.id)['n_results'] == 1
+
+    @with_context
+    def test_stats_are_updated_when_deleting(self):
+        """Test PROJECT_STATS takes out a deleted task and its task runs."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=2)
+        TaskRunFactory.create_batch(2, task=task)
+        TaskFactory.create(project=project, n_answers=3)
+
+        task_repo.delete(task)
+
+        stats = self.stats(project.id)
+        assert stats['n_tasks'] == 1, stats
+        assert stats['n_completed_tasks'] == 0, stats
+        assert stats['n_answers'] == 3, stats
+        assert stats['n_task_runs'] == 0, stats
+        assert stats['n_results'] == 0, stats
+        assert stats['last_activity'] is None, stats
+        assert stats == self.refreshed_stats(project.id), stats
+
+    @with_context
+    def test_last_activity_is_computed_again_when_deleting_latest(self):
+        """Test PROJECT_STATS last_activity goes back to the previous task
+        run when the latest one is deleted."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=3)
+        first = TaskRunFactory.create(task=task)
+        latest = TaskRunFactory.create(task=task)
+
+        task_repo.delete(latest)
+
+        stats = self.stats(project.id)
+        assert stats['n_task_runs'] == 1, stats
+        assert stats['last_activity'] == first.finish_time, stats
+
+    @with_context
+    def test_stats_are_updated_with_task_changes(self):
+        """Test PROJECT_STATS follows the state and n_answers of updated
+        tasks."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=2)
+
+        task.state = 'completed'
+        task.n_answers = 4
+        task_repo.update(task)
+
+        stats = self.stats(project.id)
+        assert stats['n_completed_tasks'] == 1, stats
+        assert stats['n_answers'] == 4, stats
+        assert stats == self.refreshed_stats(project.id), stats
+
+    @with_context
+    def test_contribution_time_follows_task_run_changes(self):
+        """Test PROJECT_STATS contribution time and last_activity follow the
+        timestamps of updated task runs."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=3)
+        TaskRunFactory.create(task=task)
+        task_run = TaskRunFactory.create(task=task)
+
+        task_run.created = '2016-01-01T10:00:00.000000'
+        task_run.finish_time = '2016-01-01T10:00:30.000000'
+        task_repo.update(task_run)
+
+        stats = self.stats(project.id)
+        refreshed = self.refreshed_stats(project.id)
+        assert abs(stats.pop('contribution_time') -
+                   refreshed.pop('contribution_time')) < 1e-3, refreshed
+        assert stats == refreshed, refreshed
+
+    @with_context
+    def test_task_runs_without_time_are_not_averaged(self):
+        """Test PROJECT_STATS only averages the contribution time of the task
+        runs with both timestamps."""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=3)
+        TaskRunFactory.create(task=task,
+                              created='2016-01-01T10:00:00.000000',
+                              finish_time='2016-01-01T10:00:10.000000')
+        task_run = TaskRunFactory.create(task=task)
+
+        task_run.created = None
+        task_repo.update(task_run)
+
+        stats = self.stats(project.id)
+
+        assert stats['n_task_runs'] == 2, stats
+        assert stats['n_timed_task_runs'] == 1, stats
+        assert abs(stats['contribution_time'] - 10) < 1e-3, stats
+        assert stats == self.refreshed_stats(project.id), stats
+
+    @with_context
+    def test_missing_stats_are_computed_again(self):
+        """Test PROJECT_STATS row is computed again if it is missing."""
+        project = ProjectFactory.create()
+        db.session.execute('DELETE FROM project_stats')
+        db.session.commit()
+
+        TaskFactory.create_batch(2, project=project)
+
+        assert self.stats(project.id)['n_tasks'] == 2
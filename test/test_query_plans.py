@@ -0,0 +1,172 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Query plans of the hot SQL queries.
+
+Every SQL query run by the schedulers, the task run listeners and the per
+project (and per user) cached stats is recorded and EXPLAINed with
+sequential scans disabled, so a query that could not use an index for
+task, task_run or result (and would scan the whole table) makes the test
+fail. Site wide stats are left out, as they read whole tables by design.
+"""
+import json
+
+from mock import patch
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from default import Test, db, flask_app, with_context
+from factories import (ProjectFactory, TaskFactory, TaskRunFactory,
+                       AnonymousTaskRunFactory, UserFactory)
+import pybossa.sched as sched
+from pybossa.cache import projects as cached_projects
+from pybossa.cache import project_stats as cached_project_stats
+from pybossa.cache import users as cached_users
+from pybossa.cache.helpers import n_available_tasks
+
+
+HOT_TABLES = ('task', 'task_run', 'result')
+SCHED_CONFIGS = [{}, {'SCHED_TASK_POOL': True},
+                 {'SCHED_ANSWERED_BITMAPS': True},
+                 {'SCHED_TASK_LEASES': True}]
+
+
+class QueryRecorder(object):
+
+    """Record the SQL queries run by every engine within the block."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if not executemany and verb in ('SELECT', 'WITH', 'UPDATE', 'DELETE'):
+            self.queries.append((statement, parameters))
+
+
+def full_scans(plan):
+    """Return the nodes of a JSON query plan scanning a whole hot table."""
+    scans = []
+    if plan.get('Relation Name') in HOT_TABLES:
+        if plan['Node Type'] == 'Seq Scan':
+            scans.append(plan)
+        if (plan['Node Type'] in ('Index Scan', 'Index Only Scan') and
+                'Index Cond' not in plan):
+            scans.append(plan)
+    for child in plan.get('Plans', []):
+        scans += full_scans(child)
+    return scans
+
+
+class TestQueryPlans(Test):
+
+    def setUp(self):
+        super(TestQueryPlans, self).setUp()
+        with self.flask_app.app_context():
+            self.project = ProjectFactory.create()
+            self.user = UserFactory.create()
+            tasks = TaskFactory.create_batch(10, project=self.project,
+                                             n_answers=2)
+            for task in tasks[:5]:
+                TaskRunFactory.create(task=task, user=self.user)
+                AnonymousTaskRunFactory.create(task=task)
+            self.task = tasks[5]
+
+    def assert_no_full_scans(self, queries):
+        assert queries, 'No queries recorded'
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SET enable_seqscan = off')
+            errors = []
+            for statement, parameters in queries:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + statement,
+                               parameters)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, basestring):
+                    plan = json.loads(plan)
+                for node in full_scans(plan[0]['Plan']):
+                    errors.append('%s on %s in:\n%s' % (
+                        node['Node Type'], node['Relation Name'], statement))
+            connection.rollback()
+        finally:
+            connection.close()
+        assert not errors, '\n\n'.join(errors)
+
+    @with_context
+    def test_schedulers(self):
+        """Test the queries of every scheduler use indexes"""
+        users = [dict(user_id=self.user.id, user_ip=None),
+                 dict(user_id=None, user_ip='127.0.0.1')]
+        with QueryRecorder() as recorder:
+            for config in SCHED_CONFIGS:
+                with patch.dict(flask_app.config, config):
+                    for sched_name in sched.sched_map:
+                        for user in users:
+                            task = sched.new_task(self.project.id,
+                                                  sched_name, **user)
+                            if task:
+                                sched.task_cursor(sched_name, task)
+        self.assert_no_full_scans(recorder.queries)
+
+    @with_context
+    def test_n_available_tasks(self):
+        """Test the queries counting the available tasks use indexes"""
+        with QueryRecorder() as recorder:
+            for config in SCHED_CONFIGS:
+                with patch.dict(flask_app.config, config):
+                    n_available_tasks(self.project.id, user_id=self.user.id)
+                    n_available_tasks(self.project.id, user_ip='127.0.0.1')
+        self.assert_no_full_scans(recorder.queries)
+
+    @with_context
+    def test_task_run_listeners(self):
+        """Test the queries run when a task run completes a task (and
+        creates its result) use indexes"""
+        with QueryRecorder() as recorder:
+            TaskRunFactory.create(task=self.task)
+            AnonymousTaskRunFactory.create(task=self.task)
+        self.assert_no_full_scans(recorder.queries)
+
+    @with_context
+    def test_project_stats(self):
+        """Test the queries of the cached project stats use indexes"""
+        project_id = self.project.id
+        with QueryRecorder() as recorder:
+            cached_projects.browse_tasks(project_id)
+            cached_projects.get_counters([project_id])
+            cached_projects.average_contribution_time(project_id)
+            cached_project_stats.stats_users(project_id)
+            cached_project_stats.stats_users(project_id, '1 week')
+            cached_project_stats.stats_dates(project_id)
+            cached_project_stats.stats_hours(project_id)
+        self.assert_no_full_scans(recorder.queries)
+
+    @with_context
+    def test_user_stats(self):
+        """Test the queries of the cached stats of a user use indexes"""
+        with QueryRecorder() as recorder:
+            cached_users.projects_contributed(self.user.id)
+        self.assert_no_full_scans(recorder.queries)
@@ -17,7 +17,8 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 # Cache global variables for timeouts
 
-from default import Test, db
+from default import Test, db, flask_app, with_context
+from mock import patch
 from nose.tools import assert_raises
 from factories import ProjectFactory, CategoryFactory
 from pybossa.repositories import ProjectRepository
@@ -245,6 +246,29 @@ class TestProjectRepositoryForProjects(Test):
         assert deleted_taskrun is None, deleted_taskrun
 
 
+    @with_context
+    @patch.dict(flask_app.config, {'LEADERBOARD_SORTED_SET': True})
+    def test_delete_subtracts_taskruns_from_leaderboard(self):
+        """Test delete takes the task runs of the project out of the scores
+        of their users instead of resetting the leaderboard"""
+        from factories import TaskFactory, TaskRunFactory, UserFactory
+        from pybossa.core import sentinel
+        from pybossa.leaderboard import Leaderboard
+
+        user = UserFactory.create()
+        project = ProjectFactory.create()
+        TaskRunFactory.create(task=TaskFactory.create(project=project),
+                              user=user)
+        TaskRunFactory.create(user=user)
+        leaderboard = Leaderboard(sentinel.master)
+        leaderboard.load([(user.id, 2)])
+
+        self.project_repo.delete(project)
+
+        assert leaderboard.is_loaded()
+        assert leaderboard.top(10) == [(user.id, 1, 1)], leaderboard.top(10)
+
+
     def test_delete_only_deletes_projects(self):
         """Test delete raises a WrongObjectError if is requested to delete other
         than a project"""
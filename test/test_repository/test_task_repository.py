@@ -17,9 +17,13 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 # Cache global variables for timeouts
 
-from default import Test, db
+from default import Test, db, flask_app, with_context
+from mock import patch
 from nose.tools import assert_raises
 from factories import TaskFactory, TaskRunFactory, ProjectFactory
+from factories import UserFactory
+from pybossa.core import sentinel
+from pybossa.leaderboard import Leaderboard
 from pybossa.repositories import TaskRepository, ProjectRepository
 from pybossa.exc import WrongObjectError, DBIntegrityError
 from pybossa.model.task import Task
@@ -595,6 +599,43 @@ class TestTaskRepositorySaveDeleteUpdate(Test):
         assert deleted is None, deleted
 
 
+    @with_context
+    @patch.dict(flask_app.config, {'LEADERBOARD_SORTED_SET': True})
+    def test_delete_task_subtracts_taskruns_from_leaderboard(self):
+        """Test delete takes the task runs of the task out of the scores of
+        their users"""
+        user, other = UserFactory.create_batch(2)
+        task = TaskFactory.create(n_answers=3)
+        TaskRunFactory.create_batch(2, task=task, user=user)
+        TaskRunFactory.create(user=user)
+        TaskRunFactory.create(task=task, user=other)
+        leaderboard = Leaderboard(sentinel.master)
+        leaderboard.load([(user.id, 3), (other.id, 1)])
+
+        self.task_repo.delete(task)
+
+        assert leaderboard.top(10) == [(user.id, 1, 1)], leaderboard.top(10)
+
+
+    @with_context
+    @patch.dict(flask_app.config, {'LEADERBOARD_SORTED_SET': True})
+    def test_delete_taskruns_from_project_subtracts_from_leaderboard(self):
+        """Test delete_taskruns_from_project takes the task runs out of the
+        scores of their users instead of resetting the leaderboard"""
+        user = UserFactory.create()
+        task = TaskFactory.create()
+        project = project_repo.get(task.project_id)
+        TaskRunFactory.create(task=task, user=user)
+        TaskRunFactory.create(user=user)
+        leaderboard = Leaderboard(sentinel.master)
+        leaderboard.load([(user.id, 2)])
+
+        self.task_repo.delete_taskruns_from_project(project)
+
+        assert leaderboard.is_loaded()
+        assert leaderboard.top(10) == [(user.id, 1, 1)], leaderboard.top(10)
+
+
     def test_delete_only_deletes_tasks(self):
         """Test delete raises a WrongObjectError if is requested to delete other
         than a task"""
@@ -20,9 +20,10 @@ import json
 import random
 
 from mock import patch
+from nose.tools import assert_raises
 
 from helper import sched
-from default import Test, db, with_context
+from default import Test, db, with_context, flask_app
 from pybossa.model.task import Task
 from pybossa.model.project import Project
 from pybossa.model.user import User
@@ -421,3 +422,581 @@ class TestGetBreadthFirst(Test):
         tr = TaskRun(project=project, task=task, user=user)
         db.session.add(tr)
         db.session.commit()
+
+
+class TestTaskPoolSched(Test):
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_POOL': True})
+    def test_depth_first_uses_task_pool_priority(self):
+        """Test SCHED depth first with task pool returns the highest
+        priority task"""
+        project = ProjectFactory.create()
+        TaskFactory.create_batch(3, project=project, priority_0=0.1)
+        high = TaskFactory.create(project=project, priority_0=0.9)
+
+        task = pybossa.sched.get_depth_first_task(project.id)
+
+        assert task.id == high.id, task
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_POOL': True})
+    def test_depth_first_task_pool_skips_answered_tasks(self):
+        """Test SCHED depth first with task pool does not return tasks
+        already answered by the user"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=10)
+        AnonymousTaskRunFactory.create(project=project, task=tasks[0],
+                                       user_ip='127.0.0.1')
+
+        task = pybossa.sched.get_depth_first_task(project.id,
+                                                  user_ip='127.0.0.1')
+
+        assert task.id == tasks[1].id, task
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_POOL': True})
+    def test_depth_first_task_pool_skips_completed_tasks(self):
+        """Test SCHED depth first with task pool drops tasks when they are
+        completed"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=1)
+        pybossa.sched.get_depth_first_task(project.id)
+        TaskRunFactory.create(project=project, task=tasks[0])
+
+        task = pybossa.sched.get_depth_first_task(project.id,
+                                                  user_ip='10.0.0.1')
+
+        assert task.id == tasks[1].id, task
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_POOL': True})
+    def test_task_pool_ignores_rolled_back_tasks(self):
+        """Test SCHED task pool does not get tasks that are rolled back"""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project)
+        pybossa.sched.get_depth_first_task(project.id)
+
+        db.session.add(TaskFactory.build(project=project, priority_0=0.9))
+        db.session.flush()
+        db.session.rollback()
+
+        assert pybossa.sched.get_depth_first_task(project.id).id == task.id
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_POOL': True})
+    def test_answers_pool_ignores_rolled_back_task_runs(self):
+        """Test SCHED answers pool does not count task runs that are
+        rolled back"""
+        from pybossa.core import sentinel
+        from pybossa.task_pool import AnswersPool
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=10)
+        pybossa.sched.get_breadth_first_task(project.id)
+
+        db.session.add(TaskRunFactory.build(project=project, task=task))
+        db.session.flush()
+        db.session.rollback()
+
+        key = AnswersPool.KEY_PREFIX % project.id
+        assert sentinel.master.zscore(key, '%010d' % task.id) == 0
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_POOL': True})
+    def test_breadth_first_uses_answers_pool(self):
+        """Test SCHED breadth first with task pool returns the task with
+        less task runs"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=10)
+        pybossa.sched.get_breadth_first_task(project.id)
+        AnonymousTaskRunFactory.create(project=project, task=tasks[0],
+                                       user_ip='10.0.0.1')
+
+        task = pybossa.sched.get_breadth_first_task(project.id,
+                                                    user_ip='10.0.0.2')
+
+        assert task.id == tasks[1].id, task
+
+        AnonymousTaskRunFactory.create(project=project, task=tasks[1],
+                                       user_ip='10.0.0.2')
+        AnonymousTaskRunFactory.create(project=project, task=tasks[1],
+                                       user_ip='10.0.0.3')
+
+        task = pybossa.sched.get_breadth_first_task(project.id,
+                                                    user_ip='10.0.0.4')
+
+        assert task.id == tasks[0].id, task
+
+
+class TestTaskLeasesSched(Test):
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_LEASES': True})
+    def test_newtask_skips_fully_leased_tasks(self):
+        """Test SCHED newtask does not give the same task to more volunteers
+        than answers it needs"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=1)
+        url = 'api/project/%s/newtask' % project.id
+
+        res = self.app.get(url, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        first = json.loads(res.data)
+        res = self.app.get(url, environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        second = json.loads(res.data)
+        res = self.app.get(url, environ_base={'REMOTE_ADDR': '10.0.0.3'})
+        third = json.loads(res.data)
+
+        assert first['id'] == tasks[0].id, first
+        assert second['id'] == tasks[1].id, second
+        assert third == {}, third
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_LEASES': True})
+    def test_newtask_returns_leased_task_to_lease_owner(self):
+        """Test SCHED newtask gives the leased task again to its owner"""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=1)
+        url = 'api/project/%s/newtask' % project.id
+
+        self.app.get(url, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        res = self.app.get(url, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        data = json.loads(res.data)
+
+        assert data['id'] == task.id, data
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_LEASES': True})
+    @patch('pybossa.api._lease_task', return_value=False)
+    def test_newtask_asks_to_retry_if_leases_are_lost(self, lease_task):
+        """Test SCHED newtask returns a retryable error, not an empty task,
+        when other volunteers keep taking the leases of the open tasks"""
+        from pybossa.api import LEASE_RETRIES
+        project = ProjectFactory.create()
+        TaskFactory.create(project=project, n_answers=1)
+        url = 'api/project/%s/newtask' % project.id
+
+        res = self.app.get(url)
+        err = json.loads(res.data)
+
+        assert res.status_code == 503, res.status_code
+        assert err['exception_cls'] == 'ServiceUnavailable', err
+        assert lease_task.call_count == LEASE_RETRIES, lease_task.call_count
+
+
+class TestNewTasks(Test):
+
+    @with_context
+    def test_new_tasks_returns_up_to_limit_tasks(self):
+        """Test SCHED new_tasks returns a batch of tasks in scheduler order"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project)
+
+        batch = pybossa.sched.new_tasks(project.id, 'default',
+                                        user_ip='10.0.0.1', limit=2)
+
+        assert [t.id for t in batch] == [tasks[0].id, tasks[1].id], batch
+
+
+class TestAnsweredTasksSched(Test):
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_ANSWERED_BITMAPS': True})
+    def test_depth_first_skips_answered_tasks(self):
+        """Test SCHED depth first with answered bitmaps does not return tasks
+        already answered by the user"""
+        project = ProjectFactory.create()
+        user = UserFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project, n_answers=10)
+        TaskRunFactory.create(project=project, task=tasks[0], user=user)
+
+        task = pybossa.sched.get_depth_first_task(project.id, user.id)
+        assert task.id == tasks[1].id, task
+
+        TaskRunFactory.create(project=project, task=tasks[1], user=user)
+
+        task = pybossa.sched.get_depth_first_task(project.id, user.id)
+        assert task.id == tasks[2].id, task
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_ANSWERED_BITMAPS': True})
+    def test_answered_bitmaps_ignore_rolled_back_task_runs(self):
+        """Test SCHED answered bitmaps do not mark tasks answered by task
+        runs that are rolled back"""
+        project = ProjectFactory.create()
+        user = UserFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=10)
+        pybossa.sched.get_depth_first_task(project.id, user.id)
+
+        db.session.add(TaskRunFactory.build(project=project, task=tasks[0],
+                                            user=user))
+        db.session.flush()
+        db.session.rollback()
+
+        task = pybossa.sched.get_depth_first_task(project.id, user.id)
+        assert task.id == tasks[0].id, task
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_ANSWERED_BITMAPS': True})
+    def test_breadth_first_skips_answered_tasks(self):
+        """Test SCHED breadth first with answered bitmaps does not return
+        tasks already answered by the user"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=10)
+        AnonymousTaskRunFactory.create(project=project, task=tasks[1],
+                                       user_ip='10.0.0.1')
+
+        task = pybossa.sched.get_breadth_first_task(project.id,
+                                                    user_ip='10.0.0.1')
+
+        assert task.id == tasks[0].id, task
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_ANSWERED_BITMAPS': True})
+    def test_n_available_tasks_with_answered_bitmaps(self):
+        """Test n_available_tasks still counts with answered bitmaps on"""
+        from pybossa.cache.helpers import n_available_tasks
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project, n_answers=10)
+        AnonymousTaskRunFactory.create(project=project, task=tasks[0],
+                                       user_ip='10.0.0.1')
+
+        n_tasks = n_available_tasks(project.id, user_ip='10.0.0.1')
+
+        assert n_tasks == 2, n_tasks
+
+
+class TestWeightedRandomSched(Test):
+
+    def load_table(self, project_id):
+        from pybossa.jobs import rebuild_alias_table
+        assert rebuild_alias_table(project_id)
+
+    @with_context
+    def test_weighted_random_prefers_higher_priority(self):
+        """Test SCHED weighted random returns high priority tasks more often"""
+        project = ProjectFactory.create(info=dict(sched='weighted_random'))
+        low = TaskFactory.create(project=project, priority_0=0.0)
+        high = TaskFactory.create(project=project, priority_0=1.0)
+        self.load_table(project.id)
+
+        task_ids = [pybossa.sched.new_task(project.id, 'weighted_random',
+                                           user_ip='10.0.0.%s' % i).id
+                    for i in range(50)]
+
+        assert task_ids.count(high.id) > task_ids.count(low.id), task_ids
+
+    @with_context
+    def test_weighted_random_skips_answered_tasks(self):
+        """Test SCHED weighted random does not return answered tasks"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=10,
+                                         priority_0=1.0)
+        AnonymousTaskRunFactory.create(project=project, task=tasks[0],
+                                       user_ip='10.0.0.1')
+        self.load_table(project.id)
+
+        for i in range(10):
+            task = pybossa.sched.get_weighted_random_task(project.id,
+                                                          user_ip='10.0.0.1')
+            assert task.id == tasks[1].id, task
+
+    @with_context
+    def test_weighted_random_skips_completed_tasks(self):
+        """Test SCHED weighted random does not return completed tasks"""
+        project = ProjectFactory.create(info=dict(sched='weighted_random'))
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=1)
+        self.load_table(project.id)
+        TaskRunFactory.create(project=project, task=tasks[0])
+
+        for i in range(10):
+            task = pybossa.sched.get_weighted_random_task(project.id,
+                                                          user_ip='10.0.0.1')
+            assert task.id == tasks[1].id, task
+
+    @with_context
+    @patch('pybossa.model.event_listeners.sched_queue')
+    def test_weighted_random_rebuilds_table_for_new_tasks(self, queue):
+        """Test SCHED weighted random rebuilds its table in a job when tasks
+        are added"""
+        from pybossa.jobs import rebuild_alias_table
+        project = ProjectFactory.create(info=dict(sched='weighted_random'))
+        TaskFactory.create(project=project)
+        self.load_table(project.id)
+
+        task = TaskFactory.create(project=project)
+        TaskFactory.create(project=project)
+
+        queue.enqueue.assert_called_once_with(rebuild_alias_table, project.id)
+        rebuild_alias_table(project.id)
+        task_ids = [pybossa.sched.get_weighted_random_task(
+                    project.id, user_ip='10.0.0.%s' % i).id for i in range(50)]
+        assert task.id in task_ids, task_ids
+
+    @with_context
+    @patch('pybossa.model.event_listeners.sched_queue')
+    def test_weighted_random_does_not_rebuild_for_rolled_back_tasks(self,
+                                                                    queue):
+        """Test SCHED weighted random only rebuilds its table for tasks that
+        are committed"""
+        from pybossa.core import db
+        project = ProjectFactory.create(info=dict(sched='weighted_random'))
+        TaskFactory.create(project=project)
+        self.load_table(project.id)
+
+        db.session.add(TaskFactory.build(project=project))
+        db.session.flush()
+        db.session.rollback()
+
+        assert not queue.enqueue.called
+
+    @with_context
+    @patch('pybossa.model.event_listeners.sched_queue')
+    def test_weighted_random_table_is_dropped_when_leaving(self, queue):
+        """Test SCHED weighted random table of a project is dropped, and not
+        rebuilt anymore, when it stops using the weighted random scheduler"""
+        from pybossa.core import sentinel
+        from pybossa.task_pool import PriorityAliasTable
+        project = ProjectFactory.create(info=dict(sched='weighted_random'))
+        TaskFactory.create(project=project)
+        self.load_table(project.id)
+
+        project.info = dict(sched='depth_first')
+        db.session.commit()
+        TaskFactory.create(project=project)
+
+        assert not PriorityAliasTable(sentinel.master).is_loaded(project.id)
+        assert not queue.enqueue.called
+
+    @with_context
+    @patch('pybossa.sched.sched_queue')
+    def test_weighted_random_falls_back_while_table_is_built(self, queue):
+        """Test SCHED weighted random serves depth first and schedules a
+        single job to build a table that is not loaded"""
+        from pybossa.core import sentinel
+        from pybossa.jobs import rebuild_alias_table
+        from pybossa.task_pool import PriorityAliasTable
+        project = ProjectFactory.create(info=dict(sched='weighted_random'))
+        tasks = TaskFactory.create_batch(2, project=project)
+        table = PriorityAliasTable(sentinel.master)
+
+        task = pybossa.sched.get_weighted_random_task(project.id)
+        pybossa.sched.get_weighted_random_task(project.id)
+
+        assert task.id == tasks[0].id, task
+        assert not table.is_loaded(project.id)
+        queue.enqueue.assert_called_once_with(rebuild_alias_table, project.id)
+
+    @with_context
+    def test_weighted_random_table_is_not_built_while_locked(self):
+        """Test SCHED weighted random table is built by a single job"""
+        from pybossa.core import sentinel
+        from pybossa.jobs import rebuild_alias_table
+        from pybossa.task_pool import PriorityAliasTable
+        project = ProjectFactory.create(info=dict(sched='weighted_random'))
+        TaskFactory.create(project=project)
+        table = PriorityAliasTable(sentinel.master)
+        table.lock(project.id)
+
+        assert not rebuild_alias_table(project.id)
+        assert not table.is_loaded(project.id)
+
+    @with_context
+    def test_weighted_random_returns_none_without_tasks(self):
+        """Test SCHED weighted random returns None if there are no tasks"""
+        project = ProjectFactory.create()
+
+        assert pybossa.sched.get_weighted_random_task(project.id) is None
+
+
+class TestSchedRegistry(Test):
+
+    def test_sched_variants_lists_every_scheduler(self):
+        """Test SCHED sched_variants lists all the built in schedulers"""
+        names = [name for name, description in pybossa.sched.sched_variants()]
+
+        assert sorted(names) == sorted(pybossa.sched.sched_map.keys()), names
+
+    @with_context
+    def test_register_scheduler(self):
+        """Test SCHED register_scheduler makes a new scheduler available"""
+        from pybossa.forms.forms import TaskSchedulerForm
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project)
+        last_task = lambda project_id, user_id, user_ip, offset, limit: [task]
+        try:
+            pybossa.sched.register_scheduler('last', 'Last', last_task)
+
+            assert ('last', 'Last') in pybossa.sched.sched_variants()
+            choices = TaskSchedulerForm.sched.kwargs['choices']
+            assert 'last' in [name for name, description in choices]
+            assert pybossa.sched.new_task(project.id, 'last') is task
+            cursor = pybossa.sched.encode_cursor(0, task.id)
+            assert pybossa.sched.new_task(project.id, 'last',
+                                          cursor=cursor) is task
+        finally:
+            pybossa.sched.sched_map.pop('last')
+            pybossa.sched._sched_variants.remove(('last', 'Last'))
+            TaskSchedulerForm.update_sched_options(
+                pybossa.sched.sched_variants())
+
+
+class TestLastAnswersSched(Test):
+
+    @with_context
+    def test_incremental_reads_last_answer_from_cache(self):
+        """Test SCHED incremental serves the last answer cached by the
+        task run listener"""
+        project = ProjectFactory.create(info=dict(sched='incremental'))
+        task = TaskFactory.create(project=project, n_answers=10)
+        AnonymousTaskRunFactory.create(project=project, task=task,
+                                       user_ip='10.0.0.1',
+                                       info={'answer': 'first'})
+        AnonymousTaskRunFactory.create(project=project, task=task,
+                                       user_ip='10.0.0.2',
+                                       info={'answer': 'second'})
+
+        with patch('pybossa.sched.session.execute') as execute:
+            answers = pybossa.sched.get_last_answers(project.id, [task.id])
+            assert not execute.called
+
+        assert answers == {task.id: {'answer': 'second'}}, answers
+
+    @with_context
+    def test_incremental_loads_missing_last_answer(self):
+        """Test SCHED incremental loads from the DB the answers missing in
+        the cache"""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=10)
+        AnonymousTaskRunFactory.create(project=project, task=task,
+                                       user_ip='10.0.0.1',
+                                       info={'answer': 'first'})
+        self.redis_flushall()
+
+        task = pybossa.sched.get_incremental_task(project.id,
+                                                  user_ip='10.0.0.2')
+
+        assert task.info['last_answer'] == {'answer': 'first'}, task.info
+
+    @with_context
+    def test_last_answer_is_not_cached_for_rolled_back_task_runs(self):
+        """Test SCHED incremental does not serve the answer of a task run
+        that is rolled back"""
+        project = ProjectFactory.create(info=dict(sched='incremental'))
+        task = TaskFactory.create(project=project, n_answers=10)
+        AnonymousTaskRunFactory.create(project=project, task=task,
+                                       user_ip='10.0.0.1',
+                                       info={'answer': 'first'})
+
+        db.session.add(AnonymousTaskRunFactory.build(
+            project=project, task=task, user_ip='10.0.0.2',
+            info={'answer': 'rolled back'}))
+        db.session.flush()
+        db.session.rollback()
+
+        answers = pybossa.sched.get_last_answers(project.id, [task.id])
+        assert answers == {task.id: {'answer': 'first'}}, answers
+
+    @with_context
+    def test_last_answer_is_only_cached_for_incremental(self):
+        """Test SCHED last answers are not cached for projects with other
+        schedulers"""
+        from pybossa.core import sentinel
+        project = ProjectFactory.create(info=dict(sched='depth_first'))
+        task = TaskFactory.create(project=project, n_answers=10)
+        AnonymousTaskRunFactory.create(project=project, task=task,
+                                       user_ip='10.0.0.1')
+
+        assert sentinel.master.keys('pybossa:last_answers:*') == []
+
+    @with_context
+    def test_last_answers_are_dropped_when_leaving_incremental(self):
+        """Test SCHED last answers of a project are dropped when it stops
+        using the incremental scheduler"""
+        from pybossa.core import sentinel
+        project = ProjectFactory.create(info=dict(sched='incremental'))
+        task = TaskFactory.create(project=project, n_answers=10)
+        AnonymousTaskRunFactory.create(project=project, task=task,
+                                       user_ip='10.0.0.1')
+
+        project.info['sched'] = 'depth_first'
+        db.session.commit()
+
+        assert sentinel.master.keys('pybossa:last_answers:*') == []
+
+
+class TestSchedCursor(Test):
+
+    @with_context
+    def test_depth_first_resumes_after_cursor(self):
+        """Test SCHED depth first resumes the scan after the cursor"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(15, project=project)
+        tasks[12].priority_0 = 1.0
+        db.session.commit()
+
+        first = pybossa.sched.new_task(project.id, 'depth_first')
+        cursor = pybossa.sched.task_cursor('depth_first', first)
+        second = pybossa.sched.new_task(project.id, 'depth_first',
+                                        cursor=cursor)
+
+        assert first.id == tasks[12].id, first
+        assert second.id == tasks[0].id, second
+
+    @with_context
+    def test_depth_first_cursor_reaches_every_task(self):
+        """Test SCHED depth first cursor goes past the candidates window"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(25, project=project)
+        served = []
+        cursor = None
+        task = pybossa.sched.new_task(project.id, 'default')
+        while task is not None:
+            served.append(task.id)
+            cursor = pybossa.sched.task_cursor('default', task)
+            task = pybossa.sched.new_task(project.id, 'default', cursor=cursor)
+
+        assert served == [t.id for t in tasks], served
+
+    @with_context
+    @patch.dict(flask_app.config, {'SCHED_TASK_POOL': True})
+    def test_depth_first_pool_resumes_after_cursor(self):
+        """Test SCHED depth first with task pool resumes after the cursor"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project)
+
+        cursor = pybossa.sched.task_cursor('default', tasks[0])
+        task = pybossa.sched.new_task(project.id, 'default', cursor=cursor)
+
+        assert task.id == tasks[1].id, task
+
+    @with_context
+    def test_breadth_first_resumes_after_cursor(self):
+        """Test SCHED breadth first resumes the scan after the cursor"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project, n_answers=10)
+        AnonymousTaskRunFactory.create(project=project, task=tasks[0],
+                                       user_ip='10.0.0.1')
+
+        cursor = pybossa.sched.task_cursor('breadth_first', tasks[2])
+        task = pybossa.sched.new_task(project.id, 'breadth_first',
+                                      user_ip='10.0.0.2', cursor=cursor)
+
+        assert task.id == tasks[0].id, task
+
+    @with_context
+    def test_newtask_api_sends_cursor(self):
+        """Test API newtask sends the cursor of the task and accepts it"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project)
+        url = 'api/project/%s/newtask' % project.id
+
+        res = self.app.get(url)
+        cursor = res.headers['X-Cursor']
+        res = self.app.get('%s?cursor=%s' % (url, cursor))
+        data = json.loads(res.data)
+
+        assert data['id'] == tasks[1].id, data
+
+    def test_decode_cursor_rejects_invalid_cursor(self):
+        """Test SCHED decode_cursor raises ValueError for invalid cursors"""
+        assert_raises(ValueError, pybossa.sched.decode_cursor, 'nope')
@@ -0,0 +1,217 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from redis import StrictRedis
+from pybossa.task_pool import TaskPool, AnswersPool, PriorityAliasTable
+
+
+class TestTaskPool(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.pool = TaskPool(self.connection)
+
+    def test_pool_is_not_loaded_by_default(self):
+        assert not self.pool.is_loaded(1)
+
+    def test_load_marks_the_pool_as_loaded(self):
+        self.pool.load(1, [])
+
+        assert self.pool.is_loaded(1)
+
+    def test_load_sorts_by_priority_desc_and_id_asc(self):
+        self.pool.load(1, [(3, 0.0), (12, 0.5), (2, 0.0), (20, 1.0)])
+
+        assert self.pool.task_ids(1) == [20, 12, 2, 3], self.pool.task_ids(1)
+
+    def test_load_replaces_previous_pool(self):
+        self.pool.load(1, [(1, 0.0), (2, 0.0)])
+        self.pool.load(1, [(3, 0.0)])
+
+        assert self.pool.task_ids(1) == [3], self.pool.task_ids(1)
+
+    def test_load_expires_pool(self):
+        self.pool.load(1, [(1, 0.0)])
+
+        assert self.connection.ttl('pybossa:task_pool:project:1') > 0
+        assert self.connection.ttl('pybossa:task_pool:project:1:loaded') > 0
+
+    def test_add_does_nothing_if_pool_is_not_loaded(self):
+        self.pool.add(1, 5, 0.0)
+
+        assert self.pool.size(1) == 0
+
+    def test_add_inserts_task_in_order(self):
+        self.pool.load(1, [(1, 0.0), (2, 0.0)])
+        self.pool.add(1, 3, 0.7)
+
+        assert self.pool.task_ids(1) == [3, 1, 2], self.pool.task_ids(1)
+
+    def test_add_updates_priority_of_existing_task(self):
+        self.pool.load(1, [(1, 0.0), (2, 0.0)])
+        self.pool.add(1, 2, 0.9)
+
+        assert self.pool.task_ids(1) == [2, 1], self.pool.task_ids(1)
+
+    def test_remove(self):
+        self.pool.load(1, [(1, 0.0), (2, 0.0)])
+        self.pool.remove(1, 1)
+
+        assert self.pool.task_ids(1) == [2], self.pool.task_ids(1)
+
+    def test_reset(self):
+        self.pool.load(1, [(1, 0.0)])
+        self.pool.reset(1)
+
+        assert not self.pool.is_loaded(1)
+        assert self.pool.size(1) == 0
+
+    def test_task_ids_returns_range(self):
+        self.pool.load(1, [(i, 0.0) for i in range(1, 11)])
+
+        assert self.pool.task_ids(1, 2, 4) == [3, 4, 5], self.pool.task_ids(1, 2, 4)
+
+    def test_pools_are_per_project(self):
+        self.pool.load(1, [(1, 0.0)])
+        self.pool.load(2, [(2, 0.0)])
+
+        assert self.pool.task_ids(1) == [1]
+        assert self.pool.task_ids(2) == [2]
+
+
+class TestAnswersPool(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.pool = AnswersPool(self.connection)
+
+    def test_load_sorts_by_number_of_task_runs_and_id(self):
+        self.pool.load(1, [(3, 2), (12, 0), (2, 2), (20, 1)])
+
+        assert self.pool.task_ids(1) == [12, 20, 2, 3], self.pool.task_ids(1)
+
+    def test_add_inserts_task_without_task_runs(self):
+        self.pool.load(1, [(1, 1)])
+        self.pool.add(1, 2)
+
+        assert self.pool.task_ids(1) == [2, 1], self.pool.task_ids(1)
+
+    def test_add_keeps_count_of_existing_task(self):
+        self.pool.load(1, [(1, 3), (2, 1)])
+        self.pool.add(1, 1)
+
+        assert self.pool.task_ids(1) == [2, 1], self.pool.task_ids(1)
+
+    def test_increment_moves_task_back(self):
+        self.pool.load(1, [(1, 0), (2, 0)])
+        self.pool.increment(1, 1)
+
+        assert self.pool.task_ids(1) == [2, 1], self.pool.task_ids(1)
+
+    def test_increment_does_not_add_removed_task(self):
+        self.pool.load(1, [(1, 0), (2, 0)])
+        self.pool.remove(1, 1)
+        self.pool.increment(1, 1)
+
+        assert self.pool.task_ids(1) == [2], self.pool.task_ids(1)
+
+    def test_does_not_share_keys_with_task_pool(self):
+        self.pool.load(1, [(1, 0)])
+
+        assert not TaskPool(self.connection).is_loaded(1)
+
+
+class TestPriorityAliasTable(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.table = PriorityAliasTable(self.connection)
+
+    def test_build_keeps_weights_proportions(self):
+        weights = [1.0, 3.0, 2.0, 2.0]
+        probs, aliases = self.table._build(weights)
+        n = len(weights)
+        mass = [0.0] * n
+        for i in range(n):
+            mass[i] += probs[i] / n
+            mass[aliases[i]] += (1 - probs[i]) / n
+
+        expected = [weight / sum(weights) for weight in weights]
+        for got, want in zip(mass, expected):
+            assert abs(got - want) < 1e-9, mass
+
+    def test_sample_empty_table(self):
+        self.table.load(1, [])
+
+        assert self.table.is_loaded(1)
+        assert self.table.sample(1, 10) == []
+
+    def test_sample_returns_distinct_task_ids(self):
+        self.table.load(1, [(1, 0.5), (2, 0.5), (3, 0.5)])
+
+        task_ids = self.table.sample(1, 100)
+
+        assert sorted(task_ids) == [1, 2, 3], task_ids
+
+    def test_sample_prefers_higher_priority(self):
+        self.table.load(1, [(1, 0.0), (2, 1.0)])
+
+        firsts = [self.table.sample(1, 1)[0] for i in range(200)]
+
+        assert firsts.count(2) > firsts.count(1) * 10, firsts.count(1)
+
+    def test_remove_skips_task(self):
+        self.table.load(1, [(i, 0.5) for i in range(1, 11)])
+        self.table.remove(1, 3)
+
+        assert 3 not in self.table.sample(1, 200)
+
+    def test_remove_resets_table_with_too_many_removed_tasks(self):
+        self.table.load(1, [(1, 0.5), (2, 0.5), (3, 0.5)])
+        self.table.remove(1, 1)
+
+        assert not self.table.is_loaded(1)
+
+    def test_remove_does_nothing_if_table_is_not_loaded(self):
+        self.table.remove(1, 1)
+
+        assert self.connection.keys('pybossa:task_alias:*') == []
+
+    def test_lock_is_taken_once(self):
+        assert self.table.lock(1)
+        assert not self.table.lock(1)
+        self.table.unlock(1)
+        assert self.table.lock(1)
+
+    def test_request_load_once(self):
+        assert self.table.request_load(1)
+        assert not self.table.request_load(1)
+        self.table.start_rebuild(1)
+        assert self.table.request_load(1)
+
+    def test_request_rebuild_once_per_loaded_table(self):
+        assert not self.table.request_rebuild(1)
+        self.table.load(1, [(1, 0.5)])
+
+        assert self.table.request_rebuild(1)
+        assert not self.table.request_rebuild(1)
+        self.table.start_rebuild(1)
+        assert self.table.request_rebuild(1)
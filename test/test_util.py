@@ -16,7 +16,9 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 import pybossa.util as util
-from mock import MagicMock
+from mock import MagicMock, patch
+from nose.tools import assert_raises
+from pybossa.cache.backends import MemoryBackend, WriteOnlyBackend
 from datetime import datetime, timedelta
 import calendar
 import time
@@ -256,13 +258,6 @@ class TestIsReservedName(object):
 
 class TestWithCacheDisabledDecorator(object):
 
-    def setUp(self):
-        os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '0'
-
-    def tearDown(self):
-        os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '1'
-
-
     def test_it_returns_same_as_original_function(self):
         def original_func(first_value, second_value='world'):
             return 'first_value' + second_value
@@ -275,37 +270,44 @@ class TestWithCacheDisabledDecorator(object):
         assert call_with_kwargs == original_func('Hello, ', second_value='there')
 
 
+    @patch('pybossa.cache.backend', new=MemoryBackend())
     def test_it_executes_function_with_cache_disabled(self):
+        import pybossa.cache as cache
         def original_func():
-            return os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
+            return cache.backend
 
         decorated_func = util.with_cache_disabled(original_func)
+        backend = decorated_func()
 
-        assert original_func() == '0', original_func()
-        assert decorated_func() == '1', decorated_func()
+        assert isinstance(backend, WriteOnlyBackend), backend
+        assert backend.backend is cache.backend, backend.backend
 
 
-    def test_it_executes_function_with_cache_disabled_triangulation(self):
+    @patch('pybossa.cache.backend', new=MemoryBackend())
+    def test_it_executes_function_without_reading_the_cache(self):
+        import pybossa.cache as cache
+        cache.backend.set('key', 'cached', 60)
         def original_func():
-            return os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
+            value = cache.backend.get('key')
+            cache.backend.set('key', 'computed', 60)
+            return value
 
-        del os.environ['PYBOSSA_REDIS_CACHE_DISABLED']
         decorated_func = util.with_cache_disabled(original_func)
 
-        assert original_func() == None, original_func()
-        assert decorated_func() == '1', decorated_func()
+        assert decorated_func() is None
+        assert cache.backend.get('key') == 'computed', cache.backend.get('key')
 
 
-    def test_it_leaves_environment_as_it_was_before(self):
+    def test_it_leaves_cache_backend_as_it_was_before(self):
+        import pybossa.cache as cache
         @util.with_cache_disabled
         def decorated_func():
-            return
+            raise ValueError
 
-        original_value = os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
-        decorated_func()
-        left_value = os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
+        original_backend = cache.backend
+        assert_raises(ValueError, decorated_func)
 
-        assert left_value == original_value, left_value
+        assert cache.backend is original_backend, cache.backend
 
 
 class TestUsernameFromFullnameFunction(object):
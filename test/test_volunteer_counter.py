@@ -0,0 +1,86 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from redis import StrictRedis
+from pybossa.volunteer_counter import (VolunteerCounter, REGISTERED,
+                                       ANONYMOUS, SITE, project_scope)
+
+
+class TestVolunteerCounter(object):
+
+    def setUp(self):
+        self.connection = StrictRedis()
+        self.connection.flushall()
+        self.counter = VolunteerCounter(self.connection)
+
+    def test_count_is_none_if_not_loaded(self):
+        self.counter.add(1, 10, None)
+
+        assert self.counter.count(project_scope(1), REGISTERED) is None
+
+    def test_load_counts_distinct_volunteers(self):
+        self.counter.load(project_scope(1), [1, 2, 3], ['127.0.0.1'])
+
+        assert self.counter.count(project_scope(1), REGISTERED) == 3
+        assert self.counter.count(project_scope(1), ANONYMOUS) == 1
+
+    def test_load_empty_scope(self):
+        self.counter.load(project_scope(1), [], [])
+
+        assert self.counter.count(project_scope(1), REGISTERED) == 0
+
+    def test_load_replaces_counters(self):
+        self.counter.load(project_scope(1), [1, 2, 3], [])
+        self.counter.load(project_scope(1), [1], [])
+
+        assert self.counter.count(project_scope(1), REGISTERED) == 1
+
+    def test_add_counts_volunteer_in_project_and_site(self):
+        self.counter.load(project_scope(1), [], [])
+        self.counter.load(SITE, [1], [])
+
+        self.counter.add(1, 1, None)
+        self.counter.add(1, 2, None)
+        self.counter.add(1, None, '127.0.0.1')
+        self.counter.add(1, None, '127.0.0.1')
+
+        assert self.counter.count(project_scope(1), REGISTERED) == 2
+        assert self.counter.count(project_scope(1), ANONYMOUS) == 1
+        assert self.counter.count(SITE, REGISTERED) == 2
+
+    def test_count_many(self):
+        self.counter.load(project_scope(1), [1, 2], [])
+        self.counter.load(project_scope(3), [1], [])
+
+        counts = self.counter.count_many([project_scope(i) for i in 1, 2, 3],
+                                         REGISTERED)
+
+        assert counts == [2, None, 1], counts
+
+    def test_count_is_approximate_within_error(self):
+        self.counter.load(SITE, range(10000), [])
+
+        count = self.counter.count(SITE, REGISTERED)
+
+        assert abs(count - 10000) < 10000 * 0.0081 * 3, count
+
+    def test_reset(self):
+        self.counter.load(project_scope(1), [1], [])
+        self.counter.reset(project_scope(1))
+
+        assert self.counter.count(project_scope(1), REGISTERED) is None
@@ -104,7 +104,7 @@ class TestWeb(web.Helper):
         assert user.name in res.data, res.data
 
     @with_context
-    @patch('pybossa.cache.project_stats.pygeoip', autospec=True)
+    @patch('pybossa.geolocation.pygeoip', autospec=True)
     def test_project_stats(self, mock1):
         """Test WEB project stats page works"""
         res = self.register()
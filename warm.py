@@ -24,14 +24,15 @@ import inspect
 
 #import pybossa.model as model
 from pybossa.core import create_app
+from pybossa.util import with_cache_disabled
 
 app = create_app()
 
 
+# Disable cache, so we can refresh the data in Redis
+@with_cache_disabled
 def warm_cache():
     '''Warm cache'''
-    # Disable cache, so we can refresh the data in Redis
-    os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = '1'
     # Cache 3 pages
     apps_cached = []
     pages = range(1, 4)